@@ -22,7 +22,7 @@ export default function AnalysisPage() {
 
   const fetchData = async () => {
     try {
-      const response = await fetch('/api/data', { cache: 'no-store' })
+      const response = await fetch('/api/data', { cache: 'no-cache' })
       if (!response.ok) throw new Error('Failed to fetch data')
       const jsonData = await response.json()
       setData(jsonData)
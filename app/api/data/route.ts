@@ -1,113 +1,183 @@
-import { NextResponse } from 'next/server'
+import { NextRequest, NextResponse } from 'next/server'
 import fs from 'fs'
 import path from 'path'
+import { gunzipSync } from 'zlib'
+import { Firestore } from 'firebase-admin/firestore'
 import { getAdminDb } from '@/lib/firebase-admin'
+import { mergeShards, readShardedDoc } from '@/lib/shardedDocs'
 
 export const dynamic = 'force-dynamic'
 export const revalidate = 0
 
-export async function GET() {
+// Ensure the containers that per-year docs are merged into exist
+function initPerYearContainers(data: any) {
+  data.revenue_trends = data.revenue_trends || {}
+  data.yearly_breakdown = data.yearly_breakdown || {}
+  data.monthly_breakdown = data.monthly_breakdown || {}
+  data.yearly_breakdown_by_class = data.yearly_breakdown_by_class || {}
+  data.monthly_breakdown_by_class = data.monthly_breakdown_by_class || {}
+  data.yearly_breakdown_combined = data.yearly_breakdown_combined || {}
+  data.monthly_breakdown_combined = data.monthly_breakdown_combined || {}
+  data.payment_status_by_month = data.payment_status_by_month || {}
+}
+
+// Merge one per-year dashboard doc into the response shape
+function mergePerYearDoc(data: any, year: string, v: any) {
+  // Merge revenue trends entries
+  if (v.revenue_trends) {
+    Object.entries(v.revenue_trends).forEach(([k, val]) => {
+      ;(data.revenue_trends as any)[k] = val
+    })
+  }
+  // Year-scoped structures
+  if (v.yearly_breakdown) data.yearly_breakdown[year] = v.yearly_breakdown
+  if (v.monthly_breakdown) data.monthly_breakdown[year] = v.monthly_breakdown
+  if (v.yearly_breakdown_by_class) data.yearly_breakdown_by_class[year] = v.yearly_breakdown_by_class
+  if (v.monthly_breakdown_by_class) data.monthly_breakdown_by_class[year] = v.monthly_breakdown_by_class
+  if (v.yearly_breakdown_combined) data.yearly_breakdown_combined[year] = v.yearly_breakdown_combined
+  if (v.monthly_breakdown_combined) data.monthly_breakdown_combined[year] = v.monthly_breakdown_combined
+  if (v.payment_status_by_month) data.payment_status_by_month[year] = v.payment_status_by_month
+}
+
+// Booking records of a per-month doc: either a plain `bookings` list or the columnar
+// layout (field names once; dictionary codes or sparse non-zero entries per column)
+function decodeMonthlyBookings(v: any): any[] {
+  if (v.encoding !== 'columnar') return v.bookings || []
+  const rows: number = v.rows || 0
+  const fields: string[] = v.fields || []
+  const columns: any[][] = (v.columns || []).map((column: any) => {
+    if (column.codes) return column.codes.map((code: number) => column.dictionary[code])
+    if (column.index) {
+      const values = new Array(rows).fill(column.default)
+      column.index.forEach((row: number, i: number) => { values[row] = column.values[i] })
+      return values
+    }
+    return column.values
+  })
+  const records: any[] = []
+  for (let row = 0; row < rows; row++) {
+    const record: any = {}
+    fields.forEach((field, i) => { record[field] = columns[i][row] })
+    records.push(record)
+  }
+  return records
+}
+
+// Add one per-month bookings doc to the { year: { month: bookings } } map
+function addMonthlyBookingsDoc(monthlyBookings: any, v: any) {
+  const year = (v.year ?? '').toString()
+  // Normalize month to integer string (handle both number and string, float and int)
+  let month = v.month
+  if (typeof month === 'number') {
+    month = String(Math.floor(month))  // Convert float to int string
+  } else {
+    month = String(parseInt(month || '0'))  // Parse string to int, then to string
+  }
+  if (!year || !month || month === '0' || month === 'NaN') return
+  if (!monthlyBookings[year]) monthlyBookings[year] = {}
+  monthlyBookings[year][month] = decodeMonthlyBookings(v)
+}
+
+// Assembled response for the live dashboard version. Versions are immutable once the
+// pointer references them, so the body is reused until the pointer moves.
+let versionCache: { runId: string; body: string } | null = null
+
+// Gzipped dashboard bundle for the live ETag, reused until the pointer's bundle changes
+let bundleCache: { etag: string; compressed: Buffer } | null = null
+
+async function loadDashboardBundle(db: Firestore, bundle: { etag: string; parts: string[] }): Promise<Buffer | null> {
+  if (bundleCache?.etag === bundle.etag) {
+    return bundleCache.compressed
+  }
+  const snaps = await db.getAll(...bundle.parts.map(partPath => db.doc(partPath)))
+  if (snaps.some(snap => !snap.exists)) return null
+  const compressed = Buffer.concat(snaps.map(snap => Buffer.from(snap.data()?.data)))
+  bundleCache = { etag: bundle.etag, compressed }
+  return compressed
+}
+
+async function loadDashboardVersion(db: Firestore, runId: string): Promise<string | null> {
+  if (versionCache?.runId === runId) {
+    return versionCache.body
+  }
+  const manifest: any = await readShardedDoc(db, `dashboard_versions/${runId}`)
+  if (!manifest) return null
+
+  const data: any = { ...(manifest.main || {}) }
+  initPerYearContainers(data)
+
+  const yearEntries = Object.entries(manifest.documents?.by_year || {}) as [string, any][]
+  const monthlyEntries = Object.entries(manifest.documents?.monthly_bookings || {}) as [string, any][]
+  const entries = [...yearEntries, ...monthlyEntries]
+  const snaps = entries.length > 0 ? await db.getAll(...entries.map(([, entry]) => db.doc(entry.path))) : []
+  // Oversized documents keep their large fields in shard docs next to the head
+  const docs = await Promise.all(snaps.map((snap, i) => mergeShards(db, entries[i][1].path, snap.data() || {})))
+
+  yearEntries.forEach(([year], i) => mergePerYearDoc(data, year, docs[i]))
+  const monthlyBookings: any = {}
+  monthlyEntries.forEach((_, i) => addMonthlyBookingsDoc(monthlyBookings, docs[yearEntries.length + i]))
+  data.monthly_bookings = monthlyBookings
+  data.version = runId
+  console.log(`Loaded dashboard version ${runId}: ${yearEntries.length} per-year docs, ${monthlyEntries.length} monthly docs`)
+
+  const body = JSON.stringify(data)
+  versionCache = { runId, body }
+  return body
+}
+
+export async function GET(request: NextRequest) {
   try {
     // Try to get data from Firestore first
     try {
       const db = getAdminDb()
-      const docRef = db.doc('dashboard/data')
-      const docSnap = await docRef.get()
-      
-      console.log('Checking dashboard/data document...')
-      console.log('Document exists:', docSnap.exists)
-      
-      if (docSnap.exists) {
-        console.log('Document found, reading data...')
-        const data: any = docSnap.data()
-        console.log('Document data keys:', Object.keys(data || {}))
-        console.log('Has summary:', !!data?.summary)
-        // Ensure containers exist before merge
-        data.revenue_trends = data.revenue_trends || {}
-        data.yearly_breakdown = data.yearly_breakdown || {}
-        data.monthly_breakdown = data.monthly_breakdown || {}
-        data.yearly_breakdown_by_class = data.yearly_breakdown_by_class || {}
-        data.monthly_breakdown_by_class = data.monthly_breakdown_by_class || {}
-        data.yearly_breakdown_combined = data.yearly_breakdown_combined || {}
-        data.monthly_breakdown_combined = data.monthly_breakdown_combined || {}
-        
-        // Fetch per-year dashboard data docs and merge into a single response shape
-        try {
-          const perYearCol = db.collection('dashboard_data_by_year')
-          const perYearSnap = await perYearCol.get()
-          perYearSnap.docs.forEach(d => {
-            const year = d.id
-            const v: any = d.data() || {}
-            // Merge revenue trends entries
-            if (v.revenue_trends) {
-              Object.entries(v.revenue_trends).forEach(([k, val]) => {
-                ;(data.revenue_trends as any)[k] = val
-              })
-            }
-            // Year-scoped structures
-            if (v.yearly_breakdown) data.yearly_breakdown[year] = v.yearly_breakdown
-            if (v.monthly_breakdown) data.monthly_breakdown[year] = v.monthly_breakdown
-            if (v.yearly_breakdown_by_class) data.yearly_breakdown_by_class[year] = v.yearly_breakdown_by_class
-            if (v.monthly_breakdown_by_class) data.monthly_breakdown_by_class[year] = v.monthly_breakdown_by_class
-            if (v.yearly_breakdown_combined) data.yearly_breakdown_combined[year] = v.yearly_breakdown_combined
-            if (v.monthly_breakdown_combined) data.monthly_breakdown_combined[year] = v.monthly_breakdown_combined
-          })
-          console.log(`Merged ${perYearSnap.docs.length} per-year dashboard documents`)
-        } catch (perYearErr) {
-          console.log('Error fetching per-year dashboard data:', perYearErr)
+
+      // Published versions: resolve the live run through the pointer doc
+      const pointerSnap = await db.doc('dashboard/current').get()
+      const runId = pointerSnap.exists ? pointerSnap.data()?.run_id : null
+      const bundle = pointerSnap.exists ? pointerSnap.data()?.bundle : null
+
+      // Pre-built bundle: answer from the pointer's ETag alone when the client is current
+      if (runId && bundle?.etag && Array.isArray(bundle.parts) && bundle.parts.length > 0) {
+        const etag = `"${bundle.etag}"`
+        const headers: Record<string, string> = {
+          'Content-Type': 'application/json',
+          'Cache-Control': 'private, no-cache',
+          ETag: etag,
+          Vary: 'Accept-Encoding',
+          'X-Dashboard-Version': runId
+        }
+        if (request.headers.get('if-none-match') === etag) {
+          return new NextResponse(null, { status: 304, headers })
+        }
+        const compressed = await loadDashboardBundle(db, bundle)
+        if (compressed) {
+          if (/\bgzip\b/.test(request.headers.get('accept-encoding') || '')) {
+            return new NextResponse(new Uint8Array(compressed), { status: 200, headers: { ...headers, 'Content-Encoding': 'gzip' } })
+          }
+          return new NextResponse(new Uint8Array(gunzipSync(compressed)), { status: 200, headers })
         }
+        console.log(`Dashboard bundle ${bundle.etag} incomplete - assembling version ${runId} from its documents`)
+      }
 
-        // Fetch monthly_bookings from per-month collection
-        try {
-          const monthlyCol = db.collection('dashboard_monthly_bookings')
-          const monthlySnap = await monthlyCol.get()
-          const monthlyBookings: any = {}
-          monthlySnap.docs.forEach(d => {
-            const v: any = d.data() || {}
-            const year = (v.year ?? '').toString()
-            // Normalize month to integer string (handle both number and string, float and int)
-            let month = v.month
-            if (typeof month === 'number') {
-              month = String(Math.floor(month))  // Convert float to int string
-            } else {
-              month = String(parseInt(month || '0'))  // Parse string to int, then to string
-            }
-            if (!year || !month || month === '0' || month === 'NaN') return
-            if (!monthlyBookings[year]) monthlyBookings[year] = {}
-            monthlyBookings[year][month] = v.bookings || []
+      if (runId) {
+        const body = await loadDashboardVersion(db, runId)
+        if (body) {
+          return new NextResponse(body, {
+            status: 200,
+            headers: { 'Content-Type': 'application/json', 'Cache-Control': 'no-store', 'X-Dashboard-Version': runId }
           })
-          data.monthly_bookings = monthlyBookings
-          console.log(`Monthly bookings fetched: ${monthlySnap.docs.length} docs`)
-        } catch (monthlyErr) {
-          console.log('Error fetching per-month monthly_bookings:', monthlyErr)
         }
-        
-        console.log('Data fetched from Firestore successfully')
-        console.log('Data keys:', Object.keys(data))
-        return new NextResponse(JSON.stringify(data), {
-          status: 200,
+        // The version collector never deletes the live version, so this needs a re-upload
+        console.error(`Dashboard version ${runId} not found`)
+        return new NextResponse(JSON.stringify({
+          error: 'Data structure incomplete. Live dashboard version missing.',
+          details: `dashboard/current names version ${runId}, which does not exist. Please re-upload data.`
+        }), {
+          status: 500,
           headers: { 'Content-Type': 'application/json', 'Cache-Control': 'no-store' }
         })
-      } else {
-        console.log('dashboard/data document does not exist - checking for per-year documents...')
-        // Check if we have per-year documents even if main doc doesn't exist
-        try {
-          const perYearCol = db.collection('dashboard_data_by_year')
-          const perYearSnap = await perYearCol.get()
-          if (perYearSnap.docs.length > 0) {
-            console.log(`Found ${perYearSnap.docs.length} per-year documents but no main document`)
-            return new NextResponse(JSON.stringify({ 
-              error: 'Data structure incomplete. Main dashboard document missing.',
-              details: 'Per-year documents exist but main document is missing. Please re-upload data.'
-            }), {
-              status: 500,
-              headers: { 'Content-Type': 'application/json', 'Cache-Control': 'no-store' }
-            })
-          }
-        } catch (checkError) {
-          console.error('Error checking per-year documents:', checkError)
-        }
       }
+      console.log('No published dashboard version (dashboard/current) - checking for a local data file')
     } catch (firestoreError: any) {
       console.error('Error accessing Firestore:', firestoreError)
       console.error('Error message:', firestoreError?.message)
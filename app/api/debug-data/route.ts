@@ -1,5 +1,6 @@
 import { NextResponse } from 'next/server'
 import { getAdminDb } from '@/lib/firebase-admin'
+import { readShardedDoc } from '@/lib/shardedDocs'
 
 export const dynamic = 'force-dynamic'
 export const revalidate = 0
@@ -7,29 +8,37 @@ export const revalidate = 0
 export async function GET() {
   try {
     const db = getAdminDb()
-    
+
     // Check main dashboard document
     const mainDoc = await db.doc('dashboard/data').get()
     const mainData = mainDoc.exists ? mainDoc.data() : null
-    
+
+    // Check the live version the pointer names
+    const pointerDoc = await db.doc('dashboard/current').get()
+    const pointer = pointerDoc.exists ? pointerDoc.data() : null
+    const manifest: any = pointer?.run_id ? await readShardedDoc(db, `dashboard_versions/${pointer.run_id}`) : null
+
     // Check per-year documents
-    const perYearCol = db.collection('dashboard_data_by_year')
-    const perYearSnap = await perYearCol.get()
-    const perYearDocs = perYearSnap.docs.map(d => ({
-      id: d.id,
-      exists: true,
-      keys: Object.keys(d.data() || {})
+    const perYearEntries = Object.entries(manifest?.documents?.by_year || {}) as [string, any][]
+    const perYearSnaps = perYearEntries.length > 0 ? await db.getAll(...perYearEntries.map(([, entry]) => db.doc(entry.path))) : []
+    const perYearDocs = perYearSnaps.map((snap, i) => ({
+      id: perYearEntries[i][0],
+      path: perYearEntries[i][1].path,
+      exists: snap.exists,
+      keys: Object.keys(snap.data() || {})
     }))
-    
-    // Check monthly bookings
-    const monthlyCol = db.collection('dashboard_monthly_bookings')
-    const monthlySnap = await monthlyCol.get()
-    const monthlyDocs = monthlySnap.docs.map(d => ({
-      id: d.id,
-      exists: true,
-      keys: Object.keys(d.data() || {})
+
+    // Check monthly bookings (first 5 only)
+    const monthlyEntries = Object.entries(manifest?.documents?.monthly_bookings || {}) as [string, any][]
+    const monthlySample = monthlyEntries.slice(0, 5)
+    const monthlySnaps = monthlySample.length > 0 ? await db.getAll(...monthlySample.map(([, entry]) => db.doc(entry.path))) : []
+    const monthlyDocs = monthlySnaps.map((snap, i) => ({
+      id: monthlySample[i][0],
+      path: monthlySample[i][1].path,
+      exists: snap.exists,
+      keys: Object.keys(snap.data() || {})
     }))
-    
+
     return NextResponse.json({
       main_document: {
         exists: mainDoc.exists,
@@ -37,13 +46,19 @@ export async function GET() {
         has_summary: !!mainData?.summary,
         summary: mainData?.summary || null
       },
+      live_version: {
+        run_id: pointer?.run_id || null,
+        updated_at: pointer?.updated_at || null,
+        manifest_exists: !!manifest,
+        bundle_etag: pointer?.bundle?.etag || null
+      },
       per_year_documents: {
-        count: perYearDocs.length,
+        count: perYearEntries.length,
         docs: perYearDocs
       },
       monthly_bookings_documents: {
-        count: monthlyDocs.length,
-        docs: monthlyDocs.slice(0, 5) // First 5 only
+        count: monthlyEntries.length,
+        docs: monthlyDocs
       }
     })
   } catch (error: any) {
@@ -54,4 +69,3 @@ export async function GET() {
     }, { status: 500 })
   }
 }
-
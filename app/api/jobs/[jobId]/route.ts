@@ -0,0 +1,25 @@
+import { NextRequest, NextResponse } from 'next/server'
+import { getAdminDb } from '@/lib/firebase-admin'
+
+export const dynamic = 'force-dynamic'
+export const revalidate = 0
+
+// Progress of an async processing job queued by the Cloud Functions (jobs/{jobId})
+export async function GET(
+  _req: NextRequest,
+  { params }: { params: { jobId: string } }
+) {
+  const { jobId } = params
+  try {
+    const db = getAdminDb()
+    const snap = await db.doc(`jobs/${jobId}`).get()
+    if (!snap.exists) {
+      return NextResponse.json({ error: 'Job not found' }, { status: 404, headers: { 'Cache-Control': 'no-store' } })
+    }
+    const { input_fingerprint, ...job } = snap.data() || {}
+    return NextResponse.json({ job_id: jobId, ...job }, { headers: { 'Cache-Control': 'no-store' } })
+  } catch (error: any) {
+    console.error('Error reading job status:', error)
+    return NextResponse.json({ error: 'Failed to read job status', details: error?.message }, { status: 500 })
+  }
+}
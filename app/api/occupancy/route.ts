@@ -2,6 +2,7 @@ import { NextResponse } from 'next/server'
 import fs from 'fs'
 import path from 'path'
 import { getAdminDb } from '@/lib/firebase-admin'
+import { readShardedDoc } from '@/lib/shardedDocs'
 
 export const dynamic = 'force-dynamic'
 export const revalidate = 0
@@ -11,11 +12,9 @@ export async function GET() {
     // Try to get data from Firestore first
     try {
       const db = getAdminDb()
-      const docRef = db.doc('occupancy/data')
-      const docSnap = await docRef.get()
+      const data: any = await readShardedDoc(db, 'occupancy/data')
       
-      if (docSnap.exists) {
-        const data: any = docSnap.data()
+      if (data) {
         console.log('Occupancy data fetched from Firestore')
         return new NextResponse(JSON.stringify(data), {
           status: 200,
@@ -549,7 +549,8 @@ export async function POST(request: NextRequest) {
     const csvContent = convertBookingsToCSV(bookings)
     
     // Call the Cloud Function
-    const cloudFunctionUrl = 'https://us-central1-dashboard-baines.cloudfunctions.net/process_booking_data'
+    // Only the summary is used here; the function persists the processed data itself
+    const cloudFunctionUrl = 'https://us-central1-dashboard-baines.cloudfunctions.net/process_booking_data?response=summary'
     
     const response = await fetch(cloudFunctionUrl, {
       method: 'POST',
@@ -32,8 +32,11 @@ export async function POST(request: NextRequest) {
       
       // Call the Cloud Function with the CSV content
       const cloudFunctionUrl = 'https://us-central1-dashboard-baines.cloudfunctions.net/process_occupancy_report'
+      // CLOUD_FUNCTION_ASYNC=true queues the upload as a background job (202 + job id);
+      // otherwise only the summary and storage result come back
+      const asyncMode = process.env.CLOUD_FUNCTION_ASYNC === 'true'
       
-      const response = await fetch(cloudFunctionUrl, {
+      const response = await fetch(`${cloudFunctionUrl}?${asyncMode ? 'mode=async' : 'response=summary'}`, {
         method: 'POST',
         headers: {
           'Content-Type': 'text/csv',
@@ -47,13 +50,38 @@ export async function POST(request: NextRequest) {
         throw new Error(`Cloud Function failed: ${response.status} ${errorText}`)
       }
       
+      if (response.status === 202) {
+        const job = await response.json()
+        console.log('Occupancy upload queued as job:', job.job_id)
+        return NextResponse.json({
+          message: 'Occupancy report uploaded; processing continues in the background',
+          ...job,
+          status_url: `/api/jobs/${job.job_id}`
+        }, { status: 202 })
+      }
+      
       const result = await response.json()
       console.log('Cloud Function processing completed:', result.message)
+
+      if (result.superseded) {
+        console.warn('Upload superseded by a newer run:', result.storage?.superseded_by)
+        return NextResponse.json({
+          error: 'Upload superseded',
+          details: 'A newer upload of the same data arrived while this one was processing, so this one was not saved.',
+          superseded_by: result.storage?.superseded_by
+        }, { status: 409 })
+      }
       console.log('Has occupancy_data:', !!result.occupancy_data)
 
       // Store processed occupancy data in Firestore
       try {
-        if (result.occupancy_data) {
+        if (result.storage) {
+          // The Cloud Function already wrote occupancy/data (sharded when oversized);
+          // only record which file it came from
+          const db = getAdminDb()
+          await db.doc('occupancy/data').set({ filename: file.name }, { merge: true })
+          console.log('✓ Occupancy data persisted by the Cloud Function:', JSON.stringify(result.storage))
+        } else if (result.occupancy_data) {
           console.log('Storing occupancy data to Firestore...')
           
           // Use Admin SDK to store occupancy data in Firestore
@@ -81,7 +109,9 @@ export async function POST(request: NextRequest) {
         timestamp: result.timestamp || new Date().toISOString()
       }
 
-      if (!result.occupancy_data) {
+      if (result.unchanged) {
+        response_data.unchanged = true
+      } else if (!result.occupancy_data && !result.storage) {
         response_data.warning = 'Occupancy data not found in Cloud Function response'
         console.error('⚠️ Occupancy data missing from Cloud Function response')
       }
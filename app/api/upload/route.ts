@@ -6,145 +6,6 @@ import { getAdminDb } from '@/lib/firebase-admin'
 export const dynamic = 'force-dynamic'
 export const revalidate = 0
 
-type WeeklyBookingRecord = {
-  ref: string
-  name: string
-  status: string
-  bookingClass: string
-  arrivalDate: string
-  totalExclVat: number
-  agent: string
-  source: string
-}
-
-type WeeklyReportResult = {
-  updates: Array<WeeklyBookingRecord & { category: string }>
-  dropOff: Array<WeeklyBookingRecord & { previousStatus: string }>
-}
-
-function getIsoWeekKey(date: Date): string {
-  const d = new Date(Date.UTC(date.getUTCFullYear(), date.getUTCMonth(), date.getUTCDate()))
-  const dayNum = d.getUTCDay() || 7
-  d.setUTCDate(d.getUTCDate() + 4 - dayNum)
-  const yearStart = new Date(Date.UTC(d.getUTCFullYear(), 0, 1))
-  const weekNo = Math.ceil((((d.getTime() - yearStart.getTime()) / 86400000) + 1) / 7)
-  return `${d.getUTCFullYear()}-W${String(weekNo).padStart(2, '0')}`
-}
-
-function parseDateToIsoDate(value: any): string {
-  if (!value) return ''
-  const date = new Date(value)
-  if (Number.isNaN(date.getTime())) return ''
-  return date.toISOString().split('T')[0]
-}
-
-function toWeeklyBookingRecord(raw: any): WeeklyBookingRecord | null {
-  const ref = String(raw?.['Reservation #'] ?? raw?.reservation_number ?? '').trim()
-  if (!ref) return null
-  return {
-    ref,
-    name: String(raw?.['Reservation name'] ?? raw?.name ?? '').trim(),
-    status: String(raw?.Status ?? raw?.status ?? 'Unknown').trim() || 'Unknown',
-    bookingClass: String(raw?.['Booking Class'] ?? raw?.booking_class ?? '').trim(),
-    arrivalDate: parseDateToIsoDate(raw?.['Arrival date'] ?? raw?.arrival_date),
-    totalExclVat: parseFloat(String(raw?.['Revenue Total'] ?? raw?.revenue_total ?? 0)) || 0,
-    agent: String(raw?.Agent ?? raw?.agent ?? '').trim(),
-    source: String(raw?.Source ?? raw?.source ?? '').trim()
-  }
-}
-
-function extractWeeklyBookingsFromMonthly(monthlyBookings: any): WeeklyBookingRecord[] {
-  if (!monthlyBookings || typeof monthlyBookings !== 'object') return []
-  const out: WeeklyBookingRecord[] = []
-  Object.values(monthlyBookings).forEach((months: any) => {
-    if (!months || typeof months !== 'object') return
-    Object.values(months).forEach((bookings: any) => {
-      if (!Array.isArray(bookings)) return
-      bookings.forEach((b: any) => {
-        const row = toWeeklyBookingRecord(b)
-        if (row) out.push(row)
-      })
-    })
-  })
-  return out
-}
-
-function buildWeeklyReport(current: WeeklyBookingRecord[], baseline: WeeklyBookingRecord[]): WeeklyReportResult {
-  const baselineByRef = new Map<string, WeeklyBookingRecord>()
-  baseline.forEach(b => baselineByRef.set(b.ref, b))
-  const currentRefs = new Set(current.map(c => c.ref))
-
-  const updates: Array<WeeklyBookingRecord & { category: string }> = []
-  current.forEach(row => {
-    const prev = baselineByRef.get(row.ref)
-    if (!prev && row.status === 'Confirmed') {
-      updates.push({ ...row, category: 'New Confirmed Sales' })
-      return
-    }
-    if (!prev && row.status === 'Provisional') {
-      updates.push({ ...row, category: 'New Provisional Sales' })
-      return
-    }
-    if (prev && prev.status === 'Provisional' && row.status === 'Confirmed') {
-      updates.push({ ...row, category: 'Moved Provisional to Confirmed' })
-    }
-  })
-
-  const dropOff: Array<WeeklyBookingRecord & { previousStatus: string }> = []
-  baseline.forEach(row => {
-    if (row.status !== 'Provisional') return
-    if (currentRefs.has(row.ref)) return
-    dropOff.push({ ...row, previousStatus: row.status })
-  })
-
-  return { updates, dropOff }
-}
-
-async function loadLatestFinalSnapshot(db: any, excludeWeekKey: string): Promise<{ weekKey: string; bookings: WeeklyBookingRecord[] } | null> {
-  const snap = await db.collection('weekly_sales_snapshots')
-    .orderBy('snapshot_at', 'desc')
-    .limit(10)
-    .get()
-
-  for (const doc of snap.docs) {
-    if (doc.id === excludeWeekKey) continue
-    const data = doc.data() || {}
-    if (!data.is_final) continue
-    const bookingsSnap = await db.collection(`weekly_sales_snapshots/${doc.id}/bookings`).get()
-    const bookings = bookingsSnap.docs.map((d: any) => d.data() as WeeklyBookingRecord)
-    return { weekKey: doc.id, bookings }
-  }
-  return null
-}
-
-async function overwriteSnapshotBookings(db: any, weekKey: string, bookings: WeeklyBookingRecord[], nowIso: string) {
-  const snapshotDoc = db.doc(`weekly_sales_snapshots/${weekKey}`)
-  await snapshotDoc.set({
-    week_key: weekKey,
-    snapshot_at: nowIso,
-    is_final: true,
-    booking_count: bookings.length
-  }, { merge: true })
-
-  const existing = await db.collection(`weekly_sales_snapshots/${weekKey}/bookings`).get()
-  const deleteBatch = db.batch()
-  existing.docs.forEach((doc: any) => deleteBatch.delete(doc.ref))
-  if (existing.docs.length > 0) {
-    await deleteBatch.commit()
-  }
-
-  const chunkSize = 400
-  for (let i = 0; i < bookings.length; i += chunkSize) {
-    const batch = db.batch()
-    bookings.slice(i, i + chunkSize).forEach((row, idx) => {
-      const safeRef = (row.ref || `row-${i + idx}`).replace(/[\/#?\[\]]/g, '_')
-      const docId = `${safeRef}-${row.arrivalDate || 'no-date'}-${idx}`
-      batch.set(db.doc(`weekly_sales_snapshots/${weekKey}/bookings/${docId}`), row)
-    })
-    await batch.commit()
-  }
-}
-
 // CSV processing functions
 function parseCSV(csvText: string) {
   const lines = csvText.split('\n')
@@ -697,6 +558,13 @@ export async function POST(request: NextRequest) {
         'https://process-booking-data-q7elpl326q-uc.a.run.app', // 2nd gen direct URL
         'https://us-central1-dashboard-baines.cloudfunctions.net/process_booking_data' // Standard format
       ].filter(Boolean) as string[]
+
+      // CLOUD_FUNCTION_ASYNC=true queues the upload as a background job (202 + job id)
+      // instead of processing it within this request. Either way the Cloud Function checks
+      // the booking count against the live dataset, publishes the dashboard, stores the raw
+      // upload and builds the weekly sales report, so only its summary is needed here.
+      const asyncMode = process.env.CLOUD_FUNCTION_ASYNC === 'true'
+      const query = `${asyncMode ? '?mode=async' : '?response=summary'}&filename=${encodeURIComponent(file.name)}`
       
       let response: Response | null = null
       let lastError: Error | null = null
@@ -704,7 +572,7 @@ export async function POST(request: NextRequest) {
       for (const url of cloudFunctionUrls) {
         try {
           console.log('Trying Cloud Function URL:', url)
-          response = await fetch(url, {
+          response = await fetch(`${url}${query}`, {
             method: 'POST',
             headers: {
               'Content-Type': 'text/csv',
@@ -712,7 +580,8 @@ export async function POST(request: NextRequest) {
             body: csvText
           })
           
-          if (response.ok) {
+          if (response.ok || response.status === 400) {
+            // A 400 rejects the upload itself (bad CSV or failed booking check); another URL would too
             console.log('✓ Successfully called Cloud Function at:', url)
             break
           } else {
@@ -728,278 +597,76 @@ export async function POST(request: NextRequest) {
         }
       }
       
+      if (response?.status === 400) {
+        const rejection = await response.json()
+        console.error(rejection.error, rejection.details)
+        return NextResponse.json(rejection, { status: 400 })
+      }
+
       if (!response || !response.ok) {
         const errorText = response ? await response.text() : 'No response'
         console.error('All Cloud Function URLs failed. Last error:', lastError?.message)
         throw new Error(`Cloud Function failed: ${response?.status || 'No response'} ${errorText}`)
       }
+
+      if (response.status === 202) {
+        const job = await response.json()
+        console.log('Upload queued as job:', job.job_id)
+        // The job checks the booking count, stores the raw upload and builds the weekly
+        // report like a synchronous upload; a rejected upload ends with status 'rejected'
+        // and the error and details a synchronous upload would have returned
+        return NextResponse.json({
+          message: 'File uploaded; processing continues in the background',
+          ...job,
+          status_url: `/api/jobs/${job.job_id}`
+        }, { status: 202 })
+      }
       
       const result = await response.json()
       console.log('Cloud Function processing completed:', result.message)
-      console.log('Result keys:', Object.keys(result))
-      console.log('Has dashboard_data:', !!result.dashboard_data)
-      console.log('Full result structure:', JSON.stringify(result, null, 2).substring(0, 1000))
-
-      const newTotalBookings =
-        result?.summary?.total_bookings ??
-        result.dashboard_data?.summary?.total_bookings ??
-        0
-      console.log('New dataset total bookings:', newTotalBookings)
-
-      const MIN_BOOKING_RATIO = 0.8
-      let previousTotalBookings = 0
-      try {
-        const db = getAdminDb()
-        const existingDashboardDoc = await db.doc('dashboard/data').get()
-        if (existingDashboardDoc.exists) {
-          const existingSummary = existingDashboardDoc.data()?.summary as {
-            total_bookings?: number
-          } | undefined
-          previousTotalBookings = existingSummary?.total_bookings ?? 0
-        }
-      } catch (docError) {
-        console.warn('Unable to read existing dashboard summary:', docError)
-      }
 
-      if (newTotalBookings === 0) {
-        console.error('Upload rejected: processed dataset has zero bookings')
+      if (result.superseded) {
+        console.warn('Upload superseded by a newer run:', result.storage?.superseded_by)
         return NextResponse.json({
-          error: 'Upload rejected: processed dataset has zero bookings',
-          details: 'Please upload a full export from Opera/ResRequest instead of a filtered weekly file.'
-        }, { status: 400 })
-      }
-
-      if (previousTotalBookings > 0) {
-        const ratio = newTotalBookings / previousTotalBookings
-        if (ratio < MIN_BOOKING_RATIO) {
-          console.error(
-            `Upload rejected: existing dataset has ${previousTotalBookings} bookings, new upload has ${newTotalBookings}`
-          )
-          return NextResponse.json({
-            error: 'Upload rejected: dataset appears incomplete',
-            details: `Existing dataset contains ${previousTotalBookings} bookings but the upload only includes ${newTotalBookings}. Please upload a complete export so historical data is preserved.`
-          }, { status: 400 })
-        }
+          error: 'Upload superseded',
+          details: 'A newer upload of the same data arrived while this one was processing, so this one was not saved.',
+          superseded_by: result.storage?.superseded_by
+        }, { status: 409 })
       }
+      console.log('Result keys:', Object.keys(result))
+      console.log('Full result structure:', JSON.stringify(result, null, 2).substring(0, 1000))
 
-      // Store raw data and processed data in Firestore
+      // The Cloud Function publishes the dashboard itself as a new version
+      // (dashboard_versions/{run_id}, live through dashboard/current) and reports it under `storage`
       try {
-        // Store raw CSV data in chunked parts to avoid 1MB limits
-        console.log('Storing raw data to Firestore in chunked parts...')
-        const uploadId = `${new Date().toISOString()}_${Math.random().toString(36).slice(2, 8)}`
-        const CHUNK_SIZE = 900_000 // characters, safely under 1MB
-        const totalParts = Math.ceil(csvText.length / CHUNK_SIZE)
-        
-        // Get Firestore instance and verify it's working
         console.log('Initializing Firestore Admin SDK...')
         const db = getAdminDb()
         console.log('Firestore Admin SDK initialized successfully')
-        
-        // Test write to verify permissions
-        console.log('Testing Firestore write permissions...')
-        const testDocRef = db.doc(`dashboard/_test_write_${Date.now()}`)
-        await testDocRef.set({ test: true, timestamp: new Date().toISOString() })
-        const testRead = await testDocRef.get()
-        if (!testRead.exists) {
-          throw new Error('Firestore write test failed: document was not created')
-        }
-        await testDocRef.delete() // Clean up test document
-        console.log('✓ Firestore write permissions verified')
-        
-        await db.doc(`dashboard_raw_uploads/${uploadId}`).set({
-          uploaded_at: new Date().toISOString(),
-          filename: file.name,
-          size: csvText.length,
-          parts: totalParts
-        })
-        console.log(`✓ Created dashboard_raw_uploads/${uploadId} document`)
-        for (let i = 0; i < totalParts; i++) {
-          const start = i * CHUNK_SIZE
-          const end = Math.min(start + CHUNK_SIZE, csvText.length)
-          const chunk = csvText.slice(start, end)
-          await db.doc(`dashboard_raw_uploads/${uploadId}/parts/${String(i).padStart(3, '0')}`).set({
-            index: i,
-            length: chunk.length,
-            content: chunk
-          })
-        }
-        console.log(`✓ Raw data stored in ${totalParts} parts under dashboard_raw_uploads/${uploadId}`)
 
-        // Store processed dashboard data
-        if (result.dashboard_data) {
-          console.log('Storing dashboard data to Firestore...')
-          console.log('Dashboard data keys:', Object.keys(result.dashboard_data))
-          
-          // Extract monthly_bookings for separate storage to stay under Firestore 1MB document limit
-          const { monthly_bookings, ...dashboardDataToStore } = result.dashboard_data
-          
-          console.log('Data size before removal:', JSON.stringify(result.dashboard_data).length, 'bytes')
-          console.log('Data size after removing monthly_bookings:', JSON.stringify(dashboardDataToStore).length, 'bytes')
-          
-          // Build per-year documents to keep individual docs small
-          const {
-            yearly_breakdown,
-            monthly_breakdown,
-            yearly_breakdown_by_class,
-            monthly_breakdown_by_class,
-            yearly_breakdown_combined,
-            monthly_breakdown_combined,
-            revenue_trends,
-            // already removed monthly_bookings
-            ...smallGlobals
-          } = dashboardDataToStore as any
-
-          // Persist small global aggregates (no large per-year maps) in main doc
-          const dataToStore = {
-            ...smallGlobals,
-            last_updated: new Date().toISOString()
-          }
-          console.log('Storing to dashboard/data with keys:', Object.keys(dataToStore))
-          console.log('Has summary:', !!dataToStore.summary)
-          console.log('Data to store size:', JSON.stringify(dataToStore).length, 'bytes')
-          
-          const mainDocRef = db.doc('dashboard/data')
-          console.log('Writing to dashboard/data...')
-          await mainDocRef.set(dataToStore)
-          console.log('✓ Write operation completed for dashboard/data')
-          
-          // Immediately verify the write
-          const immediateCheck = await mainDocRef.get()
-          if (!immediateCheck.exists) {
-            throw new Error('Write completed but document does not exist immediately after write')
-          }
-          console.log('✓ Verified dashboard/data document exists immediately after write')
-
-          // IMPORTANT: Delete all existing per-year documents first to ensure complete overwrite
-          // This prevents old data from persisting when years are removed from the CSV
-          console.log('Clearing existing per-year dashboard data documents for complete overwrite...')
-          try {
-            const existingPerYearCol = db.collection('dashboard_data_by_year')
-            const existingPerYearSnap = await existingPerYearCol.get()
-            const deletePerYearPromises = existingPerYearSnap.docs.map(doc => doc.ref.delete())
-            await Promise.all(deletePerYearPromises)
-            console.log(`✓ Deleted ${existingPerYearSnap.docs.length} existing per-year documents`)
-          } catch (deleteError) {
-            console.warn('Warning: Error deleting existing per-year documents:', deleteError)
-            // Continue anyway - the .set() operations will overwrite
-          }
-
-          // Determine years from available per-year structures
-          const yearSet = new Set<string>()
-          const collectYears = (obj: any) => { if (obj && typeof obj === 'object') Object.keys(obj).forEach(y => yearSet.add(y)) }
-          collectYears(yearly_breakdown)
-          collectYears(monthly_breakdown)
-          collectYears(yearly_breakdown_by_class)
-          collectYears(monthly_breakdown_by_class)
-          collectYears(yearly_breakdown_combined)
-          collectYears(monthly_breakdown_combined)
+        if (result.raw_upload_id) {
+          console.log(`✓ Raw data stored under dashboard_raw_uploads/${result.raw_upload_id}`)
+        }
 
-          // Write per-year documents
-          let perYearDocs = 0
-          for (const year of Array.from(yearSet)) {
-            const yearRevenueTrends: any = {}
-            if (revenue_trends && typeof revenue_trends === 'object') {
-              Object.entries(revenue_trends).forEach(([k, v]: any) => {
-                if (k.startsWith(`${year}-`)) yearRevenueTrends[k] = v
-              })
-            }
+        if (result.unchanged) {
+          console.log('✓ Upload unchanged since the last run; stored dashboard data is current')
+        } else if (result.storage?.run_id) {
+          console.log('✓ Dashboard documents persisted by the Cloud Function:', JSON.stringify(result.storage))
 
-            const perYearPayload = {
-              year,
-              revenue_trends: yearRevenueTrends,
-              yearly_breakdown: yearly_breakdown?.[year] || {},
-              monthly_breakdown: monthly_breakdown?.[year] || {},
-              yearly_breakdown_by_class: yearly_breakdown_by_class?.[year] || {},
-              monthly_breakdown_by_class: monthly_breakdown_by_class?.[year] || {},
-              yearly_breakdown_combined: yearly_breakdown_combined?.[year] || {},
-              monthly_breakdown_combined: monthly_breakdown_combined?.[year] || {},
-              last_updated: new Date().toISOString()
-            }
-            await db.doc(`dashboard_data_by_year/${year}`).set(perYearPayload)
-            perYearDocs++
+          if (result.weekly_report?.error) {
+            console.warn('Warning: Weekly snapshot/report generation failed:', result.weekly_report.error)
+          } else if (result.weekly_report) {
+            console.log(`✓ Weekly report ${result.weekly_report.week_key} stored and snapshot finalized`)
           }
-          console.log(`✓ Stored per-year dashboard data in ${perYearDocs} documents under 'dashboard_data_by_year'`)
-          
-          // Store monthly_bookings split by year-month to avoid 1MB limit
-          // IMPORTANT: Delete all existing monthly_bookings first to ensure clean overwrite
-          // This prevents old/cancelled bookings from persisting when they're not in the new CSV
-          if (monthly_bookings && Object.keys(monthly_bookings).length > 0) {
-            console.log('Clearing existing monthly_bookings documents for complete overwrite...')
-            try {
-              const existingMonthlyCol = db.collection('dashboard_monthly_bookings')
-              const existingMonthlySnap = await existingMonthlyCol.get()
-              const deletePromises = existingMonthlySnap.docs.map(doc => doc.ref.delete())
-              await Promise.all(deletePromises)
-              console.log(`✓ Deleted ${existingMonthlySnap.docs.length} existing monthly_bookings documents`)
-            } catch (deleteError) {
-              console.warn('Warning: Error deleting existing monthly_bookings:', deleteError)
-              // Continue anyway - the .set() operations will overwrite
-            }
-            
-            console.log('Storing monthly_bookings as per-month documents...')
-            let totalDocs = 0
-            for (const year of Object.keys(monthly_bookings)) {
-              const months = monthly_bookings[year] || {}
-              for (const month of Object.keys(months)) {
-                const bookingsForMonth = months[month]
-                // Normalize month to integer string (handle both "3" and "3.0")
-                const monthNormalized = String(parseInt(month))
-                const docId = `${year}-${monthNormalized}`
-                // Write to a top-level collection to keep paths simple
-                // Using .set() to completely overwrite any existing document
-                await db.doc(`dashboard_monthly_bookings/${docId}`).set({
-                  year,
-                  month: monthNormalized,  // Store as integer string
-                  bookings: bookingsForMonth,
-                  last_updated: new Date().toISOString()
-                })
-                totalDocs++
-              }
-            }
-            console.log(`✓ Monthly bookings stored across ${totalDocs} documents in 'dashboard_monthly_bookings'`)
-          }
-
-          // Build/overwrite one weekly sales report per ISO week.
-          // Snapshot is finalized on every upload so the baseline is always current.
-          try {
-            const now = new Date()
-            const nowIso = now.toISOString()
-            const weekKey = getIsoWeekKey(now)
 
-            const currentWeeklyBookings = extractWeeklyBookingsFromMonthly(monthly_bookings || {})
-            const latestSnapshot = await loadLatestFinalSnapshot(db, weekKey)
-            const baselineBookings = latestSnapshot?.bookings || []
-
-            const weeklyReport = buildWeeklyReport(currentWeeklyBookings, baselineBookings)
-            await db.doc(`weekly_sales_reports/${weekKey}`).set({
-              week_key: weekKey,
-              generated_at: nowIso,
-              baseline_snapshot_week: latestSnapshot?.weekKey || null,
-              updates_count: weeklyReport.updates.length,
-              drop_off_count: weeklyReport.dropOff.length,
-              total_current_bookings: currentWeeklyBookings.length,
-              updates: weeklyReport.updates,
-              drop_off: weeklyReport.dropOff,
-              snapshot_finalized: true
-            })
-
-            await overwriteSnapshotBookings(db, weekKey, currentWeeklyBookings, nowIso)
-            console.log(
-              `✓ Weekly report ${weekKey} stored and snapshot finalized (updates=${weeklyReport.updates.length}, drop_off=${weeklyReport.dropOff.length}, bookings=${currentWeeklyBookings.length})`
-            )
-          } catch (weeklyReportError: any) {
-            console.warn('Warning: Weekly snapshot/report generation failed:', weeklyReportError?.message || weeklyReportError)
-          }
-          
-          // Verify data was stored by reading it back
-          const verifyDoc = await db.doc('dashboard/data').get()
-          if (!verifyDoc.exists) {
-            throw new Error('Failed to verify data storage: dashboard/data document does not exist after write')
+          // Verify the version was published by reading its manifest back
+          const versionDoc = await db.doc(`dashboard_versions/${result.storage.run_id}`).get()
+          if (!versionDoc.exists) {
+            throw new Error(`Failed to verify data storage: dashboard_versions/${result.storage.run_id} does not exist after publishing`)
           }
-          console.log('✓ Verified dashboard/data document exists')
+          console.log(`✓ Verified dashboard version ${result.storage.run_id} exists`)
         } else {
-          console.warn('⚠ No dashboard_data in result. Result structure:', JSON.stringify(result, null, 2).substring(0, 500))
-          throw new Error('Cloud Function did not return dashboard_data. Check Cloud Function logs for errors.')
+          console.warn('⚠ No storage report in result. Result structure:', JSON.stringify(result, null, 2).substring(0, 500))
+          throw new Error('Cloud Function did not report storing the dashboard data. Check Cloud Function logs for errors.')
         }
       } catch (firestoreError: any) {
         console.error('❌ Error storing data in Firestore:', firestoreError)
@@ -1018,9 +685,10 @@ export async function POST(request: NextRequest) {
       }
 
       // Include storage status
-      if (!result.dashboard_data) {
-        response_data.warning = 'Dashboard data not found in Cloud Function response'
-        console.error('⚠️ Dashboard data missing from Cloud Function response')
+      if (result.unchanged) {
+        response_data.unchanged = true
+      } else {
+        response_data.version = result.storage.run_id
       }
 
       return NextResponse.json(response_data)
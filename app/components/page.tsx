@@ -62,7 +62,7 @@ export default function ComponentsPage() {
       const timeoutId = setTimeout(() => controller.abort(), 30000) // 30 second timeout
       
       const response = await fetch('/api/data', { 
-        cache: 'no-store',
+        cache: 'no-cache',
         signal: controller.signal
       })
       
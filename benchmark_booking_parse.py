@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Benchmark the booking CSV parse backends (pandas C parser vs pyarrow), with and without
+column projection, on synthetic exports
+
+Run with: python benchmark_booking_parse.py [rows ...]   (default: 10000 100000 1000000)
+"""
+
+import contextlib
+import csv
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'functions'))
+
+import main  # noqa: E402
+
+MAIN_COLUMNS = ['Property', 'Reservation #', 'Reservation name', 'Status', 'Agent', 'Source',
+                'Arrival date', 'Departure date', 'Bed nights', 'PAX', 'Notes', 'Email', 'Country', 'Created by']
+TAIL_COLUMNS = ['Revenue Total', 'Total amount outstanding', 'Payments']
+
+def make_export(rows, seed=1):
+    """Build a synthetic booking export with the real 13-row header layout"""
+    rnd = random.Random(seed)
+    revenue_columns = main.BookingSchema.INCOME_COLUMNS + main.BookingSchema.DISCOUNT_COLUMNS
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator='\n')
+    for i in range(10):
+        writer.writerow([f'Report line {i}'])
+    writer.writerow(['Grouping', 'Property'])
+    writer.writerow(MAIN_COLUMNS + ['Revenue'] + [''] * (len(revenue_columns) - 1) + TAIL_COLUMNS)
+    writer.writerow([''] * len(MAIN_COLUMNS) + revenue_columns + [''] * len(TAIL_COLUMNS))
+
+    properties = ['Baines River Camp', 'MV - Matusadona']
+    names = ['Smith', 'Jones', 'Brown', 'Featherby', 'Muller', 'Lee', 'TWF staff']
+    for r in range(rows):
+        arrival = f'{rnd.choice([2023, 2024, 2025])}-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}'
+        revenue = [round(rnd.uniform(1, 500), 2) if rnd.random() < 0.1 else 0 for _ in revenue_columns]
+        revenue[0] = round(rnd.uniform(100, 5000), 2)
+        total = round(sum(revenue), 2)
+        outstanding = rnd.choice([0, total])
+        writer.writerow(
+            [rnd.choice(properties), f'WB{r}', rnd.choice(names), rnd.choice(['Confirmed', 'Provisional']),
+             rnd.choice(['Agent A', 'Agent B', '']), rnd.choice(['Direct', 'Web', 'Return Guests']),
+             arrival, arrival, rnd.randint(0, 10), rnd.randint(1, 6), rnd.choice(['', 'VIP', 'Late arrival']),
+             f'guest{r}@example.com', rnd.choice(['ZA', 'ZW', 'UK', 'US']), rnd.choice(['Reception', 'Web'])]
+            + revenue + [total, outstanding, round(total - outstanding, 2)]
+        )
+    return out.getvalue()
+
+def time_backend(csv_content, backend, columns=None):
+    """Seconds to load the export and run the aggregation stages with one backend"""
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        df, schema = main.load_and_clean_data(csv_content, backend=backend, columns=columns)
+        parsed = time.perf_counter()
+        rules = main.BusinessRules.from_config(main.load_business_rules_config())
+        df, _ = main.apply_business_rules(df, schema, rules)
+        df, _ = main.calculate_income_and_disbursements(df, schema)
+        main.process_revenue_and_booking_metrics(df, schema)
+        main.create_breakdowns(df, schema, booking_columns=columns)
+    return parsed - start, time.perf_counter() - start
+
+def main_benchmark(row_counts):
+    backends = ['c', 'pyarrow'] if main._pyarrow_available() else ['c']
+    if len(backends) == 1:
+        print("pyarrow is not installed; only timing the C parser")
+    projections = {'all': None, 'details': main.BOOKING_DETAILS_COLUMNS}
+    print(f"{'rows':>10}  {'backend':>8}  {'columns':>8}  {'parse s':>8}  {'pipeline s':>10}")
+    for rows in row_counts:
+        csv_content = make_export(rows)
+        for backend in backends:
+            for label, columns in projections.items():
+                parse_seconds, total_seconds = time_backend(csv_content, backend, columns)
+                print(f"{rows:>10}  {backend:>8}  {label:>8}  {parse_seconds:>8.2f}  {total_seconds:>10.2f}")
+
+if __name__ == '__main__':
+    main_benchmark([int(arg) for arg in sys.argv[1:]] or [10000, 100000, 1000000])
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Benchmark occupancy report processing (CSV -> occupancy matrix -> aggregations) on a
+synthetic report with the real header layout, against the per-cell record loop it replaced,
+and compare the occupancy module's cold import time with pandas' (the budget itself is
+enforced by tests/test_occupancy_import.py)
+
+Run with: python benchmark_occupancy.py [properties] [years] [repeats]   (default: 10 5 3)
+"""
+
+import calendar
+import contextlib
+import csv
+import io
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime
+
+FUNCTIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'functions')
+sys.path.insert(0, FUNCTIONS_DIR)
+
+import occupancy  # noqa: E402
+
+ACCOMMODATION_TYPES = ['Luxury Tent', 'Family Suite', 'Honeymoon Suite', 'Standard', 'Internal Account', 'Pilot/Guide Room']
+
+def make_report(properties, years, seed=1):
+    """Build a synthetic occupancy report: preamble, month/day header rows, one row per accommodation type"""
+    rnd = random.Random(seed)
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator='\n')
+    for label in ['Occupancy Report', 'Date Range', 'Property filter:', 'Accommodation types:', 'Agents:',
+                  'Include provisionals:', 'Add agent allocations:', 'Show unit totals:', 'Available rooms limit:']:
+        writer.writerow([label, ''])
+    writer.writerow([''])
+    writer.writerow([''])
+
+    month_row, weekday_row, day_row = ['', ''], ['', ''], ['', '']
+    for year in range(2026 - years, 2026):
+        for month in range(1, 13):
+            for day in range(1, calendar.monthrange(year, month)[1] + 1):
+                month_row.append(f'{calendar.month_abbr[month]} {year}')
+                weekday_row.append(calendar.day_abbr[calendar.weekday(year, month, day)])
+                day_row.append(str(day))
+    writer.writerows([month_row, weekday_row, day_row])
+
+    cells = ['0', '0', '0', '1', '2', '3', '4', '1*', '2*', '']
+    for p in range(properties):
+        for accommodation_type in ACCOMMODATION_TYPES:
+            writer.writerow([f'Camp {p}', accommodation_type] + [rnd.choice(cells) for _ in range(len(month_row) - 2)])
+        writer.writerow(['', ''])
+    return out.getvalue()
+
+# The per-cell implementation the occupancy matrix replaced: one dict per (row, date) cell,
+# a strptime per cell while parsing and again while aggregating, and a pandas DataFrame
+# walked with iloc to find the header and read the data rows
+def baseline_rows(data_rows, dates):
+    """Per-cell parse of the data rows into {'property', 'accommodation_type', 'occupancy_data'} records"""
+    records = []
+    for row in data_rows:
+        property_name = str(row[0]).strip() if len(row) > 0 and row[0] else ''
+        accommodation_type = str(row[1]).strip() if len(row) > 1 and row[1] else ''
+        if (not property_name and not accommodation_type) or property_name in occupancy.OCCUPANCY_METADATA_LABELS:
+            continue
+        occupancy_data = []
+        for i, date in enumerate(dates):
+            if i + 2 >= len(row):
+                break
+            if datetime.strptime(date, '%Y-%m-%d').month in occupancy.OCCUPANCY_EXCLUDED_MONTHS:
+                continue
+            value = str(row[i + 2]).strip() if row[i + 2] else '0'
+            is_provisional = '*' in value
+            value = value.replace('*', '').strip()
+            try:
+                count = int(value) if value else 0
+            except ValueError:
+                count = 0
+            occupancy_data.append({'date': date, 'occupancy': count, 'is_provisional': is_provisional})
+        if property_name in occupancy.OCCUPANCY_EXCLUDED_PROPERTIES or accommodation_type in occupancy.OCCUPANCY_EXCLUDED_ACCOMMODATION_TYPES:
+            continue
+        records.append({'property': property_name, 'accommodation_type': accommodation_type, 'occupancy_data': occupancy_data})
+    return records
+
+def baseline_aggregate(records, dates):
+    """Per-cell accumulation of the daily and monthly totals from the records"""
+    daily_by_property = defaultdict(lambda: defaultdict(int))
+    daily_by_accommodation = defaultdict(lambda: defaultdict(int))
+    monthly_by_property = defaultdict(lambda: defaultdict(lambda: {'total': 0, 'provisional': 0, 'days': 0}))
+    monthly_by_accommodation = defaultdict(lambda: defaultdict(lambda: {'total': 0, 'provisional': 0, 'days': 0}))
+    daily_totals = defaultdict(lambda: {'total': 0, 'provisional': 0, 'confirmed': 0})
+    for record in records:
+        for cell in record['occupancy_data']:
+            date_obj = datetime.strptime(cell['date'], '%Y-%m-%d')
+            month_key = f"{date_obj.year}-{date_obj.month:02d}"
+            count = cell['occupancy']
+            daily_by_property[record['property']][cell['date']] += count
+            daily_by_accommodation[record['accommodation_type']][cell['date']] += count
+            daily_totals[cell['date']]['total'] += count
+            daily_totals[cell['date']]['provisional' if cell['is_provisional'] else 'confirmed'] += count
+            for monthly in (monthly_by_property[record['property']], monthly_by_accommodation[record['accommodation_type']]):
+                monthly[month_key]['total'] += count
+                monthly[month_key]['days'] += 1
+                if cell['is_provisional']:
+                    monthly[month_key]['provisional'] += count
+    peak_dates = sorted(daily_totals.items(), key=lambda item: item[1]['total'], reverse=True)[:10]
+    return {
+        'daily_totals': [{'date': date, **totals} for date, totals in sorted(daily_totals.items())],
+        'daily_by_property': {name: sorted(days.items()) for name, days in daily_by_property.items()},
+        'daily_by_accommodation': {name: sorted(days.items()) for name, days in daily_by_accommodation.items()},
+        'monthly_by_property': {name: dict(sorted(months.items())) for name, months in monthly_by_property.items()},
+        'monthly_by_accommodation': {name: dict(sorted(months.items())) for name, months in monthly_by_accommodation.items()},
+        'peak_dates': peak_dates
+    }
+
+def baseline_end_to_end(csv_content):
+    """The replaced end-to-end path: per-line csv parsing into a DataFrame, iloc header search, per-cell loops"""
+    import pandas as pd
+    rows = [next(csv.reader([line])) for line in csv_content.split('\n') if line.strip()]
+    df = pd.DataFrame(rows)
+    header_idx, best = 11, 10
+    for idx in range(len(df)):
+        month_count = sum(1 for cell in df.iloc[idx] if pd.notna(cell) and occupancy._OCCUPANCY_MONTH_PATTERN.match(str(cell).strip()))
+        if month_count > best:
+            header_idx, best = idx, month_count
+    dates = occupancy.parse_occupancy_date_from_header(df.iloc[header_idx].tolist())
+    records = baseline_rows([df.iloc[idx].tolist() for idx in range(header_idx + 3, len(df))], dates)
+    return baseline_aggregate(records, dates)
+
+def best_of(repeats, fn):
+    """Fastest of ``repeats`` runs of fn(), in seconds"""
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def import_seconds(module):
+    """Cold import time of ``module`` in a fresh interpreter, and whether it pulled in pandas"""
+    code = (f"import sys, time; start = time.perf_counter(); import {module}; "
+            f"print(time.perf_counter() - start, 'pandas' in sys.modules)")
+    result = subprocess.run([sys.executable, '-c', code], cwd=FUNCTIONS_DIR, capture_output=True, text=True, check=True)
+    seconds, pandas_loaded = result.stdout.split()
+    return float(seconds), pandas_loaded == 'True'
+
+def compare_import_times(repeats):
+    """Print cold import times: occupancy vs pandas (which the booking path loads)"""
+    occupancy_seconds, pandas_loaded = min(import_seconds('occupancy') for _ in range(repeats))
+    pandas_seconds = min(import_seconds('pandas')[0] for _ in range(repeats))
+    print(f"{'import':>12}  {'best s':>8}")
+    print(f"{'occupancy':>12}  {occupancy_seconds:>8.3f}  (budget {occupancy.OCCUPANCY_IMPORT_BUDGET_S:.2f} s"
+          f"{', loads pandas' if pandas_loaded else ''})")
+    print(f"{'pandas':>12}  {pandas_seconds:>8.3f}")
+
+def main_benchmark(properties, years, repeats):
+    csv_content = make_report(properties, years)
+    rows = list(csv.reader(io.StringIO(csv_content)))
+    header_idx = occupancy._find_occupancy_header(rows[:occupancy.OCCUPANCY_HEADER_SCAN_ROWS])
+    axis = occupancy.DateAxis.from_dates(occupancy.parse_occupancy_date_from_header(rows[header_idx]))
+    data_rows = rows[header_idx + 3:]
+    matrix = occupancy.parse_occupancy_rows(data_rows, axis)
+    print(f"{properties} properties x {years} years: {len(matrix.rows)} rows x {len(matrix.dates)} dates "
+          f"({len(csv_content) / 1e6:.1f} MB CSV)")
+
+    records = baseline_rows(data_rows, axis.dates)
+    stages = [
+        ('rows', lambda: occupancy.parse_occupancy_rows(data_rows, axis), lambda: baseline_rows(data_rows, axis.dates)),
+        ('aggregate', lambda: occupancy.aggregate_occupancy_data_cloud(matrix, axis), lambda: baseline_aggregate(records, axis.dates)),
+        ('end to end', lambda: occupancy.process_occupancy_report_cloud(csv_content), lambda: baseline_end_to_end(csv_content)),
+    ]
+    print(f"{'stage':>12}  {'matrix s':>9}  {'per-cell s':>10}  {'speedup':>8}")
+    for stage, matrix_fn, baseline_fn in stages:
+        matrix_seconds, baseline_seconds = best_of(repeats, matrix_fn), best_of(repeats, baseline_fn)
+        print(f"{stage:>12}  {matrix_seconds:>9.3f}  {baseline_seconds:>10.3f}  {baseline_seconds / matrix_seconds:>7.1f}x")
+    print()
+    compare_import_times(repeats)
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:]]
+    main_benchmark(*(args + [10, 5, 3][len(args):]))
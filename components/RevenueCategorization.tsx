@@ -201,7 +201,7 @@ export default function RevenueCategorization() {
 
   const discoverItemsFromData = async () => {
     try {
-      const response = await fetch('/api/data', { cache: 'no-store' })
+      const response = await fetch('/api/data', { cache: 'no-cache' })
       if (response.ok) {
         const data = await response.json()
         
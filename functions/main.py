@@ -1,12 +1,24 @@
-from firebase_functions import https_fn
+from firebase_functions import https_fn, firestore_fn
 from firebase_functions.options import set_global_options
 import json
 import io
+import gzip
 import csv as csv_module
+import itertools
+import hashlib
+import math
+import os
+import time
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from collections import defaultdict
 import re
 
+# Occupancy report processing lives in its own stdlib + NumPy module (no pandas)
+from occupancy import process_occupancy_report_cloud, validate_occupancy_header
+
 # For cost control, you can set the maximum number of containers that can be
 # running at the same time. This helps mitigate the impact of unexpected
 # traffic spikes by instead downgrading performance. This limit is a per-function
@@ -47,24 +59,530 @@ def get_firestore_client():
             return None
     return _firestore_client
 
-def _delete_collection_docs(collection_name):
-    """Delete every document in a top-level collection."""
-    db = get_firestore_client()
+# Firestore caps a batched write at 500 operations and 10 MiB per request
+FIRESTORE_BATCH_OPS = 500
+FIRESTORE_BATCH_BYTES = 9 * 1024 * 1024
+FIRESTORE_WRITE_WORKERS = 4
+
+class FirestoreBatchWriter:
+    """Queue document sets and deletes, then commit them as batched writes in parallel.
+
+    Batches commit in no particular order, so every queued operation must touch a
+    different document. ``check`` runs before each batch (e.g. ProcessingLease.check);
+    an exception from it abandons the batches not yet committed.
+    """
+
+    def __init__(self, db, max_workers=FIRESTORE_WRITE_WORKERS, check=None):
+        self.db = db
+        self.max_workers = max_workers
+        self.check = check
+        self.writes = 0
+        self.deletes = 0
+        self._batches = []
+        self._ops = []
+        self._bytes = 0
+
+    def set(self, path, data):
+        """Queue a full overwrite of the document at ``path``"""
+        self._add(('set', self.db.document(path), data), len(json.dumps(data, default=str)))
+        self.writes += 1
+
+    def delete(self, reference):
+        """Queue a delete of a DocumentReference"""
+        self._add(('delete', reference, None), 0)
+        self.deletes += 1
+
+    def _add(self, op, size):
+        if self._ops and (len(self._ops) >= FIRESTORE_BATCH_OPS or self._bytes + size > FIRESTORE_BATCH_BYTES):
+            self._batches.append(self._ops)
+            self._ops, self._bytes = [], 0
+        self._ops.append(op)
+        self._bytes += size
+
+    def _commit_batch(self, ops):
+        if self.check:
+            self.check()
+        batch = self.db.batch()
+        for kind, reference, data in ops:
+            if kind == 'set':
+                batch.set(reference, data)
+            else:
+                batch.delete(reference)
+        started = time.perf_counter()
+        batch.commit()
+        return (time.perf_counter() - started) * 1000
+
+    def commit(self):
+        """Commit everything queued; returns the write-count and latency report"""
+        if self._ops:
+            self._batches.append(self._ops)
+        batches, self._batches, self._ops, self._bytes = self._batches, [], [], 0
+        started = time.perf_counter()
+        latencies = []
+        if batches:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as executor:
+                latencies = list(executor.map(self._commit_batch, batches))
+        report = {
+            'writes': self.writes,
+            'deletes': self.deletes,
+            'batches': len(batches),
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+            'max_batch_ms': round(max(latencies), 1) if latencies else 0.0,
+            'total_batch_ms': round(sum(latencies, 0.0), 1)
+        }
+        print(f"Committed {report['writes']} writes and {report['deletes']} deletes in {report['batches']} batches ({report['elapsed_ms']} ms)")
+        return report
+
+def _content_hash(payload):
+    """Stable hash of a document's content (ignoring its bookkeeping fields)"""
+    content = {key: value for key, value in payload.items() if key not in ('last_updated', 'content_hash')}
+    return hashlib.sha1(json.dumps(content, sort_keys=True, default=str, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+# Firestore rejects documents over 1 MiB; larger payloads are split into shard docs.
+# The target leaves room for the document name and Firestore's fixed per-document overhead.
+SHARD_TARGET_BYTES = 900_000
+
+def _encoded_size(value):
+    """Stored size of a value under Firestore's size rules: strings and field names take their
+    UTF-8 length + 1, numbers and timestamps 8 bytes, booleans and nulls 1, maps and arrays the
+    sum of their entries."""
+    if value is None or isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float, datetime)):
+        return 8
+    if isinstance(value, str):
+        return len(value.encode('utf-8')) + 1
+    if isinstance(value, bytes):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(_encoded_size(str(key)) + _encoded_size(item) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(_encoded_size(item) for item in value)
+    return _encoded_size(str(value))
+
+def shard_document(payload, limit=SHARD_TARGET_BYTES):
+    """Split the largest top-level maps/lists of ``payload`` into shards until the rest fits in ``limit``.
+
+    Returns the head document and a list of shard docs ({'field', 'items'}). The head
+    names its sharded fields under '_shards'; read_sharded_document reverses the split.
+    """
+    field_sizes = {key: _encoded_size(str(key)) + _encoded_size(value) for key, value in payload.items()}
+    head_bytes = sum(field_sizes.values())
+    if head_bytes <= limit:
+        return payload, []
+    head = dict(payload)
+    shards = []
+    sharded_fields = {}
+    candidates = sorted(
+        (key for key, value in payload.items() if isinstance(value, (dict, list)) and value),
+        key=lambda key: field_sizes[key],
+        reverse=True
+    )
+    for field in candidates:
+        if head_bytes <= limit:
+            break
+        value = head.pop(field)
+        head_bytes -= field_sizes[field]
+        is_map = isinstance(value, dict)
+        items = list(value.items()) if is_map else list(value)
+        empty_shard_bytes = _encoded_size({'field': field, 'items': []})
+        chunk, chunk_bytes = [], empty_shard_bytes
+        for item in items:
+            item_bytes = _encoded_size(str(item[0])) + _encoded_size(item[1]) if is_map else _encoded_size(item)
+            if chunk and chunk_bytes + item_bytes > limit:
+                shards.append({'field': field, 'items': dict(chunk) if is_map else chunk})
+                chunk, chunk_bytes = [], empty_shard_bytes
+            if empty_shard_bytes + item_bytes > limit:
+                print(f"Warning: {field} has an item of {item_bytes} bytes, above the shard size")
+            chunk.append(item)
+            chunk_bytes += item_bytes
+        if chunk:
+            shards.append({'field': field, 'items': dict(chunk) if is_map else chunk})
+        sharded_fields[field] = 'map' if is_map else 'list'
+    head['_shards'] = {'fields': sharded_fields, 'ids': []}
+    return head, shards
+
+def _stage_sharded_document(writer, path, payload):
+    """Queue a new, not yet visible document and its shards (under {path}/shards); returns the shard doc ids"""
+    head, shards = shard_document(payload)
+    shard_ids = [f'{index:03d}' for index in range(len(shards))]
+    if shards:
+        head['_shards']['ids'] = shard_ids
+        print(f"Sharding {path} into {len(shards)} shard docs ({', '.join(head['_shards']['fields'])})")
+    for shard_id, shard in zip(shard_ids, shards):
+        writer.set(f'{path}/shards/{shard_id}', shard)
+    writer.set(path, head)
+    return shard_ids
+
+def write_sharded_document(db, path, payload, lease=None):
+    """Write a live document of any size: shards first, then the head that names them, then stale shards are removed.
+
+    Each write gets fresh shard ids, so a reader never pairs a head with another write's shards.
+    With a ``lease``, the head is only written while the lease's run is still the newest.
+    """
+    shard_writer = FirestoreBatchWriter(db, check=lease.check if lease else None)
+    head, shards = shard_document(payload)
+    generation = uuid.uuid4().hex[:8]
+    shard_ids = [f'{generation}-{index:03d}' for index in range(len(shards))]
+    for shard_id, shard in zip(shard_ids, shards):
+        shard_writer.set(f'{path}/shards/{shard_id}', shard)
+    shard_writer.commit()
+    if shards:
+        head['_shards']['ids'] = shard_ids
+        print(f"Sharded {path} into {len(shards)} shard docs ({', '.join(head['_shards']['fields'])})")
+    if lease:
+        lease.publish(path, head)
+    else:
+        db.document(path).set(head)
+    cleanup = FirestoreBatchWriter(db)
+    for reference in db.document(path).collection('shards').list_documents():
+        if reference.id not in shard_ids:
+            cleanup.delete(reference)
+    cleanup.commit()
+    return {'doc': path, 'shards': len(shards)}
+
+def _merge_shards(data, shard_docs):
+    """Fold shard docs back into their head document"""
+    data = dict(data)
+    fields = data.pop('_shards').get('fields') or {}
+    for field, kind in fields.items():
+        data[field] = {} if kind == 'map' else []
+    for shard in shard_docs:
+        if fields.get(shard['field']) == 'map':
+            data[shard['field']].update(shard['items'])
+        else:
+            data[shard['field']].extend(shard['items'])
+    return data
+
+def read_sharded_document(db, path):
+    """Read a document written by write_sharded_document/_stage_sharded_document (None when missing)"""
+    snapshot = db.document(path).get()
+    if not snapshot.exists:
+        return None
+    data = snapshot.to_dict() or {}
+    if '_shards' not in data:
+        return data
+    references = [db.document(f'{path}/shards/{shard_id}') for shard_id in data['_shards'].get('ids') or []]
+    shard_docs = {shard.reference.id: shard.to_dict() for shard in db.get_all(references)}
+    return _merge_shards(data, [shard_docs[reference.id] for reference in references])
+
+# One lease doc per dataset (bookings, occupancy) names the newest upload. Every run
+# registers on arrival, takes the lease in a transaction before persisting and re-checks
+# it between write batches; the writes that make a run visible go through the same
+# transaction. A run that finds a newer one registered abandons its remaining writes.
+PROCESSING_LEASES = 'processing_leases'
+
+class Superseded(Exception):
+    """A newer upload for the same dataset took over the lease (args: its run id)"""
+
+class ProcessingLease:
+    """Claim on persisting one dataset, held by its newest upload"""
+
+    def __init__(self, db, dataset, token=None):
+        self.db = db
+        self.dataset = dataset
+        self.token = token or _new_run_id()
+        self.reference = db.document(f'{PROCESSING_LEASES}/{dataset}')
+        self.lost_to = None
+
+    def register(self):
+        """Announce this run as the dataset's newest upload"""
+        self.reference.set({'run_id': self.token, 'registered_at': datetime.now().isoformat()}, merge=True)
+        return self
+
+    def _verify(self, snapshot):
+        run_id = (snapshot.to_dict() or {}).get('run_id') if snapshot.exists else None
+        if run_id != self.token:
+            self.lost_to = run_id or ''
+            raise Superseded(run_id)
+
+    def _transact(self, write):
+        """Run ``write(transaction)`` only while this run is still the newest"""
+        from google.cloud import firestore
+
+        @firestore.transactional
+        def attempt(transaction):
+            self._verify(self.reference.get(transaction=transaction))
+            write(transaction)
+
+        attempt(self.db.transaction())
+
+    def check(self):
+        """Raise Superseded once a newer upload has registered"""
+        if self.lost_to is not None:
+            raise Superseded(self.lost_to)
+        self._verify(self.reference.get())
+
+    def acquire(self):
+        """Take the lease before persisting"""
+        now = datetime.now().isoformat()
+        self._transact(lambda transaction: transaction.update(self.reference, {'holder': self.token, 'acquired_at': now}))
+        print(f"Took the {self.dataset} lease for run {self.token}")
+
+    def publish(self, path, data):
+        """Write a document that makes this run's output visible"""
+        self._transact(lambda transaction: transaction.set(self.db.document(path), data))
+
+    def release(self):
+        """Drop the holder mark (a newer run may already have replaced it)"""
+        try:
+            self._transact(lambda transaction: transaction.update(self.reference, {'holder': None, 'released_at': datetime.now().isoformat()}))
+        except Superseded:
+            pass
+
+# Each processing run is published under dashboard_versions/{run_id}; readers resolve
+# the live run through the pointer doc
+DASHBOARD_POINTER_DOC = 'dashboard/current'
+DASHBOARD_VERSIONS = 'dashboard_versions'
+DASHBOARD_VERSIONS_KEPT = 3
+# Per-year and per-month collections written before dashboard versions existed. Nothing
+# reads or writes them any more; collect_dashboard_versions deletes what is left of them.
+LEGACY_DASHBOARD_COLLECTIONS = ('dashboard_data_by_year', 'dashboard_monthly_bookings')
+
+def _new_run_id():
+    """Sortable, unique id for a processing run"""
+    return f"{datetime.now().strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+def _current_dashboard_manifest(db):
+    """Manifest of the version the pointer doc currently points at, or None"""
+    pointer = db.document(DASHBOARD_POINTER_DOC).get()
+    run_id = (pointer.to_dict() or {}).get('run_id') if pointer.exists else None
+    if not run_id:
+        return None
+    return read_sharded_document(db, f'{DASHBOARD_VERSIONS}/{run_id}')
+
+def _stage_version_documents(writer, run_id, group, documents, previous):
+    """Queue a version's documents, reusing the previous version's copy when the content hash is unchanged.
+
+    Returns the manifest entries ({doc_id: {'path', 'hash'}}) and sync counts.
+    """
+    entries = {}
+    written = 0
+    now = datetime.now().isoformat()
+    for doc_id, payload in documents.items():
+        content_hash = _content_hash(payload)
+        prior = previous.get(doc_id)
+        if prior and prior.get('hash') == content_hash:
+            entries[doc_id] = prior
+            continue
+        path = f'{DASHBOARD_VERSIONS}/{run_id}/{group}/{doc_id}'
+        _stage_sharded_document(writer, path, {**payload, 'content_hash': content_hash, 'last_updated': now})
+        entries[doc_id] = {'path': path, 'hash': content_hash}
+        written += 1
+    sync = {
+        'written': written,
+        'unchanged': len(documents) - written,
+        'removed': len([doc_id for doc_id in previous if doc_id not in documents])
+    }
+    print(f"{group}: {sync['written']} changed, {sync['unchanged']} unchanged, {sync['removed']} removed")
+    return entries, sync
+
+# Pre-built gzip bundle of the merged dashboard shape served by the data API route.
+# Parts are stored as bytes fields; DASHBOARD_BUNDLE_DIR writes it to a local directory instead.
+DASHBOARD_BUNDLE_PART_BYTES = 900_000
+DASHBOARD_BUNDLE_DIR = os.environ.get('DASHBOARD_BUNDLE_DIR')
+
+def _bundle_etag(dashboard_data):
+    """Content hash of the dashboard data, ignoring when its report was generated"""
+    summary = {key: value for key, value in (dashboard_data.get('summary') or {}).items() if key != 'report_generated'}
+    return _content_hash({**dashboard_data, 'summary': summary})
+
+def build_dashboard_bundle(dashboard_data, last_updated):
+    """Gzip the merged dashboard shape (main doc, per-year maps and monthly bookings in one object)"""
+    bundle = {**dashboard_data, 'last_updated': last_updated}
+    return gzip.compress(json.dumps(bundle, default=str, separators=(',', ':')).encode('utf-8'), mtime=0)
+
+def _stage_dashboard_bundle(writer, run_id, dashboard_data, last_updated, previous):
+    """Queue the bundle parts for a version, reusing the previous bundle when the data is unchanged.
+
+    Returns the bundle descriptor stored in the manifest and the pointer doc.
+    """
+    etag = _bundle_etag(dashboard_data)
+    if previous and previous.get('etag') == etag:
+        print(f"Dashboard bundle unchanged ({etag[:12]})")
+        return previous
+    compressed = build_dashboard_bundle(dashboard_data, last_updated)
+    descriptor = {'etag': etag, 'encoding': 'gzip', 'size': len(compressed)}
+    if DASHBOARD_BUNDLE_DIR:
+        os.makedirs(DASHBOARD_BUNDLE_DIR, exist_ok=True)
+        descriptor['file'] = os.path.join(DASHBOARD_BUNDLE_DIR, f'{etag}.json.gz')
+        with open(descriptor['file'], 'wb') as f:
+            f.write(compressed)
+    else:
+        descriptor['parts'] = []
+        for index, start in enumerate(range(0, len(compressed), DASHBOARD_BUNDLE_PART_BYTES)):
+            path = f'{DASHBOARD_VERSIONS}/{run_id}/bundle/{index:03d}'
+            writer.set(path, {'index': index, 'data': compressed[start:start + DASHBOARD_BUNDLE_PART_BYTES]})
+            descriptor['parts'].append(path)
+    print(f"Dashboard bundle {etag[:12]}: {len(compressed)} bytes gzipped")
+    return descriptor
+
+def collect_dashboard_versions(db, keep=DASHBOARD_VERSIONS_KEPT):
+    """Delete all but the newest ``keep`` dashboard versions and the legacy collections.
+
+    Documents that a kept version still references (unchanged content carried
+    forward) survive until no kept manifest points at them. Runs from
+    collect_dashboard_versions_on_publish, after the upload that published has answered.
+    """
+    pointer = db.document(DASHBOARD_POINTER_DOC).get()
+    live_run_id = (pointer.to_dict() or {}).get('run_id') if pointer.exists else None
+    # list_documents also returns versions whose manifest is gone but whose documents remain
+    versions = sorted(db.collection(DASHBOARD_VERSIONS).list_documents(), key=lambda ref: ref.id, reverse=True)
+    kept = versions[:keep] + [ref for ref in versions[keep:] if ref.id == live_run_id]
+    expired = [ref for ref in versions[keep:] if ref.id != live_run_id]
+    referenced = set()
+    for reference in kept:
+        manifest = read_sharded_document(db, reference.path)
+        if manifest:
+            for entries in (manifest.get('documents') or {}).values():
+                referenced.update(entry['path'] for entry in entries.values())
+            referenced.update((manifest.get('bundle') or {}).get('parts') or [])
+    writer = FirestoreBatchWriter(db)
+    for reference in expired:
+        for group in reference.collections():
+            for document in group.list_documents():
+                if document.path not in referenced:
+                    # A version doc's shards live one level further down and go with it
+                    for shard in document.collection('shards').list_documents():
+                        writer.delete(shard)
+                    writer.delete(document)
+        writer.delete(reference)
+    legacy = [document for name in LEGACY_DASHBOARD_COLLECTIONS for document in db.collection(name).list_documents()]
+    for document in legacy:
+        writer.delete(document)
+    report = writer.commit()
+    report['versions_expired'] = len(expired)
+    report['legacy_docs_removed'] = len(legacy)
+    return report
+
+# Monthly bookings docs store their records column by column ('columnar'): field names
+# once, dictionary codes for repetitive text columns and only the non-zero entries of
+# mostly-zero numeric columns. 'records' keeps the original list of row dicts.
+MONTHLY_BOOKINGS_ENCODING = os.environ.get('MONTHLY_BOOKINGS_ENCODING', 'columnar')
+
+def _is_positive_zero(value):
+    return type(value) is float and value == 0.0 and math.copysign(1.0, value) > 0
+
+def _encode_booking_column(values):
+    """Smallest of the dense, dictionary and sparse encodings for one column"""
+    rows = len(values)
+    zero_count = sum(1 for value in values if _is_positive_zero(value))
+    if zero_count * 2 >= rows and zero_count:
+        index = [i for i, value in enumerate(values) if not _is_positive_zero(value)]
+        return {'default': 0.0, 'index': index, 'values': [values[i] for i in index]}
+    if all(value is None or type(value) is str for value in values):
+        codes_by_value = {}
+        codes = [codes_by_value.setdefault(value, len(codes_by_value)) for value in values]
+        if len(codes_by_value) * 2 <= rows:
+            return {'dictionary': list(codes_by_value), 'codes': codes}
+    return {'values': list(values)}
+
+def encode_monthly_bookings(records):
+    """Columnar form of one month's booking records (see decode_monthly_bookings).
+
+    Returns None when the records do not share one field order and so must stay as records.
+    """
+    fields = tuple(records[0]) if records else ()
+    if any(tuple(record) != fields for record in records):
+        return None
+    return {
+        'encoding': 'columnar',
+        'rows': len(records),
+        'fields': list(fields),
+        'columns': [_encode_booking_column([record[field] for record in records]) for field in fields]
+    }
+
+def _decode_booking_column(column, rows):
+    if 'codes' in column:
+        dictionary = column['dictionary']
+        return [dictionary[code] for code in column['codes']]
+    if 'index' in column:
+        values = [column['default']] * rows
+        for i, value in zip(column['index'], column['values']):
+            values[i] = value
+        return values
+    return column['values']
+
+def decode_monthly_bookings(doc):
+    """Booking records of a monthly bookings doc, whichever encoding it was stored in"""
+    if doc.get('encoding') != 'columnar':
+        return doc.get('bookings') or []
+    rows = doc['rows']
+    fields = doc['fields']
+    if not fields:
+        return [{} for _ in range(rows)]
+    columns = [_decode_booking_column(column, rows) for column in doc['columns']]
+    return [dict(zip(fields, row)) for row in zip(*columns)]
+
+def _monthly_bookings_doc(year, month, bookings):
+    """Payload of one dashboard monthly bookings doc in MONTHLY_BOOKINGS_ENCODING"""
+    doc = {'year': year, 'month': month}
+    encoded = encode_monthly_bookings(bookings) if MONTHLY_BOOKINGS_ENCODING == 'columnar' else None
+    if encoded is None:
+        return {**doc, 'bookings': bookings}
+    return {**doc, **encoded}
+
+# Re-uploads of the export behind the live data are answered from the stored summary.
+# The fingerprint covers the raw request body, the options that shape the output, the
+# business rules and the code of every module in functions/ (main.py, occupancy.py, ...),
+# so a rules edit or a deploy reprocesses.
+_CODE_FINGERPRINT = None
+
+def _code_fingerprint():
+    global _CODE_FINGERPRINT
+    if _CODE_FINGERPRINT is None:
+        source_dir = os.path.dirname(os.path.abspath(__file__))
+        digest = hashlib.sha1()
+        for name in sorted(os.listdir(source_dir)):
+            if name.endswith('.py'):
+                digest.update(name.encode('utf-8'))
+                with open(os.path.join(source_dir, name), 'rb') as f:
+                    digest.update(f.read())
+        _CODE_FINGERPRINT = digest.hexdigest()
+    return _CODE_FINGERPRINT
+
+def _input_fingerprint(body, **options):
+    """Hash of a request body plus everything else that determines its processed output"""
+    digest = hashlib.sha256(body)
+    digest.update(json.dumps({**options, 'code': _code_fingerprint()}, sort_keys=True, default=str).encode('utf-8'))
+    return digest.hexdigest()
+
+def _stored_run(db, path, input_fingerprint):
+    """The doc at ``path`` when it records ``input_fingerprint`` as its input, else None"""
     if db is None:
-        raise RuntimeError("Firestore client not initialized")
-    docs = db.collection(collection_name).stream()
-    deleted = 0
-    for doc in docs:
-        doc.reference.delete()
-        deleted += 1
-    print(f"Deleted {deleted} docs from {collection_name}")
-    return deleted
-
-def persist_dashboard_data(dashboard_data):
-    """Persist processed booking dashboard data to Firestore."""
+        return None
+    try:
+        snapshot = db.document(path).get()
+    except Exception as e:
+        print(f"Warning: Could not read {path}: {e}")
+        return None
+    data = (snapshot.to_dict() or {}) if snapshot.exists else {}
+    if data.get('input_fingerprint') != input_fingerprint or 'summary' not in data:
+        return None
+    return data
+
+def persist_dashboard_data(dashboard_data, input_fingerprint=None, lease=None):
+    """Persist processed booking dashboard data to Firestore as a new version.
+
+    The run's per-year and monthly docs are written under dashboard_versions/{run_id}
+    (docs whose content hash is unchanged are carried over from the live version
+    instead of rewritten), followed by a manifest doc. Only then is the pointer doc
+    flipped to the new run, so readers never see a partially written version.
+    ``input_fingerprint`` is recorded on the pointer with the summary so an identical
+    re-upload can be answered without reprocessing. With a ``lease`` (ProcessingLease),
+    the run is published under the lease's token and stops with Superseded as soon as
+    a newer upload registers - up to the pointer flip. From then on the run is live and
+    reports success; it only leaves dashboard/data to the newer upload.
+    """
     db = get_firestore_client()
     if db is None:
         raise RuntimeError("Firestore client not initialized")
+    if lease:
+        lease.acquire()
+    writer = FirestoreBatchWriter(db, check=lease.check if lease else None)
+    run_id = lease.token if lease else _new_run_id()
+    previous_manifest = _current_dashboard_manifest(db) or {}
+    previous = previous_manifest.get('documents') or {}
 
     monthly_bookings = dashboard_data.get('monthly_bookings', {}) or {}
 
@@ -74,7 +592,8 @@ def persist_dashboard_data(dashboard_data):
         'yearly_breakdown_by_class',
         'monthly_breakdown_by_class',
         'yearly_breakdown_combined',
-        'monthly_breakdown_combined'
+        'monthly_breakdown_combined',
+        'payment_status_by_month'
     ]
 
     # Keep the main dashboard doc small (exclude per-year maps + monthly bookings)
@@ -84,16 +603,15 @@ def persist_dashboard_data(dashboard_data):
         if key not in per_year_keys and key != 'monthly_bookings'
     }
     main_data['last_updated'] = datetime.now().isoformat()
-    db.document('dashboard/data').set(main_data)
 
-    # Clean and rewrite per-year docs
-    _delete_collection_docs('dashboard_data_by_year')
+    # Per-year docs
     year_set = set()
     for key in per_year_keys:
         per_year_map = dashboard_data.get(key, {}) or {}
         year_set.update(per_year_map.keys())
 
     revenue_trends = dashboard_data.get('revenue_trends', {}) or {}
+    year_docs = {}
     for year in sorted(year_set):
         year_revenue_trends = {
             month_key: value
@@ -109,148 +627,475 @@ def persist_dashboard_data(dashboard_data):
             'monthly_breakdown_by_class': (dashboard_data.get('monthly_breakdown_by_class', {}) or {}).get(year, {}),
             'yearly_breakdown_combined': (dashboard_data.get('yearly_breakdown_combined', {}) or {}).get(year, {}),
             'monthly_breakdown_combined': (dashboard_data.get('monthly_breakdown_combined', {}) or {}).get(year, {}),
-            'last_updated': datetime.now().isoformat()
+            'payment_status_by_month': (dashboard_data.get('payment_status_by_month', {}) or {}).get(year, {})
         }
-        db.document(f'dashboard_data_by_year/{year}').set(payload)
+        year_docs[str(year)] = payload
+    year_entries, year_sync = _stage_version_documents(writer, run_id, 'by_year', year_docs, previous.get('by_year') or {})
 
-    # Clean and rewrite monthly bookings docs
-    _delete_collection_docs('dashboard_monthly_bookings')
-    monthly_doc_count = 0
+    # Monthly bookings docs (one per doc id; the last month key wins as before)
+    monthly_docs = {}
     for year, months in monthly_bookings.items():
         for month, bookings in (months or {}).items():
             try:
                 month_normalized = str(int(float(month)))
             except Exception:
                 month_normalized = str(month)
-            doc_id = f"{year}-{month_normalized}"
-            db.document(f'dashboard_monthly_bookings/{doc_id}').set({
-                'year': str(year),
-                'month': month_normalized,
-                'bookings': bookings,
-                'last_updated': datetime.now().isoformat()
-            })
-            monthly_doc_count += 1
+            monthly_docs[f"{year}-{month_normalized}"] = _monthly_bookings_doc(str(year), month_normalized, bookings)
+    monthly_entries, monthly_sync = _stage_version_documents(
+        writer, run_id, 'monthly_bookings', monthly_docs, previous.get('monthly_bookings') or {}
+    )
+
+    # Single-fetch bundle of the merged shape, with a content ETag for conditional reads
+    bundle = _stage_dashboard_bundle(writer, run_id, dashboard_data, main_data['last_updated'], previous_manifest.get('bundle'))
+
+    # The manifest goes in after every document it references has been committed
+    write_report = writer.commit()
+    write_sharded_document(db, f'{DASHBOARD_VERSIONS}/{run_id}', {
+        'run_id': run_id,
+        'created_at': datetime.now().isoformat(),
+        'main': main_data,
+        'documents': {'by_year': year_entries, 'monthly_bookings': monthly_entries},
+        'bundle': bundle
+    }, lease)
+
+    # Publish: a single-document write, so readers switch versions atomically.
+    # The pointer carries the bundle descriptor so readers can answer 304s from it alone.
+    pointer = {
+        'run_id': run_id,
+        'updated_at': datetime.now().isoformat(),
+        'bundle': bundle,
+        'input_fingerprint': input_fingerprint,
+        'summary': dashboard_data.get('summary') or {}
+    }
+    if lease:
+        lease.publish(DASHBOARD_POINTER_DOC, pointer)
+    else:
+        db.document(DASHBOARD_POINTER_DOC).set(pointer)
+    print(f"Published dashboard version {run_id}")
+
+    # dashboard/data keeps the latest summary for readers that only need that
+    superseded_by = None
+    try:
+        main_doc = write_sharded_document(db, 'dashboard/data', main_data, lease)
+    except Superseded as e:
+        # This version is live all the same; the newer run writes dashboard/data after its own flip
+        superseded_by = e.args[0]
+        print(f"Run {run_id} superseded by {superseded_by} after publishing - leaving dashboard/data to it")
+        main_doc = {'doc': 'dashboard/data', 'shards': None}
+    if lease:
+        lease.release()
 
+    # Old versions are expired by collect_dashboard_versions_on_publish once the pointer moves
     return {
         'main_doc': 'dashboard/data',
+        'main_doc_shards': main_doc['shards'],
+        'run_id': run_id,
+        'superseded_after_publish_by': superseded_by,
         'per_year_docs': len(year_set),
-        'monthly_booking_docs': monthly_doc_count
+        'monthly_booking_docs': len(monthly_docs),
+        'per_year_sync': year_sync,
+        'monthly_booking_sync': monthly_sync,
+        'bundle': {'etag': bundle['etag'], 'size': bundle['size']},
+        'writes': write_report
     }
 
-def persist_occupancy_data(occupancy_data):
-    """Persist processed occupancy data to Firestore."""
+def persist_occupancy_data(occupancy_data, input_fingerprint=None, lease=None):
+    """Persist processed occupancy data to Firestore (sharded when it outgrows one doc).
+
+    With a ``lease``, stops with Superseded as soon as a newer upload registers.
+    """
     db = get_firestore_client()
     if db is None:
         raise RuntimeError("Firestore client not initialized")
+    if lease:
+        lease.acquire()
     payload = {
         **occupancy_data,
-        'last_updated': datetime.now().isoformat()
+        'last_updated': datetime.now().isoformat(),
+        'input_fingerprint': input_fingerprint
     }
-    db.document('occupancy/data').set(payload)
-    return {'doc': 'occupancy/data'}
+    result = write_sharded_document(db, 'occupancy/data', payload, lease)
+    if lease:
+        lease.release()
+    return result
 
-def load_and_clean_data(csv_content: str):
-    """Load and clean the booking data from CSV string with multi-row header"""
-    # Lazy import to speed up module load time during deployment analysis
+def _combine_header_rows(row12, row13):
+    """Combine the main header row (12) with the revenue category row (13)"""
+    # Use row13 values where they exist and are meaningful
+    combined_headers = list(row12)
+    for i in range(len(combined_headers)):
+        if i < len(row13):
+            row13_val = row13[i].strip().strip('"')
+            if row13_val and 'Unnamed' not in row13_val:
+                combined_headers[i] = row13_val
+
+    # Add any additional columns from row13 if it's longer
+    for i in range(len(combined_headers), len(row13)):
+        row13_val = row13[i].strip().strip('"')
+        if row13_val and 'Unnamed' not in row13_val:
+            combined_headers.append(row13_val)
+        else:
+            combined_headers.append(f"Column_{i+1}")
+
+    return combined_headers
+
+def _dedupe_column_names(headers):
+    """Name blank headers and de-duplicate repeats the same way pandas does for a header row"""
+    names = []
+    counts = defaultdict(int)
+    for i, col in enumerate(headers):
+        col = str(col)
+        if col == '':
+            col = f"Unnamed: {i}"
+        cur_count = counts[col]
+        while cur_count > 0:
+            counts[col] = cur_count + 1
+            col = f"{col}.{cur_count}"
+            cur_count = counts[col]
+        names.append(col)
+        counts[col] = cur_count + 1
+    return names
+
+# Resolved booking schemas keyed by header fingerprint (reused across warm invocations)
+_booking_schema_cache = {}
+
+def _header_fingerprint(columns, revenue_columns=()):
+    """Stable fingerprint of an export's column layout"""
+    layout = '\x1f'.join(str(c) for c in columns) + '\x1e' + '\x1f'.join(str(c) for c in revenue_columns)
+    return hashlib.sha1(layout.encode('utf-8')).hexdigest()
+
+def _resolve_column(columns, desired_name):
+    """Find a column by name (exact match first, then case-insensitive, whitespace-tolerant)"""
+    if desired_name in columns:
+        return desired_name
+    desired_normalized = desired_name.strip().lower()
+    for col in columns:
+        if str(col).strip().lower() == desired_normalized:
+            return col
+    return None
+
+# Revenue line items reported as "top extras"
+EXTRA_REVENUE_MARKERS = ['Bar:', 'Curio:', 'F&B', 'Game Drive', 'Fishing', 'Private guide']
+
+class BookingSchema:
+    """Column plan for one booking export layout, resolved once from its header rows.
+
+    Every pipeline stage looks columns up through ``column()`` instead of scanning ``df.columns``.
+    """
+
+    DATE_COLUMNS = ['Arrival date', 'Departure date']
+
+    # Note: "Accommodation" is a sub-column under "Revenue Accommodation" in the CSV
+    # "Revenue Total" is the total revenue column
+    NUMERIC_COLUMNS = ['Bed nights', 'PAX', 'Accommodation', 'Revenue Total', 'Total amount outstanding', 'Payments']
+
+    TEXT_COLUMNS = ['Property', 'Reservation #', 'Reservation name', 'Status', 'Source', 'Agent']
+
+    # Columns added by the pipeline itself
+    DERIVED_COLUMNS = ['Booking Class', 'Income', 'Disbursements']
+
+    # Income columns (sum of all revenue-related columns)
+    INCOME_COLUMNS = [
+        'WOMEN JEWELRY', 'Shop Purchases', 'Service Fee', 'Private guide and vehicle',
+        'Private guide and boat', 'POS Misc', 'Operational', 'Miscellaneous', 'MEN JEWELRY',
+        'Luxury Family Suite', 'Luxury Double Suite', 'Lunch ', 'Gratuity', 'Generator Fees',
+        'Game Drive National Park', 'Game Drive GMA', 'Fuel', 'Fishing National Park full-day 26',
+        'Fishing National Park', 'Fishing GMA', 'F&B', 'F & B', 'Extra Activity in the GMA',
+        'Early Check-In / Late Check-Out', 'Dual Property Booking - Baines\' and Matusadona - T',
+        'Drinks Tab', 'Curio: VR Prints', 'Curio: Short Sleeve', 'Curio: Luggage',
+        'Curio: Long Sleeve', 'Curio: Jacket', 'Curio: Head & Waist Wear', 'Curio: Golfers',
+        'Curio: Dress', 'Curio Shop', 'CURIO', 'COVID TEST - BRC', 'Booking Fee',
+        'Boat Cruises GMA', 'Barter Agreement', 'Bar: White Wine', 'Bar: White House',
+        'Bar: Whisky', 'Bar: Vodka', 'Bar: Soft Drinks', 'Bar: Single Malt', 'Bar: Rum',
+        'Bar: Rose House', 'Bar: Red Wine', 'Bar: Red House', 'Bar: Liqueurs', 'Bar: Gin',
+        'Bar: Cordials', 'Bar: Comp/Kitchen', 'Bar: Cider', 'Bar: Champagne / Sparkling',
+        'Bar: Brandy', 'Bar: Beer', 'Bar: Aperitif', 'Baines\' River Camp',
+        'BAR: ISLAND SUNDOWNERS', 'BAR: CORKAGE', 'Accommodation at Baine\'s',
+        'Accommodation'
+    ]
+
+    DISCOUNT_COLUMNS = ['10% Discount']
+
+    def __init__(self, columns, revenue_columns=()):
+        columns = list(columns)
+        self.fingerprint = _header_fingerprint(columns, revenue_columns)
+        self.export_columns = columns
+
+        # Where each canonical column is read from in the raw export
+        self.source_columns = {}
+        for name in self.DATE_COLUMNS + self.NUMERIC_COLUMNS + self.TEXT_COLUMNS:
+            self.source_columns[name] = _resolve_column(columns, name)
+
+        # Where each canonical column lives once load_and_clean_data has run.
+        # Dates and key numerics are copied under their canonical name.
+        self.columns = {}
+        for name in self.TEXT_COLUMNS:
+            self.columns[name] = self.source_columns[name]
+        for name in self.DATE_COLUMNS + self.NUMERIC_COLUMNS:
+            self.columns[name] = name if self.source_columns[name] else None
+        if self.columns['Arrival date']:
+            self.columns['Year'] = 'Year'
+            self.columns['Month'] = 'Month'
+        else:
+            self.columns['Year'] = _resolve_column(columns, 'Year')
+            self.columns['Month'] = _resolve_column(columns, 'Month')
+        for name in self.DERIVED_COLUMNS:
+            self.columns[name] = name
+
+        cleaned_columns = set(columns) | {c for c in self.columns.values() if c}
+        self.income_columns = [c for c in self.INCOME_COLUMNS if c in cleaned_columns]
+        self.discount_columns = [c for c in self.DISCOUNT_COLUMNS if c in cleaned_columns]
+
+        # Revenue line items (row 13 sub-headers) that are neither income nor discounts;
+        # they only reach the dashboard through Disbursements
+        classified = set(self.income_columns) | set(self.discount_columns) | set(self.NUMERIC_COLUMNS)
+        self.unclassified_revenue_columns = [c for c in revenue_columns if c in cleaned_columns and c not in classified]
+
+        # Conversions load_and_clean_data applies, per canonical column: 'datetime' parses
+        # dates, 'numeric' coerces to numbers with missing values as 0 (income and discount
+        # columns are converted later, by calculate_income_and_disbursements)
+        self.dtypes = {}
+        for name in self.DATE_COLUMNS:
+            if self.columns[name]:
+                self.dtypes[name] = 'datetime'
+        for name in self.NUMERIC_COLUMNS:
+            if self.columns[name]:
+                self.dtypes[name] = 'numeric'
+
+        # Date formats are detected from the first upload of this layout
+        self.date_formats = {name: None for name in self.DATE_COLUMNS if self.columns[name]}
+
+    @classmethod
+    def for_columns(cls, columns, revenue_columns=()):
+        """Return the cached schema for this header layout, resolving it on first sight"""
+        fingerprint = _header_fingerprint(columns, revenue_columns)
+        schema = _booking_schema_cache.get(fingerprint)
+        if schema is None:
+            schema = cls(columns, revenue_columns)
+            _booking_schema_cache[fingerprint] = schema
+            print(f"Resolved booking schema {fingerprint[:12]} ({len(columns)} columns)")
+        else:
+            print(f"Reusing cached booking schema {fingerprint[:12]}")
+        return schema
+
+    def column(self, name):
+        """Column holding the canonical field ``name`` in the cleaned frame, or None"""
+        return self.columns.get(name)
+
+    def projection(self, extra_columns=()):
+        """Export columns the aggregation path reads, plus ``extra_columns`` (canonical or export names)"""
+        needed = {c for c in list(self.source_columns.values()) + list(self.columns.values()) if c}
+        needed.update(self.income_columns, self.discount_columns, self.unclassified_revenue_columns)
+        needed.update(c for c in self.export_columns if any(extra in c for extra in EXTRA_REVENUE_MARKERS))
+        for name in extra_columns:
+            needed.add(self.source_columns.get(name) or _resolve_column(self.export_columns, name) or name)
+        return [c for c in self.export_columns if c in needed]
+
+    def parse_dates(self, series, name):
+        """Convert a raw date column using the layout's date format"""
+        import pandas as pd
+        date_format = self.date_formats.get(name)
+        if date_format is None:
+            date_format = _guess_date_format(series)
+            self.date_formats[name] = date_format
+        elif not _date_format_matches(series, date_format):
+            date_format = _guess_date_format(series)
+            self.date_formats[name] = date_format
+        return pd.to_datetime(series, format=date_format, errors='coerce')
+
+def _first_valid_value(series):
+    """First non-null value of a Series, or None"""
+    index = series.first_valid_index()
+    return None if index is None else series.loc[index]
+
+def _guess_date_format(series):
+    """Guess a strftime format from the first non-null value (None lets pandas infer)"""
+    try:
+        from pandas.tseries.api import guess_datetime_format
+    except ImportError:
+        return None
+    value = _first_valid_value(series)
+    if not isinstance(value, str):
+        return None
+    return guess_datetime_format(value)
+
+def _date_format_matches(series, date_format):
+    """Check that a cached date format still parses this upload's first date"""
+    value = _first_valid_value(series)
+    if not isinstance(value, str):
+        return True
+    try:
+        datetime.strptime(value, date_format)
+        return True
+    except ValueError:
+        return False
+
+# Row parser for booking exports: 'auto' uses pyarrow when it is installed, 'c' forces the pandas C parser
+CSV_BACKEND = os.environ.get('BOOKING_CSV_BACKEND', 'auto')
+
+def _pyarrow_available():
+    """Check whether the pyarrow CSV reader can be imported"""
+    try:
+        import pyarrow.csv  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def _read_booking_rows_c(buffer, column_names, usecols=None):
+    """Parse the data rows with the single-threaded pandas C parser"""
+    import pandas as pd
+    try:
+        return pd.read_csv(buffer, header=None, names=column_names, usecols=usecols)
+    except pd.errors.EmptyDataError:
+        # Header rows only, no bookings
+        return pd.DataFrame(columns=column_names if usecols is None else usecols)
+
+def _read_booking_rows_arrow(data, column_names, usecols=None):
+    """Parse the data rows with the multi-threaded pyarrow CSV reader.
+
+    Low-cardinality text columns are dictionary-encoded while parsing and all
+    text stays Arrow-backed; numeric columns get the NumPy dtypes the C parser
+    would produce.
+    """
     import pandas as pd
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
 
-    print("Loading booking data from CSV...")
-    
-    # Split into lines to handle multi-row header
-    lines = csv_content.split('\n')
-    print(f"Total lines in CSV: {len(lines)}")
-    
+    if not data.strip():
+        return pd.DataFrame(columns=column_names if usecols is None else usecols)
+    table = pa_csv.read_csv(
+        pa.py_buffer(data.encode('utf-8')),
+        read_options=pa_csv.ReadOptions(column_names=column_names, use_threads=True),
+        parse_options=pa_csv.ParseOptions(newlines_in_values=True),
+        convert_options=pa_csv.ConvertOptions(
+            include_columns=usecols,
+            strings_can_be_null=True,
+            auto_dict_encode=True,
+            # Dates stay text so BookingSchema parses them the same way for both backends
+            timestamp_parsers=[]
+        )
+    )
+
+    # Dictionary-encoded text is handed to pandas as Arrow strings: the business
+    # rules need .str and the aggregations group on plain values, not categories
+    def arrow_text(arrow_type):
+        if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type) or pa.types.is_dictionary(arrow_type):
+            return pd.ArrowDtype(pa.string())
+        return None
+
+    return table.to_pandas(types_mapper=arrow_text)
+
+def _read_booking_rows(buffer, column_names, backend=None, usecols=None):
+    """Parse the data rows that follow the header preamble (only ``usecols`` when given).
+
+    The pyarrow backend falls back to the C parser when pyarrow is not installed
+    or rejects the file (e.g. ragged rows, which the C parser pads with NaN).
+    """
+    backend = (backend or CSV_BACKEND).lower()
+    if backend in ('auto', 'pyarrow'):
+        if _pyarrow_available():
+            data = buffer.read()
+            try:
+                df = _read_booking_rows_arrow(data, column_names, usecols)
+                print(f"Parsed {len(df)} rows with the pyarrow CSV reader")
+                return df
+            except Exception as e:
+                print(f"Warning: pyarrow CSV reader failed ({e}), falling back to the C parser")
+                buffer = io.StringIO(data)
+        elif backend == 'pyarrow':
+            print("Warning: pyarrow is not installed, falling back to the C parser")
+    return _read_booking_rows_c(buffer, column_names, usecols)
+
+def _read_booking_header(buffer):
+    """Consume the 13-row preamble from ``buffer``.
+
+    Returns the raw column names, the whitespace-stripped names and the revenue sub-headers.
+    """
     # The CSV has:
     # Rows 1-11 (indices 0-10): Metadata rows
     # Row 12 (index 11): Main column headers
     # Row 13 (index 12): Revenue category headers
     # Row 14+ (index 13+): Actual data
+    #
+    # Read the preamble record-by-record so quoted fields containing newlines are kept intact
+    preamble = list(itertools.islice(csv_module.reader(buffer), 13))
     
     # Parse row 12 (index 11) - main headers
-    row12 = list(csv_module.reader([lines[11]]))[0] if len(lines) > 11 else []
+    row12 = preamble[11] if len(preamble) > 11 else []
     print(f"Row 12 has {len([c for c in row12 if c.strip()])} non-empty columns")
     
     # Parse row 13 (index 12) - revenue headers
-    row13 = list(csv_module.reader([lines[12]]))[0] if len(lines) > 12 else []
+    row13 = preamble[12] if len(preamble) > 12 else []
     print(f"Row 13 has {len([c for c in row13 if c.strip()])} non-empty columns")
     
-    # Combine headers: use row13 values where they exist and are meaningful
-    combined_headers = list(row12)
-    for i in range(len(combined_headers)):
-        if i < len(row13):
-            row13_val = row13[i].strip().strip('"')
-            if row13_val and row13_val != '' and 'Unnamed' not in row13_val:
-                combined_headers[i] = row13_val
-    
-    # Add any additional columns from row13 if it's longer
-    if len(row13) > len(combined_headers):
-        for i in range(len(combined_headers), len(row13)):
-            row13_val = row13[i].strip().strip('"')
-            if row13_val and row13_val != '' and 'Unnamed' not in row13_val:
-                combined_headers.append(row13_val)
-            else:
-                combined_headers.append(f"Column_{i+1}")
-    
+    combined_headers = _combine_header_rows(row12, row13)
     print(f"Combined header has {len(combined_headers)} columns")
     
-    # Create a new CSV string with the fixed header
-    fixed_lines = []
-    # Add metadata rows 1-10
-    for i in range(min(10, len(lines))):
-        fixed_lines.append(lines[i])
-    
-    # Add empty row (skip grouping row)
-    fixed_lines.append('')
-    
-    # Add combined header
-    fixed_lines.append(','.join(['"' + str(h).replace('"', '""') + '"' for h in combined_headers]))
-    
-    # Add data rows starting from index 13 (original row 14)
-    for i in range(13, len(lines)):
-        if lines[i].strip():  # Only add non-empty lines
-            fixed_lines.append(lines[i])
-    
-    # Join back into CSV string
-    fixed_csv = '\n'.join(fixed_lines)
+    column_names = _dedupe_column_names(combined_headers)
+    cleaned_names = [name.strip() for name in column_names]
+    revenue_columns = [
+        cleaned_names[i] for i, value in enumerate(row13)
+        if i < len(cleaned_names) and value.strip().strip('"') and 'Unnamed' not in value
+    ]
+    return column_names, cleaned_names, revenue_columns
+
+# Columns an export must have for the dashboard aggregates to mean anything
+BOOKING_REQUIRED_COLUMNS = ['Arrival date', 'Revenue Total']
+
+def validate_booking_header(csv_content):
+    """Resolve the BookingSchema from the header rows alone; raises ValueError when key columns are missing"""
+    _, cleaned_names, revenue_columns = _read_booking_header(io.StringIO(csv_content))
+    schema = BookingSchema.for_columns(cleaned_names, revenue_columns)
+    missing = [name for name in BOOKING_REQUIRED_COLUMNS if not schema.source_columns[name]]
+    if missing:
+        raise ValueError(f"Booking export header is missing required columns: {', '.join(missing)}")
+    return schema
+
+def load_and_clean_data(csv_content: str, backend=None, columns=None):
+    """Load and clean the booking data from CSV string with multi-row header.
+
+    backend selects the row parser ('auto', 'pyarrow' or 'c'; see _read_booking_rows).
+    columns=None loads every export column; otherwise only the columns the
+    aggregations need plus ``columns`` (e.g. the booking fields a view emits) are parsed.
+    Returns the cleaned DataFrame and the BookingSchema resolved for its layout.
+    """
+    # Lazy import to speed up module load time during deployment analysis
+    import pandas as pd
+
+    print("Loading booking data from CSV...")
     
-    # Read CSV with skiprows to skip metadata rows (first 11 rows + empty row = 12 rows to skip)
-    df = pd.read_csv(io.StringIO(fixed_csv), skiprows=11, nrows=None)
+    # Read the preamble from the same buffer the parser continues from (now
+    # positioned at the first data row), then resolve (or reuse) the column plan
+    # for this export layout before any data row is parsed
+    buffer = io.StringIO(csv_content)
+    column_names, cleaned_names, revenue_columns = _read_booking_header(buffer)
+    schema = BookingSchema.for_columns(cleaned_names, revenue_columns)
+    
+    # Only parse the columns this request needs
+    usecols = None
+    if columns is not None:
+        wanted = set(schema.projection(columns))
+        usecols = [raw for raw, name in zip(column_names, cleaned_names) if name in wanted]
+        print(f"Parsing {len(usecols)} of {len(column_names)} columns")
+    df = _read_booking_rows(buffer, column_names, backend, usecols)
     
     # Clean column names - normalize whitespace
     df.columns = df.columns.str.strip()
     
-    # Helper function to get column name (case-insensitive, whitespace-tolerant)
-    def get_column_name(desired_name):
-        desired_normalized = desired_name.strip().lower()
-        # Try exact match first
-        if desired_name in df.columns:
-            return desired_name
-        # Try case-insensitive match
-        for col in df.columns:
-            if col.strip().lower() == desired_normalized:
-                return col
-        return None
-    
     # Convert date columns
-    arrival_col = get_column_name('Arrival date')
-    if arrival_col:
-        df['Arrival date'] = pd.to_datetime(df[arrival_col], errors='coerce')
-    departure_col = get_column_name('Departure date')
-    if departure_col:
-        df['Departure date'] = pd.to_datetime(df[departure_col], errors='coerce')
+    for date_col, dtype in schema.dtypes.items():
+        if dtype == 'datetime':
+            df[date_col] = schema.parse_dates(df[schema.source_columns[date_col]], date_col)
     
     # Extract year and month
-    if 'Arrival date' in df.columns:
+    if schema.column('Arrival date'):
         df['Year'] = df['Arrival date'].dt.year
         df['Month'] = df['Arrival date'].dt.month
     
-    # Convert numeric columns - use flexible column lookup
-    # Note: "Accommodation" is a sub-column under "Revenue Accommodation" in the CSV
-    # "Revenue Total" is the total revenue column
-    numeric_columns = ['Bed nights', 'PAX', 'Accommodation', 'Revenue Total', 'Total amount outstanding', 'Payments']
-    for desired_col in numeric_columns:
-        actual_col = get_column_name(desired_col)
-        if actual_col:
+    # Convert numeric columns, keeping the standard name alongside the export's own
+    for desired_col, dtype in schema.dtypes.items():
+        if dtype == 'numeric':
+            actual_col = schema.source_columns[desired_col]
             df[actual_col] = pd.to_numeric(df[actual_col], errors='coerce').fillna(0)
             # Also set the standard name if different (for backward compatibility)
             if actual_col != desired_col:
@@ -259,72 +1104,151 @@ def load_and_clean_data(csv_content: str):
     # Debug: Print available columns to help diagnose issues
     print(f"Available columns (first 30): {list(df.columns)[:30]}")
     print(f"Looking for key columns:")
-    print(f"  - 'Accommodation': {get_column_name('Accommodation')}")
-    print(f"  - 'Revenue Total': {get_column_name('Revenue Total')}")
-    print(f"  - 'Arrival date': {get_column_name('Arrival date')}")
-    print(f"  - 'Status': {get_column_name('Status')}")
-    print(f"  - 'Reservation #': {get_column_name('Reservation #')}")
-    print(f"  - 'Reservation name': {get_column_name('Reservation name')}")
-    print(f"  - 'Source': {get_column_name('Source')}")
+    for key_col in ['Accommodation', 'Revenue Total', 'Arrival date', 'Status', 'Reservation #', 'Reservation name', 'Source']:
+        print(f"  - '{key_col}': {schema.column(key_col)}")
     
     print(f"Loaded {len(df)} bookings")
-    return df
+    return df, schema
+
+# Bundled default rules; an edited copy in Firestore (business_rules_config/booking) takes precedence
+_BUSINESS_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'business_rules.json')
+
+# Compiled business rules keyed by config fingerprint
+_business_rules_cache = {}
+
+# Config fields holding lists of strings: (section or None for top level, field)
+BUSINESS_RULES_LIST_FIELDS = [
+    (None, 'excluded_properties'),
+    ('staff_filter', 'keywords'),
+    ('staff_filter', 'exception_reservations'),
+    ('staff_filter', 'exception_sources'),
+    (None, 'zero_accommodation_exceptions'),
+]
+
+def validate_business_rules_config(config, source):
+    """Raise ValueError unless every list field of the config is a list of strings (missing is fine)"""
+    if not isinstance(config, dict):
+        raise ValueError(f"Business rules in {source} must be an object, got {type(config).__name__}")
+    staff_filter = config.get('staff_filter')
+    if staff_filter is not None and not isinstance(staff_filter, dict):
+        raise ValueError(f"Business rules in {source}: 'staff_filter' must be an object, got {type(staff_filter).__name__}")
+    for section, field in BUSINESS_RULES_LIST_FIELDS:
+        container = config if section is None else (config.get(section) or {})
+        value = container.get(field)
+        name = field if section is None else f"{section}.{field}"
+        if value is None:
+            continue
+        if not isinstance(value, list):
+            raise ValueError(f"Business rules in {source}: '{name}' must be a list of strings, got {type(value).__name__} {value!r}")
+        invalid = [item for item in value if not isinstance(item, str)]
+        if invalid:
+            raise ValueError(f"Business rules in {source}: '{name}' must only hold strings, got {invalid[:5]!r}")
+    return config
 
-def apply_business_rules(df):
-    # Lazy import
+def load_business_rules_config():
+    """Load the business rules config from Firestore, falling back to the bundled file.
+
+    Raises ValueError when the config's list fields are not lists of strings.
+    """
+    db = get_firestore_client()
+    if db is not None:
+        try:
+            snapshot = db.document('business_rules_config/booking').get()
+        except Exception as e:
+            print(f"Warning: Could not read business rules from Firestore: {e}")
+            snapshot = None
+        if snapshot is not None and snapshot.exists:
+            print("Using business rules from business_rules_config/booking")
+            return validate_business_rules_config(snapshot.to_dict(), 'business_rules_config/booking')
+    with open(_BUSINESS_RULES_PATH, 'r', encoding='utf-8') as f:
+        return validate_business_rules_config(json.load(f), os.path.basename(_BUSINESS_RULES_PATH))
+
+def _config_fingerprint(config):
+    """Stable fingerprint of a config document"""
+    return hashlib.sha1(json.dumps(config, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+class BusinessRules:
+    """Booking filter/classification rules compiled from a config document.
+
+    Keyword lists become one case-insensitive alternation regex and exception
+    lists become sets, so each rule costs a single vectorized scan.
+    """
+
+    def __init__(self, config):
+        self.fingerprint = _config_fingerprint(config)
+        staff_filter = config.get('staff_filter', {}) or {}
+        self.excluded_properties = frozenset(config.get('excluded_properties', []) or [])
+        self.staff_pattern = self._alternation(staff_filter.get('keywords', []))
+        self.staff_exception_reservations = frozenset(staff_filter.get('exception_reservations', []) or [])
+        self.staff_exception_source_pattern = self._alternation(staff_filter.get('exception_sources', []))
+        self.zero_accommodation_exceptions = frozenset(config.get('zero_accommodation_exceptions', []) or [])
+
+    @staticmethod
+    def _alternation(terms):
+        """Compile literal terms into one case-insensitive regex (None when there are no terms)"""
+        terms = [str(term) for term in (terms or []) if str(term)]
+        if not terms:
+            return None
+        return re.compile('|'.join(re.escape(term) for term in terms), re.IGNORECASE)
+
+    @classmethod
+    def from_config(cls, config):
+        """Return the compiled rules for this config, compiling it on first sight"""
+        fingerprint = _config_fingerprint(config)
+        rules = _business_rules_cache.get(fingerprint)
+        if rules is None:
+            rules = cls(config)
+            _business_rules_cache[fingerprint] = rules
+        return rules
+
+def _str_matches(series, pattern):
+    """Boolean mask of cells matching a compiled regex (missing -> False).
+
+    The pattern is passed as source plus case flag because Arrow-backed string
+    columns accept neither compiled patterns nor re flags.
+    """
+    ignore_case = bool(pattern.flags & re.IGNORECASE)
+    return series.str.contains(pattern.pattern, case=not ignore_case, na=False).astype(bool)
+
+def apply_business_rules(df, schema, rules=None):
+    # Lazy imports
     import pandas as pd
+    import numpy as np
+
+    """Apply all business rules to filter and categorize data.
 
-    """Apply all business rules to filter and categorize data"""
+    Returns the filtered DataFrame and the number of bookings each rule hit.
+    """
     print("Applying business rules...")
+    if rules is None:
+        rules = BusinessRules.from_config(load_business_rules_config())
     
-    # Helper function to get column name (case-insensitive, whitespace-tolerant)
-    def get_column_name(df, desired_name):
-        desired_normalized = desired_name.strip().lower()
-        # Try exact match first
-        if desired_name in df.columns:
-            return desired_name
-        # Try case-insensitive match
-        for col in df.columns:
-            if col.strip().lower() == desired_normalized:
-                return col
-        return None
+    no_match = pd.Series(np.zeros(len(df), dtype=bool), index=df.index)
     
-    # Rule 1: Remove MV-Matusadona bookings
-    print("Applying Rule 1: Filtering out MV-Matusadona bookings...")
-    initial_count = len(df)
-    property_col = get_column_name(df, 'Property')
+    # Rule 1: Remove bookings for excluded properties (MV-Matusadona)
+    print("Applying Rule 1: Filtering out excluded property bookings...")
+    property_col = schema.column('Property')
+    property_mask = no_match
     if property_col:
-        df = df[df[property_col] != 'MV - Matusadona'].copy()
-        filtered_count = initial_count - len(df)
-        print(f"  Removed {filtered_count} MV-Matusadona bookings")
+        property_mask = df[property_col].isin(rules.excluded_properties)
     else:
         print(f"  Warning: 'Property' column not found. Available columns: {list(df.columns)[:10]}")
-        print(f"  Skipping MV-Matusadona filter")
+        print(f"  Skipping excluded property filter")
     
     # Rule 2: Remove bookings containing specific names EXCEPT specific booking numbers AND "Return Guests" source
     print("Applying Rule 2: Filtering out staff/management bookings...")
-    keywords = ['Scott', 'Brown', 'Craig', 'Featherby', 'TWF', 'Staff']
-    exceptions = ['WB3703', 'WB4118', 'WB2748', 'WB4001', 'WB3556', 'WB4121', 'WB4194', 'WB4362']
-    
-    reservation_name_col = get_column_name(df, 'Reservation name')
-    reservation_num_col = get_column_name(df, 'Reservation #')
-    source_col = get_column_name(df, 'Source')
+    reservation_name_col = schema.column('Reservation name')
+    reservation_num_col = schema.column('Reservation #')
+    source_col = schema.column('Source')
     
+    keyword_mask = no_match
+    staff_exception_mask = no_match
     if reservation_name_col and reservation_num_col and source_col:
-        mask_to_remove = pd.Series([False] * len(df), index=df.index)
-        for keyword in keywords:
-            keyword_mask = df[reservation_name_col].str.contains(keyword, case=False, na=False)
-            # Keep exceptions
-            exception_mask = df[reservation_num_col].isin(exceptions)
-            # Keep "Return Guests" source
-            return_guests_mask = df[source_col].str.contains('Return Guests', case=False, na=False)
-            # Remove those matching keyword but not in exceptions AND not "Return Guests"
-            mask_to_remove = mask_to_remove | (keyword_mask & ~exception_mask & ~return_guests_mask)
-        
-        initial_count = len(df)
-        df = df[~mask_to_remove].copy()
-        filtered_count = initial_count - len(df)
-        print(f"  Removed {filtered_count} staff/management bookings")
+        if rules.staff_pattern is not None:
+            keyword_mask = _str_matches(df[reservation_name_col], rules.staff_pattern)
+        staff_exception_mask = df[reservation_num_col].isin(rules.staff_exception_reservations)
+        if rules.staff_exception_source_pattern is not None:
+            staff_exception_mask = staff_exception_mask | _str_matches(df[source_col], rules.staff_exception_source_pattern)
     else:
         missing_cols = []
         if not reservation_name_col:
@@ -336,81 +1260,90 @@ def apply_business_rules(df):
         print(f"  Warning: Missing columns {missing_cols}. Skipping staff/management filter.")
         print(f"  Available columns: {list(df.columns)[:15]}")
     
+    staff_mask = keyword_mask & ~staff_exception_mask & ~property_mask
+    rule_hits = {
+        'excluded_property': int(property_mask.sum()),
+        'staff_booking': int(staff_mask.sum()),
+        'staff_exception': int((keyword_mask & staff_exception_mask & ~property_mask).sum())
+    }
+    print(f"  Removed {rule_hits['excluded_property']} excluded property bookings")
+    print(f"  Removed {rule_hits['staff_booking']} staff/management bookings")
+    
+    df = df[~(property_mask | staff_mask)].copy()
+    
     # Rules 3 & 4: Create booking classes
     print("Applying Rules 3 & 4: Categorizing bookings...")
     df['Booking Class'] = 'Income Generating'  # Default
     
     # Mark bookings with 0 accommodation as Non-Income Generating (with exceptions)
-    accommodation_col = get_column_name(df, 'Accommodation')
-    reservation_num_col = get_column_name(df, 'Reservation #')
+    accommodation_col = schema.column('Accommodation')
+    rule_hits['non_income_generating'] = 0
+    rule_hits['zero_accommodation_exception'] = 0
     
     if accommodation_col and reservation_num_col:
-        zero_accommodation_exceptions = ['WB3964', 'WB3762', 'WB4193', 'WB4242']
-        zero_accommodation_mask = (df[accommodation_col] == 0) & (~df[reservation_num_col].isin(zero_accommodation_exceptions))
+        zero_accommodation = df[accommodation_col] == 0
+        excepted = df[reservation_num_col].isin(rules.zero_accommodation_exceptions)
+        zero_accommodation_mask = zero_accommodation & ~excepted
         df.loc[zero_accommodation_mask, 'Booking Class'] = 'Non-Income Generating'
+        rule_hits['non_income_generating'] = int(zero_accommodation_mask.sum())
+        rule_hits['zero_accommodation_exception'] = int((zero_accommodation & excepted).sum())
     else:
         print(f"  Warning: Missing 'Accommodation' or 'Reservation #' column. Skipping booking class categorization.")
     
-    income_generating = len(df[df['Booking Class'] == 'Income Generating'])
-    non_income_generating = len(df[df['Booking Class'] == 'Non-Income Generating'])
-    print(f"  Income Generating: {income_generating}")
+    non_income_generating = rule_hits['non_income_generating']
+    print(f"  Income Generating: {len(df) - non_income_generating}")
     print(f"  Non-Income Generating: {non_income_generating}")
     
-    return df
+    return df, rule_hits
 
-def calculate_income_and_disbursements(df):
-    # Lazy import
+def calculate_income_and_disbursements(df, schema):
+    # Lazy imports
     import pandas as pd
+    import numpy as np
 
-    """Calculate Income and Disbursements columns"""
+    """Calculate Income and Disbursements columns.
+
+    Returns the DataFrame and a report of the revenue columns used, including
+    line items that are not classified as income or discounts.
+    """
     print("Calculating Income and Disbursements...")
     
-    # Income columns (sum of all revenue-related columns)
-    income_columns = [
-        'WOMEN JEWELRY', 'Shop Purchases', 'Service Fee', 'Private guide and vehicle',
-        'Private guide and boat', 'POS Misc', 'Operational', 'Miscellaneous', 'MEN JEWELRY',
-        'Luxury Family Suite', 'Luxury Double Suite', 'Lunch ', 'Gratuity', 'Generator Fees',
-        'Game Drive National Park', 'Game Drive GMA', 'Fuel', 'Fishing National Park full-day 26',
-        'Fishing National Park', 'Fishing GMA', 'F&B', 'F & B', 'Extra Activity in the GMA',
-        'Early Check-In / Late Check-Out', 'Dual Property Booking - Baines\' and Matusadona - T',
-        'Drinks Tab', 'Curio: VR Prints', 'Curio: Short Sleeve', 'Curio: Luggage',
-        'Curio: Long Sleeve', 'Curio: Jacket', 'Curio: Head & Waist Wear', 'Curio: Golfers',
-        'Curio: Dress', 'Curio Shop', 'CURIO', 'COVID TEST - BRC', 'Booking Fee',
-        'Boat Cruises GMA', 'Barter Agreement', 'Bar: White Wine', 'Bar: White House',
-        'Bar: Whisky', 'Bar: Vodka', 'Bar: Soft Drinks', 'Bar: Single Malt', 'Bar: Rum',
-        'Bar: Rose House', 'Bar: Red Wine', 'Bar: Red House', 'Bar: Liqueurs', 'Bar: Gin',
-        'Bar: Cordials', 'Bar: Comp/Kitchen', 'Bar: Cider', 'Bar: Champagne / Sparkling',
-        'Bar: Brandy', 'Bar: Beer', 'Bar: Aperitif', 'Baines\' River Camp',
-        'BAR: ISLAND SUNDOWNERS', 'BAR: CORKAGE', 'Accommodation at Baine\'s',
-        'Accommodation'
-    ]
-    
-    # Calculate Income (sum of all income columns, minus discounts)
-    df['Income'] = 0
-    for col in income_columns:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
-            df['Income'] += df[col]
-    
-    # Subtract discounts
-    if '10% Discount' in df.columns:
-        df['10% Discount'] = pd.to_numeric(df['10% Discount'], errors='coerce').fillna(0)
-        df['Income'] -= df['10% Discount']
+    def numeric_block(columns):
+        """Convert columns into one column-major float block (NaN -> 0)"""
+        block = np.empty((len(df), len(columns)), dtype='float64', order='F')
+        for j, col in enumerate(columns):
+            block[:, j] = pd.to_numeric(df[col], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+        np.nan_to_num(block, copy=False)
+        return block
+    
+    # Calculate Income (sum of all income columns, minus discounts). Summing a
+    # column-major block along rows adds the columns in order, as a running total would.
+    income_block = numeric_block(schema.income_columns)
+    discount_block = numeric_block(schema.discount_columns)
+    income = income_block.sum(axis=1)
+    for j in range(discount_block.shape[1]):
+        income -= discount_block[:, j]
+    
+    # Write the cleaned numeric values back for the later stages
+    if schema.income_columns:
+        df[schema.income_columns] = income_block
+    if schema.discount_columns:
+        df[schema.discount_columns] = discount_block
+    df['Income'] = income
+    
+    # Report revenue line items that fall through to Disbursements
+    unclassified_block = numeric_block(schema.unclassified_revenue_columns)
+    unclassified_totals = dict(zip(schema.unclassified_revenue_columns, (float(t) for t in unclassified_block.sum(axis=0))))
+    revenue_report = {
+        'income_columns': len(schema.income_columns),
+        'discount_columns': list(schema.discount_columns),
+        'unclassified_columns': unclassified_totals
+    }
+    if unclassified_totals:
+        print(f"  Warning: {len(unclassified_totals)} revenue columns are not classified as income: {list(unclassified_totals)[:20]}")
     
     # Calculate Disbursements
-    # Helper function to get column name (case-insensitive, whitespace-tolerant)
-    def get_column_name(df, desired_name):
-        desired_normalized = desired_name.strip().lower()
-        # Try exact match first
-        if desired_name in df.columns:
-            return desired_name
-        # Try case-insensitive match
-        for col in df.columns:
-            if col.strip().lower() == desired_normalized:
-                return col
-        return None
-    
-    revenue_total_col = get_column_name(df, 'Revenue Total')
+    revenue_total_col = schema.column('Revenue Total')
     if revenue_total_col:
         df['Disbursements'] = df[revenue_total_col] - df['Income']
         total_income = df['Income'].sum()
@@ -424,87 +1357,137 @@ def calculate_income_and_disbursements(df):
         print(f"  Available columns: {list(df.columns)[:20]}")
         df['Disbursements'] = 0
     
-    return df
+    return df, revenue_report
 
-def process_revenue_and_booking_metrics(df):
-    # Lazy import
+def process_revenue_and_booking_metrics(df, schema):
+    # Lazy imports
     import pandas as pd
+    import numpy as np
     """Process revenue trends and booking metrics"""
     print("Processing revenue and booking metrics...")
     
-    # Helper function to get column name (case-insensitive, whitespace-tolerant)
-    def get_column_name(desired_name):
-        desired_normalized = desired_name.strip().lower()
-        # Try exact match first
-        if desired_name in df.columns:
-            return desired_name
-        # Try case-insensitive match
-        for col in df.columns:
-            if col.strip().lower() == desired_normalized:
-                return col
-        return None
-    
-    arrival_col = get_column_name('Arrival date')
-    year_col = get_column_name('Year')
-    month_col = get_column_name('Month')
-    revenue_col = get_column_name('Revenue Total')
-    bed_nights_col = get_column_name('Bed nights')
+    arrival_col = schema.column('Arrival date')
+    year_col = schema.column('Year')
+    month_col = schema.column('Month')
+    revenue_col = schema.column('Revenue Total')
+    bed_nights_col = schema.column('Bed nights')
     
     if not arrival_col or not year_col or not month_col:
         print(f"  Warning: Missing required columns for revenue trends. Available: {list(df.columns)[:15]}")
         return {}
     
-    # Revenue trends by month
+    # Revenue trends by month, keyed in order of first appearance
+    years = pd.to_numeric(df[year_col], errors='coerce')
+    months = pd.to_numeric(df[month_col], errors='coerce')
+    valid = (df[arrival_col].notna() & years.notna() & months.notna() & (years != 0) & (months != 0)).to_numpy()
+    
+    month_keys = years.to_numpy()[valid].astype('int64') * 100 + months.to_numpy()[valid].astype('int64')
+    codes, uniques = pd.factorize(month_keys)
+    order = np.argsort(codes, kind='stable')
+    counts = np.bincount(codes, minlength=len(uniques))
+    bounds = np.concatenate(([0], np.cumsum(counts)))
+    
+    revenue = None
+    if revenue_col:
+        revenue = np.nan_to_num(pd.to_numeric(df[revenue_col], errors='coerce').to_numpy(dtype='float64')[valid])[order]
+    bed_nights = None
+    if bed_nights_col:
+        bed_nights = np.trunc(np.nan_to_num(pd.to_numeric(df[bed_nights_col], errors='coerce').to_numpy(dtype='float64')[valid])).astype('int64')[order]
+    
     revenue_trends = {}
-    for _, row in df.iterrows():
-        if pd.notna(row[arrival_col]):
-            year = int(row[year_col]) if year_col else None
-            month = int(row[month_col]) if month_col else None
-            
-            if year and month:
-                key = f"{year}-{month:02d}"
-                
-                if key not in revenue_trends:
-                    revenue_trends[key] = {
-                        'revenue': 0,
-                        'bookings': 0,
-                        'bed_nights': 0
-                    }
-                
-                if revenue_col:
-                    revenue_trends[key]['revenue'] += float(row[revenue_col]) if pd.notna(row[revenue_col]) else 0
-                revenue_trends[key]['bookings'] += 1
-                if bed_nights_col:
-                    revenue_trends[key]['bed_nights'] += int(row[bed_nights_col]) if pd.notna(row[bed_nights_col]) else 0
+    for i, month_key in enumerate(uniques):
+        start, stop = bounds[i], bounds[i + 1]
+        revenue_trends[f"{month_key // 100}-{month_key % 100:02d}"] = {
+            # cumsum adds in row order, so totals match a row-by-row running sum exactly
+            'revenue': float(np.cumsum(revenue[start:stop])[-1]) if revenue is not None else 0,
+            'bookings': int(counts[i]),
+            'bed_nights': int(bed_nights[start:stop].sum()) if bed_nights is not None else 0
+        }
     
     return revenue_trends
 
-def create_breakdowns(df):
+# Fields read by the booking-details table (components/BreakdownTable.tsx)
+BOOKING_DETAILS_COLUMNS = [
+    'Reservation #', 'Reservation name', 'Status', 'Booking Class', 'Agent', 'Source',
+    'Arrival date', 'Departure date', 'Bed nights', 'PAX', 'Accommodation', 'Income',
+    'Revenue Total', 'Total amount outstanding'
+]
+
+def _json_scalar(value):
+    """Convert a single cell to the JSON value used in booking records"""
+    import pandas as pd
+    if pd.isna(value):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if hasattr(value, 'isoformat'):
+        try:
+            return value.isoformat()
+        except Exception:
+            return str(value)
+    return str(value)
+
+def _column_to_json_values(series):
+    """Convert a whole column to JSON values at once (NaN -> None, numbers -> float, dates -> ISO)"""
+    import pandas as pd
+    import numpy as np
+    if pd.api.types.is_numeric_dtype(series.dtype):
+        values = series.to_numpy(dtype='float64', na_value=np.nan)
+        converted = values.astype(object)
+        converted[np.isnan(values)] = None
+        return converted
+    # Convert each distinct value once; missing values factorize to -1, which picks the trailing None
+    codes, uniques = pd.factorize(series)
+    lookup = np.empty(len(uniques) + 1, dtype=object)
+    lookup[:len(uniques)] = [_json_scalar(value) for value in uniques]
+    lookup[-1] = None
+    return lookup[codes]
+
+# Payment status buckets, in classification order
+PAYMENT_STATUS_BUCKETS = ['fully_paid', 'partially_paid', 'unpaid', 'overpaid']
+
+def _classify_payment_status(outstanding, revenue):
+    """Bucket index into PAYMENT_STATUS_BUCKETS for every booking (-1 when none applies)"""
+    import pandas as pd
+    import numpy as np
+    outstanding = np.nan_to_num(pd.to_numeric(outstanding, errors='coerce').to_numpy(dtype='float64'))
+    revenue = np.nan_to_num(pd.to_numeric(revenue, errors='coerce').to_numpy(dtype='float64'))
+    return np.select(
+        [
+            (outstanding <= 0) & (revenue > 0),
+            (outstanding > 0) & (outstanding < revenue),
+            (outstanding > 0) & (outstanding >= revenue),
+            outstanding < 0
+        ],
+        [0, 1, 2, 3],
+        default=-1
+    )
+
+# Breakdown measures reported as floats (the rest are integer counts)
+_FLOAT_MEASURES = {'accommodation', 'income', 'disbursements', 'revenue_total', 'outstanding'}
+
+def _box_scalar(value):
+    """Convert a NumPy scalar group key to the equivalent Python scalar"""
+    return value.item() if hasattr(value, 'item') else value
+
+def create_breakdowns(df, schema, booking_columns=None):
     # Lazy imports
     import pandas as pd
     import numpy as np
 
-    """Create various breakdowns for the dashboard"""
+    """Create various breakdowns for the dashboard.
+
+    ``booking_columns`` limits the fields emitted per booking in ``monthly_bookings``
+    (canonical names, e.g. BOOKING_DETAILS_COLUMNS); None emits every column.
+    """
     print("Creating breakdowns...")
     
-    # Helper function to get column name (case-insensitive, whitespace-tolerant)
-    def get_column_name(desired_name):
-        desired_normalized = desired_name.strip().lower()
-        # Try exact match first
-        if desired_name in df.columns:
-            return desired_name
-        # Try case-insensitive match
-        for col in df.columns:
-            if col.strip().lower() == desired_normalized:
-                return col
-        return None
-    
     # Get column names with fallbacks
-    revenue_col = get_column_name('Revenue Total')
-    bed_nights_col = get_column_name('Bed nights')
-    pax_col = get_column_name('PAX')
-    outstanding_col = get_column_name('Total amount outstanding')
-    booking_class_col = get_column_name('Booking Class')
+    revenue_col = schema.column('Revenue Total')
+    bed_nights_col = schema.column('Bed nights')
+    pax_col = schema.column('PAX')
+    outstanding_col = schema.column('Total amount outstanding')
+    booking_class_col = schema.column('Booking Class')
     
     # Summary statistics
     total_revenue = float(df[revenue_col].sum()) if revenue_col else 0.0
@@ -525,216 +1508,181 @@ def create_breakdowns(df):
     }
     
     # Get additional column names needed for breakdowns
-    status_col = get_column_name('Status')
-    source_col = get_column_name('Source')
-    agent_col = get_column_name('Agent')
-    year_col = get_column_name('Year')
-    month_col = get_column_name('Month')
-    accommodation_col = get_column_name('Accommodation')
-    income_col = get_column_name('Income')
-    disbursements_col = get_column_name('Disbursements')
+    status_col = schema.column('Status')
+    source_col = schema.column('Source')
+    agent_col = schema.column('Agent')
+    year_col = schema.column('Year')
+    month_col = schema.column('Month')
+    accommodation_col = schema.column('Accommodation')
+    income_col = schema.column('Income')
+    disbursements_col = schema.column('Disbursements')
+    
+    # Aggregate every measure once over (Year, Month, Booking Class, Status).
+    # The per-status, per-class and per-period breakdowns are roll-ups of this cube.
+    measure_cols = {
+        'pax': pax_col,
+        'bed_nights': bed_nights_col,
+        'accommodation': accommodation_col,
+        'income': income_col,
+        'disbursements': disbursements_col,
+        'revenue_total': revenue_col,
+        'outstanding': outstanding_col
+    }
+    cube_dims = [col for col in (year_col, month_col, booking_class_col, status_col) if col]
+    cube = None
+    if cube_dims:
+        cube = df.groupby(cube_dims, dropna=False).agg(
+            count=(cube_dims[0], 'size'),
+            **{measure: (col, 'sum') for measure, col in measure_cols.items() if col}
+        ).reset_index()
+    
+    def rollup(keys, measures):
+        """Nested {key: ... {key: {measure: value}}} roll-up of the cube, keys sorted like groupby.
+        
+        Like the nested per-level groupbys it replaces, a group whose key is NaN at some level is
+        dropped there but still leaves an empty {} under its parent keys.
+        """
+        result = {}
+        if cube is None or cube.empty:
+            return result
+        present = [m for m in measures if m == 'count' or measure_cols[m]]
+        grouped = cube.groupby(keys, dropna=False)[present].sum()
+        values = {m: grouped[m].to_numpy() for m in present}
+        for i, index in enumerate(grouped.index):
+            index = index if isinstance(index, tuple) else (index,)
+            node = result
+            for key_col, key in zip(keys, index):
+                key = _box_scalar(key)
+                if pd.isna(key):
+                    node = None
+                    break
+                if key_col == year_col:
+                    key = str(int(key))
+                node = node.setdefault(key, {})
+            if node is None:
+                continue
+            for m in measures:
+                if m not in values:
+                    node[m] = 0.0 if m in _FLOAT_MEASURES else 0
+                elif m in _FLOAT_MEASURES:
+                    node[m] = float(values[m][i])
+                else:
+                    node[m] = int(values[m][i])
+        return result
+    
+    period_measures = ['bed_nights', 'accommodation', 'income', 'disbursements', 'revenue_total', 'outstanding']
+    combined_measures = ['count', 'pax'] + period_measures
+    
+    def rename_measures(breakdown):
+        """Reshape {key: {count, revenue_total, bed_nights}} into the by_* record layout"""
+        return {
+            key: {'bookings': v['count'], 'revenue': v['revenue_total'], 'bed_nights': v['bed_nights']}
+            for key, v in breakdown.items()
+        }
     
-    # Breakdown by status
-    by_status = {}
-    if status_col:
-        for status, group in df.groupby(status_col):
-            by_status[status] = {
-                'bookings': len(group),
-                'revenue': float(group[revenue_col].sum()) if revenue_col else 0.0,
-                'bed_nights': int(group[bed_nights_col].sum()) if bed_nights_col else 0
+    def breakdown_by(col):
+        """Bookings, revenue and bed nights per value of a column outside the cube"""
+        result = {}
+        if not col:
+            return result
+        grouped = df.groupby(col).agg(
+            bookings=(col, 'size'),
+            **({'revenue': (revenue_col, 'sum')} if revenue_col else {}),
+            **({'bed_nights': (bed_nights_col, 'sum')} if bed_nights_col else {})
+        )
+        for key, bookings, revenue, bed_nights in zip(
+            grouped.index,
+            grouped['bookings'].to_numpy(),
+            grouped['revenue'].to_numpy() if revenue_col else [0.0] * len(grouped),
+            grouped['bed_nights'].to_numpy() if bed_nights_col else [0] * len(grouped)
+        ):
+            result[_box_scalar(key)] = {
+                'bookings': int(bookings),
+                'revenue': float(revenue),
+                'bed_nights': int(bed_nights)
             }
+        return result
+    
+    # Breakdown by status
+    by_status = rename_measures(rollup([status_col], ['count', 'revenue_total', 'bed_nights'])) if status_col else {}
     
     # Breakdown by booking class
-    by_booking_class = {}
-    if booking_class_col:
-        for booking_class, group in df.groupby(booking_class_col):
-            by_booking_class[booking_class] = {
-                'bookings': len(group),
-                'revenue': float(group[revenue_col].sum()) if revenue_col else 0.0,
-                'bed_nights': int(group[bed_nights_col].sum()) if bed_nights_col else 0
-            }
+    by_booking_class = rename_measures(rollup([booking_class_col], ['count', 'revenue_total', 'bed_nights'])) if booking_class_col else {}
     
     # Breakdown by source
-    by_source = {}
-    if source_col:
-        for source, group in df.groupby(source_col):
-            by_source[source] = {
-                'bookings': len(group),
-                'revenue': float(group[revenue_col].sum()) if revenue_col else 0.0,
-                'bed_nights': int(group[bed_nights_col].sum()) if bed_nights_col else 0
-            }
+    by_source = breakdown_by(source_col)
     
     # Breakdown by agent
-    by_agent = {}
-    if agent_col:
-        for agent, group in df.groupby(agent_col):
-            by_agent[agent] = {
-                'bookings': len(group),
-                'revenue': float(group[revenue_col].sum()) if revenue_col else 0.0,
-                'bed_nights': int(group[bed_nights_col].sum()) if bed_nights_col else 0
-            }
+    by_agent = breakdown_by(agent_col)
     
     # Yearly breakdown
     yearly_breakdown = {}
     if year_col and status_col:
-        for year, year_group in df.groupby(year_col):
-            year_str = str(int(year))
-            yearly_breakdown[year_str] = {}
-            for status, status_group in year_group.groupby(status_col):
-                yearly_breakdown[year_str][status] = {
-                    'bed_nights': int(status_group[bed_nights_col].sum()) if bed_nights_col else 0,
-                    'accommodation': float(status_group[accommodation_col].sum()) if accommodation_col else 0.0,
-                    'income': float(status_group[income_col].sum()) if income_col else 0.0,
-                    'disbursements': float(status_group[disbursements_col].sum()) if disbursements_col else 0.0,
-                    'revenue_total': float(status_group[revenue_col].sum()) if revenue_col else 0.0,
-                    'outstanding': float(status_group[outstanding_col].sum()) if outstanding_col else 0.0
-                }
+        yearly_breakdown = rollup([year_col, status_col], period_measures)
     elif year_col:
         # If no status column, create breakdown by year only
-        for year, year_group in df.groupby(year_col):
-            year_str = str(int(year))
-            yearly_breakdown[year_str] = {
-                'All': {
-                    'bed_nights': int(year_group[bed_nights_col].sum()) if bed_nights_col else 0,
-                    'accommodation': float(year_group[accommodation_col].sum()) if accommodation_col else 0.0,
-                    'income': float(year_group[income_col].sum()) if income_col else 0.0,
-                    'disbursements': float(year_group[disbursements_col].sum()) if disbursements_col else 0.0,
-                    'revenue_total': float(year_group[revenue_col].sum()) if revenue_col else 0.0,
-                    'outstanding': float(year_group[outstanding_col].sum()) if outstanding_col else 0.0
-                }
-            }
+        yearly_breakdown = {
+            year: {'All': totals}
+            for year, totals in rollup([year_col], period_measures).items()
+        }
     
     # Monthly breakdown
     monthly_breakdown = {}
     if year_col and month_col and status_col:
-        for year, year_group in df.groupby(year_col):
-            year_str = str(int(year))
-            monthly_breakdown[year_str] = {}
-            for month, month_group in year_group.groupby(month_col):
-                monthly_breakdown[year_str][month] = {}
-                for status, status_group in month_group.groupby(status_col):
-                    monthly_breakdown[year_str][month][status] = {
-                        'bed_nights': int(status_group[bed_nights_col].sum()) if bed_nights_col else 0,
-                        'accommodation': float(status_group[accommodation_col].sum()) if accommodation_col else 0.0,
-                        'income': float(status_group[income_col].sum()) if income_col else 0.0,
-                        'disbursements': float(status_group[disbursements_col].sum()) if disbursements_col else 0.0,
-                        'revenue_total': float(status_group[revenue_col].sum()) if revenue_col else 0.0,
-                        'outstanding': float(status_group[outstanding_col].sum()) if outstanding_col else 0.0
-                    }
+        monthly_breakdown = rollup([year_col, month_col, status_col], period_measures)
     
     # Yearly breakdown by booking class
     yearly_breakdown_by_class = {}
     if year_col and booking_class_col:
-        for year, year_group in df.groupby(year_col):
-            year_str = str(int(year))
-            yearly_breakdown_by_class[year_str] = {}
-            for booking_class, class_group in year_group.groupby(booking_class_col):
-                yearly_breakdown_by_class[year_str][booking_class] = {
-                    'bed_nights': int(class_group[bed_nights_col].sum()) if bed_nights_col else 0,
-                    'accommodation': float(class_group[accommodation_col].sum()) if accommodation_col else 0.0,
-                    'income': float(class_group[income_col].sum()) if income_col else 0.0,
-                    'disbursements': float(class_group[disbursements_col].sum()) if disbursements_col else 0.0,
-                    'revenue_total': float(class_group[revenue_col].sum()) if revenue_col else 0.0,
-                    'outstanding': float(class_group[outstanding_col].sum()) if outstanding_col else 0.0
-                }
+        yearly_breakdown_by_class = rollup([year_col, booking_class_col], period_measures)
     
     # Monthly breakdown by booking class
     monthly_breakdown_by_class = {}
     if year_col and month_col and booking_class_col:
-        for year, year_group in df.groupby(year_col):
-            year_str = str(int(year))
-            monthly_breakdown_by_class[year_str] = {}
-            for month, month_group in year_group.groupby(month_col):
-                monthly_breakdown_by_class[year_str][month] = {}
-                for booking_class, class_group in month_group.groupby(booking_class_col):
-                    monthly_breakdown_by_class[year_str][month][booking_class] = {
-                        'bed_nights': int(class_group[bed_nights_col].sum()) if bed_nights_col else 0,
-                        'accommodation': float(class_group[accommodation_col].sum()) if accommodation_col else 0.0,
-                        'income': float(class_group[income_col].sum()) if income_col else 0.0,
-                        'disbursements': float(class_group[disbursements_col].sum()) if disbursements_col else 0.0,
-                        'revenue_total': float(class_group[revenue_col].sum()) if revenue_col else 0.0,
-                        'outstanding': float(class_group[outstanding_col].sum()) if outstanding_col else 0.0
-                    }
+        monthly_breakdown_by_class = rollup([year_col, month_col, booking_class_col], period_measures)
     
     # Combined breakdown by Year, Class, and Status
     yearly_breakdown_combined = {}
     if year_col and booking_class_col and status_col:
-        for year, year_group in df.groupby(year_col):
-            year_str = str(int(year))
-            yearly_breakdown_combined[year_str] = {}
-            for booking_class, class_group in year_group.groupby(booking_class_col):
-                yearly_breakdown_combined[year_str][booking_class] = {}
-                for status, status_group in class_group.groupby(status_col):
-                    yearly_breakdown_combined[year_str][booking_class][status] = {
-                        'count': len(status_group),
-                        'pax': int(status_group[pax_col].sum()) if pax_col else 0,
-                        'bed_nights': int(status_group[bed_nights_col].sum()) if bed_nights_col else 0,
-                        'accommodation': float(status_group[accommodation_col].sum()) if accommodation_col else 0.0,
-                        'income': float(status_group[income_col].sum()) if income_col else 0.0,
-                        'disbursements': float(status_group[disbursements_col].sum()) if disbursements_col else 0.0,
-                        'revenue_total': float(status_group[revenue_col].sum()) if revenue_col else 0.0,
-                        'outstanding': float(status_group[outstanding_col].sum()) if outstanding_col else 0.0
-                    }
+        yearly_breakdown_combined = rollup([year_col, booking_class_col, status_col], combined_measures)
     
     # Combined breakdown by Year, Month, Class, and Status
     monthly_breakdown_combined = {}
     if year_col and month_col and booking_class_col and status_col:
-        for year, year_group in df.groupby(year_col):
-            year_str = str(int(year))
-            monthly_breakdown_combined[year_str] = {}
-            for month, month_group in year_group.groupby(month_col):
-                monthly_breakdown_combined[year_str][month] = {}
-                for booking_class, class_group in month_group.groupby(booking_class_col):
-                    monthly_breakdown_combined[year_str][month][booking_class] = {}
-                    for status, status_group in class_group.groupby(status_col):
-                        monthly_breakdown_combined[year_str][month][booking_class][status] = {
-                            'count': len(status_group),
-                            'pax': int(status_group[pax_col].sum()) if pax_col else 0,
-                            'bed_nights': int(status_group[bed_nights_col].sum()) if bed_nights_col else 0,
-                            'accommodation': float(status_group[accommodation_col].sum()) if accommodation_col else 0.0,
-                            'income': float(status_group[income_col].sum()) if income_col else 0.0,
-                            'disbursements': float(status_group[disbursements_col].sum()) if disbursements_col else 0.0,
-                            'revenue_total': float(status_group[revenue_col].sum()) if revenue_col else 0.0,
-                            'outstanding': float(status_group[outstanding_col].sum()) if outstanding_col else 0.0
-                        }
+        monthly_breakdown_combined = rollup([year_col, month_col, booking_class_col, status_col], combined_measures)
     
     # Monthly bookings for detailed view
     monthly_bookings = {}
     if year_col and month_col:
-        for year, year_group in df.groupby(year_col):
-            # Skip NaN years
-            if pd.isna(year):
+        years = pd.to_numeric(df[year_col], errors='coerce').to_numpy(dtype='float64')
+        months = pd.to_numeric(df[month_col], errors='coerce').to_numpy(dtype='float64')
+        # Skip NaN years/months; order rows by (year, month), keeping file order within a month
+        positions = np.flatnonzero(~np.isnan(years) & ~np.isnan(months))
+        positions = positions[np.lexsort((months[positions], years[positions]))]
+        
+        # Convert each emitted column once, then build the records in month order
+        if booking_columns is None:
+            column_positions = list(range(len(df.columns)))
+        else:
+            wanted = {schema.column(name) or name for name in booking_columns}
+            column_positions = [i for i, col in enumerate(df.columns) if col in wanted]
+        column_names = [df.columns[i] for i in column_positions]
+        column_values = [_column_to_json_values(df.iloc[:, i])[positions] for i in column_positions]
+        records = [dict(zip(column_names, row)) for row in zip(*column_values)] if column_values else [{} for _ in positions]
+        
+        year_keys = years[positions]
+        month_keys = months[positions]
+        boundaries = np.flatnonzero((np.diff(year_keys) != 0) | (np.diff(month_keys) != 0)) + 1
+        for start, stop in zip(np.concatenate(([0], boundaries)), np.concatenate((boundaries, [len(positions)]))):
+            if start == stop:
                 continue
-            year_str = str(int(year))
-            monthly_bookings[year_str] = {}
-            for month, month_group in year_group.groupby(month_col):
-                # Skip NaN months and convert to integer string
-                if pd.isna(month):
-                    continue
-                month_str = str(int(month))  # Convert float to int, then to string ("3" not "3.0")
-                # Convert DataFrame to records, handling NaN values
-                records = []
-                for _, row in month_group.iterrows():
-                    record = {}
-                    for col in month_group.columns:
-                        val = row[col]
-                        if pd.isna(val):
-                            record[col] = None
-                        elif isinstance(val, (int, float)):
-                            record[col] = float(val)
-                        elif hasattr(val, 'isoformat'):
-                            try:
-                                record[col] = val.isoformat()
-                            except Exception:
-                                record[col] = str(val)
-                        else:
-                            record[col] = str(val)
-                    records.append(record)
-                monthly_bookings[year_str][month_str] = records
+            year_str = str(int(year_keys[start]))
+            month_str = str(int(month_keys[start]))  # Convert float to int, then to string ("3" not "3.0")
+            monthly_bookings.setdefault(year_str, {})[month_str] = records[start:stop]
     
     # Top revenue extras
     top_extras = {}
-    extra_columns = [col for col in df.columns if any(extra in col for extra in ['Bar:', 'Curio:', 'F&B', 'Game Drive', 'Fishing', 'Private guide'])]
+    extra_columns = [col for col in df.columns if any(extra in col for extra in EXTRA_REVENUE_MARKERS)]
     for col in extra_columns:
         if col in df.columns:
             total = float(df[col].sum())
@@ -745,26 +1693,39 @@ def create_breakdowns(df):
     top_extras = dict(sorted(top_extras.items(), key=lambda x: x[1], reverse=True)[:10])
     
     # Payment status breakdown
-    payment_status = {
-        'fully_paid': 0,
-        'partially_paid': 0,
-        'unpaid': 0,
-        'overpaid': 0
-    }
+    payment_status = {bucket: 0 for bucket in PAYMENT_STATUS_BUCKETS}
+    payment_status_by_month = {}
     
     if outstanding_col and revenue_col:
-        for _, row in df.iterrows():
-            outstanding = float(row[outstanding_col]) if pd.notna(row[outstanding_col]) else 0
-            revenue = float(row[revenue_col]) if pd.notna(row[revenue_col]) else 0
-            
-            if outstanding <= 0 and revenue > 0:
-                payment_status['fully_paid'] += 1
-            elif outstanding > 0 and outstanding < revenue:
-                payment_status['partially_paid'] += 1
-            elif outstanding > 0 and outstanding >= revenue:
-                payment_status['unpaid'] += 1
-            elif outstanding < 0:
-                payment_status['overpaid'] += 1
+        buckets = _classify_payment_status(df[outstanding_col], df[revenue_col])
+        counts = np.bincount(buckets[buckets >= 0], minlength=len(PAYMENT_STATUS_BUCKETS))
+        for bucket, count in zip(PAYMENT_STATUS_BUCKETS, counts):
+            payment_status[bucket] = int(count)
+        
+        # Count and outstanding amount per bucket for each arrival month
+        if year_col and month_col:
+            periods = pd.DataFrame({
+                'year': pd.to_numeric(df[year_col], errors='coerce').to_numpy(),
+                'month': pd.to_numeric(df[month_col], errors='coerce').to_numpy(),
+                'bucket': buckets,
+                'outstanding': np.nan_to_num(pd.to_numeric(df[outstanding_col], errors='coerce').to_numpy(dtype='float64'))
+            })
+            periods = periods[periods['bucket'] >= 0]
+            grouped = periods.groupby(['year', 'month', 'bucket']).agg(
+                count=('outstanding', 'size'),
+                outstanding=('outstanding', 'sum')
+            )
+            for (year, month, bucket), count, outstanding in zip(
+                grouped.index, grouped['count'].to_numpy(), grouped['outstanding'].to_numpy()
+            ):
+                month_totals = payment_status_by_month.setdefault(str(int(year)), {}).setdefault(
+                    str(int(month)),
+                    {name: {'count': 0, 'outstanding': 0.0} for name in PAYMENT_STATUS_BUCKETS}
+                )
+                month_totals[PAYMENT_STATUS_BUCKETS[bucket]] = {
+                    'count': int(count),
+                    'outstanding': float(outstanding)
+                }
     
     return {
         'summary': summary,
@@ -780,12 +1741,349 @@ def create_breakdowns(df):
         'monthly_breakdown_combined': monthly_breakdown_combined,
         'monthly_bookings': monthly_bookings,
         'top_extras': top_extras,
-        'payment_status': payment_status
+        'payment_status': payment_status,
+        'payment_status_by_month': payment_status_by_month
+    }
+
+# An upload whose booking count drops below this share of the live dataset's is rejected
+# before it is published (a filtered weekly export would otherwise replace the history)
+MIN_BOOKING_RATIO = 0.8
+
+class UploadRejected(ValueError):
+    """The processed upload failed a sanity check against the live data (args: error, details)"""
+
+def check_booking_upload(db, summary):
+    """Raise UploadRejected when the upload has no bookings or far fewer than the live dataset"""
+    total_bookings = summary.get('total_bookings') or 0
+    if total_bookings == 0:
+        raise UploadRejected(
+            'Upload rejected: processed dataset has zero bookings',
+            'Please upload a full export from Opera/ResRequest instead of a filtered weekly file.'
+        )
+    previous_total = 0
+    pointer = db.document(DASHBOARD_POINTER_DOC).get() if db is not None else None
+    if pointer is not None and pointer.exists:
+        previous_total = ((pointer.to_dict() or {}).get('summary') or {}).get('total_bookings') or 0
+    if previous_total > 0 and total_bookings / previous_total < MIN_BOOKING_RATIO:
+        raise UploadRejected(
+            'Upload rejected: dataset appears incomplete',
+            f'Existing dataset contains {previous_total} bookings but the upload only includes {total_bookings}. '
+            'Please upload a complete export so historical data is preserved.'
+        )
+
+# Every accepted booking export is kept, in parts, under dashboard_raw_uploads/{upload_id}
+RAW_UPLOADS = 'dashboard_raw_uploads'
+
+def store_raw_upload(db, csv_content, filename=None):
+    """Store the raw export in parts of at most JOB_PART_BYTES; returns the upload id"""
+    upload_id = f"{datetime.now().isoformat()}_{uuid.uuid4().hex[:6]}"
+    parts = list(_job_parts(csv_content))
+    writer = FirestoreBatchWriter(db)
+    writer.set(f'{RAW_UPLOADS}/{upload_id}', {
+        'uploaded_at': datetime.now().isoformat(),
+        'filename': filename,
+        'size': len(csv_content),
+        'parts': len(parts)
+    })
+    for index, content in enumerate(parts):
+        writer.set(f'{RAW_UPLOADS}/{upload_id}/parts/{index:03d}', {
+            'index': index,
+            'length': len(content),
+            'content': content
+        })
+    writer.commit()
+    print(f"Raw upload stored in {len(parts)} parts under {RAW_UPLOADS}/{upload_id}")
+    return upload_id
+
+# Weekly sales report: one report per ISO week comparing the upload's bookings with the
+# last finalized snapshot of an earlier week; every upload then re-finalizes its own
+# week's snapshot. Records use the field names the weekly-reports routes read.
+WEEKLY_SALES_REPORTS = 'weekly_sales_reports'
+WEEKLY_SALES_SNAPSHOTS = 'weekly_sales_snapshots'
+
+def _iso_week_key(moment):
+    year, week, _ = moment.isocalendar()
+    return f"{year}-W{week:02d}"
+
+def _first_present(record, *names, default=''):
+    for name in names:
+        value = record.get(name)
+        if value is not None:
+            return value
+    return default
+
+def _weekly_booking_record(booking):
+    """The weekly report's view of one monthly_bookings record (None without a reservation number)"""
+    ref = str(_first_present(booking, 'Reservation #', 'reservation_number')).strip()
+    if not ref:
+        return None
+    arrival = _first_present(booking, 'Arrival date', 'arrival_date')
+    try:
+        arrival_date = datetime.fromisoformat(str(arrival)).date().isoformat() if arrival else ''
+    except ValueError:
+        arrival_date = ''
+    try:
+        total = float(_first_present(booking, 'Revenue Total', 'revenue_total', default=0))
+    except (TypeError, ValueError):
+        total = 0.0
+    return {
+        'ref': ref,
+        'name': str(_first_present(booking, 'Reservation name', 'name')).strip(),
+        'status': str(_first_present(booking, 'Status', 'status', default='Unknown')).strip() or 'Unknown',
+        'bookingClass': str(_first_present(booking, 'Booking Class', 'booking_class')).strip(),
+        'arrivalDate': arrival_date,
+        'totalExclVat': total if math.isfinite(total) else 0.0,
+        'agent': str(_first_present(booking, 'Agent', 'agent')).strip(),
+        'source': str(_first_present(booking, 'Source', 'source')).strip()
+    }
+
+def build_weekly_report(current, baseline):
+    """New and moved-to-confirmed sales since the baseline, and provisional bookings that dropped off"""
+    baseline_by_ref = {row['ref']: row for row in baseline}
+    current_refs = {row['ref'] for row in current}
+    updates = []
+    for row in current:
+        previous = baseline_by_ref.get(row['ref'])
+        if not previous and row['status'] == 'Confirmed':
+            updates.append({**row, 'category': 'New Confirmed Sales'})
+        elif not previous and row['status'] == 'Provisional':
+            updates.append({**row, 'category': 'New Provisional Sales'})
+        elif previous and previous['status'] == 'Provisional' and row['status'] == 'Confirmed':
+            updates.append({**row, 'category': 'Moved Provisional to Confirmed'})
+    drop_off = [
+        {**row, 'previousStatus': row['status']}
+        for row in baseline
+        if row['status'] == 'Provisional' and row['ref'] not in current_refs
+    ]
+    return updates, drop_off
+
+def _latest_final_snapshot(db, exclude_week_key):
+    """(week key, bookings) of the newest finalized snapshot of another week, or (None, [])"""
+    snapshots = db.collection(WEEKLY_SALES_SNAPSHOTS).order_by('snapshot_at', direction='DESCENDING').limit(10).stream()
+    for snapshot in snapshots:
+        if snapshot.id == exclude_week_key or not (snapshot.to_dict() or {}).get('is_final'):
+            continue
+        bookings = [doc.to_dict() for doc in db.collection(f'{WEEKLY_SALES_SNAPSHOTS}/{snapshot.id}/bookings').stream()]
+        return snapshot.id, bookings
+    return None, []
+
+def write_weekly_sales_report(db, monthly_bookings):
+    """Build this week's sales report from the upload's bookings and re-finalize the week's snapshot"""
+    now = datetime.now()
+    now_iso = now.isoformat()
+    week_key = _iso_week_key(now)
+    current = [
+        row
+        for months in monthly_bookings.values()
+        for bookings in (months or {}).values()
+        for row in map(_weekly_booking_record, bookings or [])
+        if row
+    ]
+    baseline_week, baseline = _latest_final_snapshot(db, week_key)
+    updates, drop_off = build_weekly_report(current, baseline)
+    db.document(f'{WEEKLY_SALES_REPORTS}/{week_key}').set({
+        'week_key': week_key,
+        'generated_at': now_iso,
+        'baseline_snapshot_week': baseline_week,
+        'updates_count': len(updates),
+        'drop_off_count': len(drop_off),
+        'total_current_bookings': len(current),
+        'updates': updates,
+        'drop_off': drop_off,
+        'snapshot_finalized': True
+    })
+
+    snapshot_path = f'{WEEKLY_SALES_SNAPSHOTS}/{week_key}'
+    db.document(snapshot_path).set({
+        'week_key': week_key,
+        'snapshot_at': now_iso,
+        'is_final': True,
+        'booking_count': len(current)
+    }, merge=True)
+    # The old bookings go first: new doc ids may repeat old ones
+    cleanup = FirestoreBatchWriter(db)
+    for reference in db.collection(f'{snapshot_path}/bookings').list_documents():
+        cleanup.delete(reference)
+    cleanup.commit()
+    writer = FirestoreBatchWriter(db)
+    for index, row in enumerate(current):
+        safe_ref = re.sub(r'[/#?\[\]]', '_', row['ref'])
+        writer.set(f"{snapshot_path}/bookings/{safe_ref}-{row['arrivalDate'] or 'no-date'}-{index}", row)
+    writer.commit()
+    print(f"Weekly report {week_key} stored and snapshot finalized "
+          f"(updates={len(updates)}, drop_off={len(drop_off)}, bookings={len(current)})")
+    return {'week_key': week_key, 'updates': len(updates), 'drop_off': len(drop_off), 'bookings': len(current)}
+
+# The default booking_columns option: parse only the columns the aggregations and the
+# dashboard's booking views read (BOOKING_DETAILS_COLUMNS plus the revenue line items,
+# see BookingSchema.projection) and keep all of them in the monthly_bookings records
+BOOKING_COLUMNS_DASHBOARD = 'dashboard'
+
+def _parse_booking_columns(value):
+    """Resolve the booking_columns request option: 'dashboard' (the default), None (all columns) or a column list"""
+    if not value or value == BOOKING_COLUMNS_DASHBOARD:
+        return BOOKING_COLUMNS_DASHBOARD
+    if value == 'all':
+        return None
+    if value == 'details':
+        return BOOKING_DETAILS_COLUMNS
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+def run_booking_pipeline(csv_content, booking_columns=BOOKING_COLUMNS_DASHBOARD, rules=None, input_fingerprint=None,
+                         progress=None, lease=None, filename=None):
+    """Parse, apply rules, aggregate and persist one booking export; returns the response body.
+
+    Before publishing, the upload is checked against the live dataset (UploadRejected);
+    once published, the raw export is stored and the weekly sales report rebuilt, so the
+    synchronous and async (job) paths do the same work.
+    ``booking_columns`` is a resolved booking_columns option (see _parse_booking_columns).
+    ``progress(stage)`` is called after each of BOOKING_JOB_STAGES (async jobs report it).
+    ``lease`` is the run's registered ProcessingLease (see persist_dashboard_data).
+    """
+    progress = progress or (lambda stage: None)
+    rules = rules or BusinessRules.from_config(load_business_rules_config())
+
+    print(f"Processing CSV data ({len(csv_content)} characters)...")
+    
+    if booking_columns == BOOKING_COLUMNS_DASHBOARD:
+        parse_columns, emit_columns = BOOKING_DETAILS_COLUMNS, None
+    else:
+        parse_columns, emit_columns = booking_columns, booking_columns
+
+    # Load and clean data
+    df, schema = load_and_clean_data(csv_content, columns=parse_columns)
+    progress('parsed')
+    
+    # Apply business rules
+    df, rule_hits = apply_business_rules(df, schema, rules)
+    
+    # Calculate income and disbursements
+    df, revenue_report = calculate_income_and_disbursements(df, schema)
+    progress('rules_applied')
+    
+    # Process revenue trends
+    revenue_trends = process_revenue_and_booking_metrics(df, schema)
+    
+    # Create breakdowns
+    breakdowns = create_breakdowns(df, schema, booking_columns=emit_columns)
+    progress('breakdowns')
+    
+    # Combine all results
+    dashboard_data = {
+        **breakdowns,
+        'revenue_trends': revenue_trends
+    }
+    
+    # Prepare response
+    response_data = {
+        'message': 'Data processing completed successfully',
+        'timestamp': datetime.now().isoformat(),
+        'summary': breakdowns['summary'],
+        'dashboard_data': dashboard_data
+    }
+
+    response_data['business_rules'] = {
+        'fingerprint': rules.fingerprint,
+        'hits': rule_hits
+    }
+    response_data['revenue_columns'] = revenue_report
+
+    # Persist processed data inside the Cloud Function using Admin SDK.
+    db = get_firestore_client()
+    check_booking_upload(db, breakdowns['summary'])
+    storage_result = persist_dashboard_data(dashboard_data, input_fingerprint, lease)
+    response_data['storage'] = storage_result
+    response_data['raw_upload_id'] = store_raw_upload(db, csv_content, filename)
+    try:
+        response_data['weekly_report'] = write_weekly_sales_report(db, breakdowns['monthly_bookings'])
+    except Exception as e:
+        print(f"Warning: Weekly snapshot/report generation failed: {e}")
+        response_data['weekly_report'] = {'error': str(e)}
+    progress('persisted')
+    
+    print(f"Processing completed: {breakdowns['summary']['total_bookings']} bookings processed")
+    return response_data
+
+# Processing responses: ?response=summary (the default) leaves out the processed payload
+# the function has already persisted; ?response=full streams it, one container level at
+# a time, instead of building the whole body as one string. Both are gzipped when the
+# caller accepts it.
+RESPONSE_PAYLOAD_KEYS = ('dashboard_data', 'occupancy_data')
+RESPONSE_CHUNK_BYTES = 64 * 1024
+# Containers nested deeper than this are serialized in one json.dumps call
+RESPONSE_STREAM_DEPTH = 5
+
+def _iter_json(value, depth=RESPONSE_STREAM_DEPTH):
+    """Yield the text of json.dumps(value, default=str) piece by piece"""
+    if depth > 0 and isinstance(value, dict) and value and all(isinstance(key, str) for key in value):
+        yield '{'
+        for index, (key, item) in enumerate(value.items()):
+            yield (', ' if index else '') + json.dumps(key) + ': '
+            yield from _iter_json(item, depth - 1)
+        yield '}'
+    elif depth > 0 and isinstance(value, (list, tuple)) and value:
+        yield '['
+        for index, item in enumerate(value):
+            if index:
+                yield ', '
+            yield from _iter_json(item, depth - 1)
+        yield ']'
+    else:
+        yield json.dumps(value, default=str)
+
+def _encoded_chunks(pieces, size=RESPONSE_CHUNK_BYTES):
+    """Join text pieces into UTF-8 chunks of roughly ``size`` bytes"""
+    buffer, buffered = [], 0
+    for piece in pieces:
+        buffer.append(piece)
+        buffered += len(piece)
+        if buffered >= size:
+            yield ''.join(buffer).encode('utf-8')
+            buffer, buffered = [], 0
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
+
+def _gzip_chunks(chunks):
+    """Compress a stream of byte chunks into one gzip member"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def _json_response(req, response_data, status=200):
+    """HTTP response for a processing result, honouring ?response=summary|full and Accept-Encoding"""
+    headers = {'Content-Type': 'application/json', 'Vary': 'Accept-Encoding'}
+    gzipped = 'gzip' in (req.headers.get('Accept-Encoding') or '')
+    if gzipped:
+        headers['Content-Encoding'] = 'gzip'
+    if req.args.get('response') != 'full':
+        summary = {key: value for key, value in response_data.items() if key not in RESPONSE_PAYLOAD_KEYS}
+        body = json.dumps(summary, default=str).encode('utf-8')
+        return https_fn.Response(gzip.compress(body) if gzipped else body, status=status, headers=headers)
+    chunks = _encoded_chunks(_iter_json(response_data))
+    return https_fn.Response(_gzip_chunks(chunks) if gzipped else chunks, status=status, headers=headers)
+
+def _superseded_response(lease, error):
+    """Response body for a run that stood down for a newer upload of the same dataset"""
+    print(f"Run {lease.token} superseded by {error.args[0]} - abandoning its remaining writes")
+    return {
+        'message': 'A newer upload of the same data arrived; this one was not saved',
+        'timestamp': datetime.now().isoformat(),
+        'superseded': True,
+        'storage': {'run_id': lease.token, 'superseded_by': error.args[0]}
     }
 
 @https_fn.on_request()
 def process_booking_data(req: https_fn.Request) -> https_fn.Response:
-    """Cloud Function to process booking data"""
+    """Cloud Function to process booking data.
+
+    ?mode=async validates the header, queues a job and answers 202 (see enqueue_job).
+    ?response=full includes dashboard_data in the response (see _json_response).
+    ?filename= names the upload in dashboard_raw_uploads. An upload that fails
+    check_booking_upload is answered 400 (a job ends with status 'rejected').
+    """
     if req.method != 'POST':
         return https_fn.Response(
             json.dumps({'error': 'Method not allowed'}),
@@ -804,48 +2102,70 @@ def process_booking_data(req: https_fn.Request) -> https_fn.Response:
                 headers={'Content-Type': 'application/json'}
             )
         
-        print(f"Processing CSV data ({len(csv_content)} characters)...")
-        
-        # Load and clean data
-        df = load_and_clean_data(csv_content)
-        
-        # Apply business rules
-        df = apply_business_rules(df)
-        
-        # Calculate income and disbursements
-        df = calculate_income_and_disbursements(df)
-        
-        # Process revenue trends
-        revenue_trends = process_revenue_and_booking_metrics(df)
-        
-        # Create breakdowns
-        breakdowns = create_breakdowns(df)
-        
-        # Combine all results
-        dashboard_data = {
-            **breakdowns,
-            'revenue_trends': revenue_trends
-        }
-        
-        # Prepare response
-        response_data = {
-            'message': 'Data processing completed successfully',
-            'timestamp': datetime.now().isoformat(),
-            'summary': breakdowns['summary'],
-            'dashboard_data': dashboard_data
-        }
+        # ?booking_columns=dashboard (the default)|details|<comma separated names> trims the
+        # monthly_bookings records, so only those raw columns are parsed beyond what the
+        # aggregations need; ?booking_columns=all keeps every export column.
+        booking_columns = _parse_booking_columns(req.args.get('booking_columns'))
+        rules = BusinessRules.from_config(load_business_rules_config())
 
-        # Persist processed data inside the Cloud Function using Admin SDK.
-        storage_result = persist_dashboard_data(dashboard_data)
-        response_data['storage'] = storage_result
-        
-        print(f"Processing completed: {breakdowns['summary']['total_bookings']} bookings processed")
-        
-        return https_fn.Response(
-            json.dumps(response_data, default=str),
-            status=200,
-            headers={'Content-Type': 'application/json'}
+        # An identical re-upload (same export, rules and options) returns the live summary;
+        # ?force=1 reprocesses anyway
+        input_fingerprint = _input_fingerprint(
+            req.get_data(),
+            kind='bookings',
+            booking_columns=booking_columns,
+            rules=rules.fingerprint,
+            monthly_bookings_encoding=MONTHLY_BOOKINGS_ENCODING
         )
+        if req.args.get('force') not in ('1', 'true'):
+            stored = _stored_run(get_firestore_client(), DASHBOARD_POINTER_DOC, input_fingerprint)
+            if stored:
+                print(f"Upload unchanged since dashboard version {stored.get('run_id')} - skipping reprocessing")
+                return _json_response(req, {
+                    'message': 'Data unchanged since the last upload; returning the stored summary',
+                    'timestamp': datetime.now().isoformat(),
+                    'unchanged': True,
+                    'summary': stored['summary'],
+                    'business_rules': {'fingerprint': rules.fingerprint},
+                    'storage': {'run_id': stored.get('run_id'), 'unchanged': True}
+                })
+
+        if req.args.get('mode') == 'async':
+            try:
+                validate_booking_header(csv_content)
+            except ValueError as e:
+                return https_fn.Response(
+                    json.dumps({'error': str(e)}),
+                    status=400,
+                    headers={'Content-Type': 'application/json'}
+                )
+            job = enqueue_job(
+                get_firestore_client(), 'bookings', csv_content,
+                {'booking_columns': booking_columns, 'filename': req.args.get('filename')}, input_fingerprint
+            )
+            return https_fn.Response(
+                json.dumps(job, default=str),
+                status=202,
+                headers={'Content-Type': 'application/json'}
+            )
+
+        db = get_firestore_client()
+        lease = ProcessingLease(db, 'bookings').register() if db is not None else None
+        try:
+            response_data = run_booking_pipeline(
+                csv_content, booking_columns, rules, input_fingerprint, lease=lease, filename=req.args.get('filename')
+            )
+        except Superseded as e:
+            response_data = _superseded_response(lease, e)
+        except UploadRejected as e:
+            print(f"{e.args[0]}: {e.args[1]}")
+            return https_fn.Response(
+                json.dumps({'error': e.args[0], 'details': e.args[1]}),
+                status=400,
+                headers={'Content-Type': 'application/json'}
+            )
+        
+        return _json_response(req, response_data)
         
     except Exception as e:
         import traceback
@@ -857,352 +2177,41 @@ def process_booking_data(req: https_fn.Request) -> https_fn.Response:
             headers={'Content-Type': 'application/json'}
         )
 
-# Occupancy Report Processing Functions
-def parse_occupancy_date_from_header(header_row):
-    """Parse dates from the header row"""
-    import pandas as pd
-    dates = []
-    month_counts = {}
-    
-    # Skip first two columns (empty or property/accommodation headers)
-    for i in range(2, len(header_row)):
-        if hasattr(header_row, 'iloc'):
-            # Pandas Series
-            cell = header_row.iloc[i] if i < len(header_row) else None
-            if pd.isna(cell):
-                continue
-        elif isinstance(header_row, list):
-            # Python list
-            cell = header_row[i] if i < len(header_row) else None
-        else:
-            cell = header_row[i] if i < len(header_row) else None
-        
-        if not cell or str(cell).strip() == '':
-            continue
-            
-        cell_str = str(cell).strip()
-            
-        # Try to parse month/year format like "Jan 2025"
-        month_year_match = re.match(r'([A-Za-z]+)\s+(\d{4})', cell_str)
-        if month_year_match:
-            month_name = month_year_match.group(1)
-            year = int(month_year_match.group(2))
-            
-            # Convert month name to number
-            month_map = {
-                'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
-                'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12
-            }
-            month_num = month_map.get(month_name[:3], 1)
-            
-            month_year_key = f"{year}-{month_num:02d}"
-            
-            # Count occurrences of this month/year
-            if month_year_key not in month_counts:
-                month_counts[month_year_key] = 0
-            month_counts[month_year_key] += 1
-            
-            # The day is the count (1st occurrence = day 1, 2nd = day 2, etc.)
-            day = month_counts[month_year_key]
-            
-            try:
-                date_obj = datetime(year, month_num, day)
-                dates.append(date_obj.strftime('%Y-%m-%d'))
-            except ValueError:
-                # Invalid date (e.g., Feb 30), skip
-                continue
-    
-    return dates
+def run_occupancy_pipeline(csv_content, input_fingerprint=None, progress=None, lease=None):
+    """Aggregate and persist one occupancy report; returns the response body.
 
-def parse_occupancy_row_data(row, dates):
-    """Parse a row of occupancy data"""
-    property_name = str(row[0]).strip() if len(row) > 0 and row[0] else ''
-    accommodation_type = str(row[1]).strip() if len(row) > 1 and row[1] else ''
-    
-    # Skip if both are empty or if it's a header/metadata row
-    if not property_name and not accommodation_type:
-        return None
-    
-    # Skip metadata rows
-    if property_name in ['Occupancy Report', 'Date Range', 'Property filter:', 
-                         'Accommodation types:', 'Agents:', 'Include provisionals:', 
-                         'Add agent allocations:', 'Show unit totals:', 'Available rooms limit:']:
-        return None
-    
-    occupancy_data = []
-    
-    # Months to exclude: December (12), January (1), February (2)
-    excluded_months = [1, 2, 12]
-    
-    # Start from column 2 (index 2) since 0 and 1 are property/accommodation
-    for i, date in enumerate(dates):
-        col_idx = i + 2  # Offset by 2 for property/accommodation columns
-        if col_idx >= len(row):
-            break
-        
-        # Check if this date should be excluded
-        try:
-            date_obj = datetime.strptime(date, '%Y-%m-%d')
-            if date_obj.month in excluded_months:
-                continue  # Skip this date
-        except ValueError:
-            continue
-            
-        value = str(row[col_idx]).strip() if col_idx < len(row) and row[col_idx] else '0'
-        
-        # Check if it's provisional (has asterisk)
-        is_provisional = '*' in value
-        value = value.replace('*', '').strip()
-        
-        # Try to convert to number
-        try:
-            occupancy = int(value) if value else 0
-        except ValueError:
-            occupancy = 0
-        
-        occupancy_data.append({
-            'date': date,
-            'occupancy': occupancy,
-            'is_provisional': is_provisional
-        })
-    
-    return {
-        'property': property_name,
-        'accommodation_type': accommodation_type,
+    ``progress(stage)`` is called after each of OCCUPANCY_JOB_STAGES; ``lease`` as for
+    run_booking_pipeline.
+    """
+    progress = progress or (lambda stage: None)
+    print(f"Processing occupancy report CSV data ({len(csv_content)} characters)...")
+    
+    # Process occupancy report
+    occupancy_data = process_occupancy_report_cloud(csv_content)
+    progress('aggregated')
+    
+    # Prepare response
+    response_data = {
+        'message': 'Occupancy report processing completed successfully',
+        'timestamp': datetime.now().isoformat(),
+        'summary': occupancy_data['summary'],
         'occupancy_data': occupancy_data
     }
 
-def aggregate_occupancy_data_cloud(records, dates):
-    """Aggregate occupancy data by various dimensions"""
-    
-    # Daily totals by property
-    daily_by_property = defaultdict(lambda: defaultdict(int))
-    
-    # Monthly totals by property
-    monthly_by_property = defaultdict(lambda: defaultdict(lambda: {'total': 0, 'provisional': 0, 'days': 0}))
-    
-    # By accommodation type
-    daily_by_accommodation = defaultdict(lambda: defaultdict(int))
-    monthly_by_accommodation = defaultdict(lambda: defaultdict(lambda: {'total': 0, 'provisional': 0, 'days': 0}))
-    
-    # Overall daily totals
-    daily_totals = defaultdict(lambda: {'total': 0, 'provisional': 0, 'confirmed': 0})
-    
-    # Process each record
-    for record in records:
-        property_name = record['property']
-        accommodation_type = record['accommodation_type']
-        
-        for occ in record['occupancy_data']:
-            date_str = occ['date']
-            occupancy = occ['occupancy']
-            is_provisional = occ['is_provisional']
-            
-            # Parse date
-            date_obj = datetime.strptime(date_str, '%Y-%m-%d')
-            year = date_obj.year
-            month = date_obj.month
-            month_key = f"{year}-{month:02d}"
-            
-            # Daily aggregations
-            daily_by_property[property_name][date_str] += occupancy
-            daily_by_accommodation[accommodation_type][date_str] += occupancy
-            
-            daily_totals[date_str]['total'] += occupancy
-            if is_provisional:
-                daily_totals[date_str]['provisional'] += occupancy
-            else:
-                daily_totals[date_str]['confirmed'] += occupancy
-            
-            # Monthly aggregations
-            monthly_by_property[property_name][month_key]['total'] += occupancy
-            monthly_by_property[property_name][month_key]['days'] += 1
-            if is_provisional:
-                monthly_by_property[property_name][month_key]['provisional'] += occupancy
-            
-            monthly_by_accommodation[accommodation_type][month_key]['total'] += occupancy
-            monthly_by_accommodation[accommodation_type][month_key]['days'] += 1
-            if is_provisional:
-                monthly_by_accommodation[accommodation_type][month_key]['provisional'] += occupancy
-    
-    # Convert to lists for JSON serialization
-    daily_by_property_list = {}
-    for prop, dates_dict in daily_by_property.items():
-        daily_by_property_list[prop] = [
-            {'date': date, 'occupancy': occ} 
-            for date, occ in sorted(dates_dict.items())
-        ]
-    
-    daily_by_accommodation_list = {}
-    for acc, dates_dict in daily_by_accommodation.items():
-        daily_by_accommodation_list[acc] = [
-            {'date': date, 'occupancy': occ} 
-            for date, occ in sorted(dates_dict.items())
-        ]
-    
-    daily_totals_list = [
-        {
-            'date': date,
-            'total': totals['total'],
-            'confirmed': totals['confirmed'],
-            'provisional': totals['provisional']
-        }
-        for date, totals in sorted(daily_totals.items())
-    ]
-    
-    # Convert monthly data
-    monthly_by_property_list = {}
-    for prop, months_dict in monthly_by_property.items():
-        monthly_by_property_list[prop] = {
-            month: {
-                'total': data['total'],
-                'provisional': data['provisional'],
-                'confirmed': data['total'] - data['provisional'],
-                'average_daily': data['total'] / data['days'] if data['days'] > 0 else 0
-            }
-            for month, data in sorted(months_dict.items())
-        }
-    
-    monthly_by_accommodation_list = {}
-    for acc, months_dict in monthly_by_accommodation.items():
-        monthly_by_accommodation_list[acc] = {
-            month: {
-                'total': data['total'],
-                'provisional': data['provisional'],
-                'confirmed': data['total'] - data['provisional'],
-                'average_daily': data['total'] / data['days'] if data['days'] > 0 else 0
-            }
-            for month, data in sorted(months_dict.items())
-        }
-    
-    # Calculate summary statistics
-    total_occupancy = sum(totals['total'] for totals in daily_totals.values())
-    total_provisional = sum(totals['provisional'] for totals in daily_totals.values())
-    total_confirmed = sum(totals['confirmed'] for totals in daily_totals.values())
-    
-    # Find peak occupancy dates
-    peak_dates = sorted(daily_totals.items(), key=lambda x: x[1]['total'], reverse=True)[:10]
-    
-    # Calculate average daily occupancy
-    avg_daily = total_occupancy / len(daily_totals) if daily_totals else 0
-    
-    summary = {
-        'total_occupancy': total_occupancy,
-        'total_confirmed': total_confirmed,
-        'total_provisional': total_provisional,
-        'average_daily_occupancy': round(avg_daily, 2),
-        'date_range': {
-            'start': dates[0] if dates else None,
-            'end': dates[-1] if dates else None,
-            'total_days': len(dates)
-        },
-        'peak_dates': [
-            {
-                'date': date,
-                'occupancy': totals['total'],
-                'confirmed': totals['confirmed'],
-                'provisional': totals['provisional']
-            }
-            for date, totals in peak_dates
-        ],
-        'properties': list(set(r['property'] for r in records)),
-        'accommodation_types': list(set(r['accommodation_type'] for r in records))
-    }
-    
-    return {
-        'summary': summary,
-        'daily_totals': daily_totals_list,
-        'daily_by_property': daily_by_property_list,
-        'daily_by_accommodation': daily_by_accommodation_list,
-        'monthly_by_property': monthly_by_property_list,
-        'monthly_by_accommodation': monthly_by_accommodation_list,
-        'raw_records': [
-            {
-                'property': r['property'],
-                'accommodation_type': r['accommodation_type'],
-                'occupancy_data': r['occupancy_data']
-            }
-            for r in records
-        ]
-    }
-
-def process_occupancy_report_cloud(csv_content: str):
-    """Process the occupancy report CSV content"""
-    import pandas as pd
-    
-    # Read the CSV file using csv module directly for better control
-    rows = []
-    for line in csv_content.split('\n'):
-        if line.strip():
-            reader = csv_module.reader([line])
-            rows.append(list(reader)[0])
-    
-    df = pd.DataFrame(rows)
-    
-    # Find the header row (row with month/year labels)
-    header_row_idx = None
-    max_month_count = 0
-    
-    for idx in range(len(df)):
-        row = df.iloc[idx]
-        month_count = 0
-        for cell in row:
-            if pd.notna(cell):
-                cell_str = str(cell).strip()
-                # Check if it matches month/year pattern
-                if re.match(r'[A-Za-z]+\s+\d{4}', cell_str):
-                    month_count += 1
-        
-        # The header row should have many month/year entries
-        if month_count > max_month_count and month_count > 10:
-            max_month_count = month_count
-            header_row_idx = idx
-    
-    if header_row_idx is None:
-        header_row_idx = 11
-    
-    header_row = df.iloc[header_row_idx]
-    
-    # Parse dates from header
-    dates = parse_occupancy_date_from_header(header_row)
-    
-    # Process data rows (starting after the day number row)
-    data_start_idx = header_row_idx + 3
-    occupancy_records = []
-    
-    # Filter out unwanted properties and accommodation types
-    excluded_properties = ['MV - Matusadona']
-    excluded_accommodation_types = [
-        'Internal Account',
-        'Internal Account ',
-        'Exclusive Use',
-        'Pilot/Guide Room',
-        'Boardroom',
-        'POS Outlet Sales'
-    ]
+    storage_result = persist_occupancy_data(occupancy_data, input_fingerprint, lease)
+    response_data['storage'] = storage_result
+    progress('persisted')
     
-    for idx in range(data_start_idx, len(df)):
-        row = df.iloc[idx].tolist()
-        parsed = parse_occupancy_row_data(row, dates)
-        if parsed:
-            # Filter out excluded properties
-            if parsed['property'] in excluded_properties:
-                continue
-            
-            # Filter out excluded accommodation types
-            if parsed['accommodation_type'] in excluded_accommodation_types:
-                continue
-            
-            occupancy_records.append(parsed)
-    
-    # Aggregate data by different dimensions
-    results = aggregate_occupancy_data_cloud(occupancy_records, dates)
-    
-    return results
+    print(f"Processing completed: {occupancy_data['summary']['total_occupancy']} total occupancy")
+    return response_data
 
 @https_fn.on_request()
 def process_occupancy_report(req: https_fn.Request) -> https_fn.Response:
-    """Cloud Function to process occupancy report data"""
+    """Cloud Function to process occupancy report data.
+
+    ?mode=async validates the header, queues a job and answers 202 (see enqueue_job).
+    ?response=full includes occupancy_data in the response (see _json_response).
+    """
     if req.method != 'POST':
         return https_fn.Response(
             json.dumps({'error': 'Method not allowed'}),
@@ -1221,29 +2230,43 @@ def process_occupancy_report(req: https_fn.Request) -> https_fn.Response:
                 headers={'Content-Type': 'application/json'}
             )
         
-        print(f"Processing occupancy report CSV data ({len(csv_content)} characters)...")
-        
-        # Process occupancy report
-        occupancy_data = process_occupancy_report_cloud(csv_content)
-        
-        # Prepare response
-        response_data = {
-            'message': 'Occupancy report processing completed successfully',
-            'timestamp': datetime.now().isoformat(),
-            'summary': occupancy_data['summary'],
-            'occupancy_data': occupancy_data
-        }
+        input_fingerprint = _input_fingerprint(req.get_data(), kind='occupancy')
+        if req.args.get('force') not in ('1', 'true'):
+            stored = _stored_run(get_firestore_client(), 'occupancy/data', input_fingerprint)
+            if stored:
+                print("Occupancy report unchanged since the last upload - skipping reprocessing")
+                return _json_response(req, {
+                    'message': 'Occupancy report unchanged since the last upload; returning the stored summary',
+                    'timestamp': datetime.now().isoformat(),
+                    'unchanged': True,
+                    'summary': stored['summary'],
+                    'storage': {'doc': 'occupancy/data', 'unchanged': True}
+                })
 
-        storage_result = persist_occupancy_data(occupancy_data)
-        response_data['storage'] = storage_result
-        
-        print(f"Processing completed: {occupancy_data['summary']['total_occupancy']} total occupancy")
+        if req.args.get('mode') == 'async':
+            try:
+                validate_occupancy_header(csv_content)
+            except ValueError as e:
+                return https_fn.Response(
+                    json.dumps({'error': str(e)}),
+                    status=400,
+                    headers={'Content-Type': 'application/json'}
+                )
+            job = enqueue_job(get_firestore_client(), 'occupancy', csv_content, {}, input_fingerprint)
+            return https_fn.Response(
+                json.dumps(job, default=str),
+                status=202,
+                headers={'Content-Type': 'application/json'}
+            )
+
+        db = get_firestore_client()
+        lease = ProcessingLease(db, 'occupancy').register() if db is not None else None
+        try:
+            response_data = run_occupancy_pipeline(csv_content, input_fingerprint, lease=lease)
+        except Superseded as e:
+            response_data = _superseded_response(lease, e)
         
-        return https_fn.Response(
-            json.dumps(response_data, default=str),
-            status=200,
-            headers={'Content-Type': 'application/json'}
-        )
+        return _json_response(req, response_data)
         
     except Exception as e:
         import traceback
@@ -1254,3 +2277,164 @@ def process_occupancy_report(req: https_fn.Request) -> https_fn.Response:
             status=500,
             headers={'Content-Type': 'application/json'}
         )
+
+# Async processing jobs. The HTTP functions store the upload under jobs/{id}/parts and
+# create jobs/{id}; process_job runs the pipeline and records each stage on that doc.
+# Each job registers as its dataset's newest run (ProcessingLease, token = job id): an
+# older job that sees a newer one stops at its next stage boundary or write batch.
+# A job ends 'done', 'superseded', 'rejected' (check_booking_upload; error and details as
+# a synchronous 400 carries) or 'failed'.
+JOBS = 'jobs'
+JOB_PART_BYTES = 900_000  # UTF-8 bytes per part, safely under Firestore's 1 MiB document limit
+BOOKING_JOB_STAGES = ['parsed', 'rules_applied', 'breakdowns', 'persisted']
+OCCUPANCY_JOB_STAGES = ['aggregated', 'persisted']
+
+def _job_parts(csv_content):
+    """Split the upload into strings of at most JOB_PART_BYTES UTF-8 bytes, never splitting a character"""
+    data = csv_content.encode('utf-8')
+    start = 0
+    while start < len(data):
+        end = min(start + JOB_PART_BYTES, len(data))
+        # Back up to the first byte of a multibyte character (continuation bytes are 0b10xxxxxx)
+        while end < len(data) and data[end] & 0xC0 == 0x80:
+            end -= 1
+        yield data[start:end].decode('utf-8')
+        start = end
+
+def enqueue_job(db, dataset, csv_content, options, input_fingerprint=None):
+    """Store an upload and queue it for process_job; returns the 202 response body"""
+    if db is None:
+        raise RuntimeError("Firestore client not initialized")
+    job_id = _new_run_id()
+    now = datetime.now().isoformat()
+    writer = FirestoreBatchWriter(db)
+    parts = 0
+    for parts, content in enumerate(_job_parts(csv_content), start=1):
+        writer.set(f'{JOBS}/{job_id}/parts/{parts - 1:03d}', {
+            'index': parts - 1,
+            'content': content
+        })
+    writer.commit()
+    # Newest wins: older queued/running jobs for the dataset see this and stand down
+    ProcessingLease(db, dataset, job_id).register()
+    # Created last, once its payload is in place: this write triggers process_job
+    db.document(f'{JOBS}/{job_id}').set({
+        'dataset': dataset,
+        'status': 'queued',
+        'stage': None,
+        'stages': {},
+        'options': options,
+        'input_fingerprint': input_fingerprint,
+        'parts': parts,
+        'size': len(csv_content),
+        'created_at': now,
+        'updated_at': now
+    })
+    print(f"Queued {dataset} job {job_id} ({parts} parts)")
+    return {'job_id': job_id, 'dataset': dataset, 'status': 'queued', 'status_doc': f'{JOBS}/{job_id}'}
+
+def _claim_job(db, job_ref):
+    """Move a job from queued to running in a transaction; False when it was already claimed or finished"""
+    from google.cloud import firestore
+
+    @firestore.transactional
+    def claim(transaction):
+        snapshot = job_ref.get(transaction=transaction)
+        status = (snapshot.to_dict() or {}).get('status') if snapshot.exists else None
+        if status != 'queued':
+            return False
+        now = datetime.now().isoformat()
+        transaction.update(job_ref, {'status': 'running', 'started_at': now, 'updated_at': now})
+        return True
+
+    return claim(db.transaction())
+
+def run_job(db, job_id, job):
+    """Process a queued job, recording its status and stages on jobs/{job_id}.
+
+    The trigger may deliver a job more than once: only the run that claims it (queued ->
+    running) processes it, and a job whose payload is gone has already been consumed.
+    """
+    job_ref = db.document(f'{JOBS}/{job_id}')
+    dataset = job.get('dataset')
+    if not _claim_job(db, job_ref):
+        print(f"Job {job_id} already claimed or finished - skipping")
+        return
+    lease = ProcessingLease(db, dataset, job_id)
+
+    def update(fields):
+        job_ref.set({**fields, 'updated_at': datetime.now().isoformat()}, merge=True)
+
+    def progress(stage):
+        update({'status': 'running', 'stage': stage, 'stages': {stage: datetime.now().isoformat()}})
+        print(f"Job {job_id}: {stage}")
+        # Stop before persisting (or after a stage) once a newer upload is queued
+        if stage != 'persisted':
+            lease.check()
+
+    references = [db.document(f'{JOBS}/{job_id}/parts/{i:03d}') for i in range(job.get('parts') or 0)]
+    snapshots = {snapshot.reference.path: snapshot for snapshot in db.get_all(references)} if references else {}
+    contents = [
+        (snapshots[reference.path].to_dict() or {}).get('content') if reference.path in snapshots and snapshots[reference.path].exists else None
+        for reference in references
+    ]
+    if any(content is None for content in contents):
+        print(f"Job {job_id} payload already consumed - skipping")
+        update({'status': 'failed', 'error': 'Job payload already consumed', 'finished_at': datetime.now().isoformat()})
+        return
+
+    try:
+        lease.check()
+        csv_content = ''.join(contents)
+        options = job.get('options') or {}
+        if dataset == 'bookings':
+            result = run_booking_pipeline(
+                csv_content, options.get('booking_columns'),
+                input_fingerprint=job.get('input_fingerprint'), progress=progress, lease=lease,
+                filename=options.get('filename')
+            )
+        elif dataset == 'occupancy':
+            result = run_occupancy_pipeline(csv_content, job.get('input_fingerprint'), progress=progress, lease=lease)
+        else:
+            raise ValueError(f"Unknown job dataset: {dataset}")
+        update({
+            'status': 'done',
+            'finished_at': datetime.now().isoformat(),
+            'result': {key: result.get(key) for key in ('summary', 'storage', 'raw_upload_id', 'weekly_report')}
+        })
+    except Superseded as e:
+        print(f"Job {job_id} superseded by {e.args[0]}")
+        update({'status': 'superseded', 'superseded_by': e.args[0], 'finished_at': datetime.now().isoformat()})
+    except UploadRejected as e:
+        print(f"Job {job_id}: {e.args[0]}")
+        update({'status': 'rejected', 'error': e.args[0], 'details': e.args[1], 'finished_at': datetime.now().isoformat()})
+    except Exception as e:
+        import traceback
+        print(f"Error processing job {job_id}: {traceback.format_exc()}")
+        update({'status': 'failed', 'error': str(e), 'finished_at': datetime.now().isoformat()})
+    finally:
+        # The payload is only needed while the job runs
+        writer = FirestoreBatchWriter(db)
+        for i in range(job.get('parts') or 0):
+            writer.delete(db.document(f'{JOBS}/{job_id}/parts/{i:03d}'))
+        writer.commit()
+
+@firestore_fn.on_document_created(document='jobs/{job_id}', timeout_sec=540)
+def process_job(event: firestore_fn.Event[firestore_fn.DocumentSnapshot]) -> None:
+    """Background worker for jobs queued by the HTTP functions' async mode"""
+    if event.data is None:
+        return
+    db = get_firestore_client()
+    if db is None:
+        raise RuntimeError("Firestore client not initialized")
+    run_job(db, event.params['job_id'], event.data.to_dict() or {})
+
+@firestore_fn.on_document_written(document=DASHBOARD_POINTER_DOC, timeout_sec=540)
+def collect_dashboard_versions_on_publish(event: firestore_fn.Event[firestore_fn.Change[firestore_fn.DocumentSnapshot]]) -> None:
+    """Expire old dashboard versions after each publish, outside the upload's request"""
+    db = get_firestore_client()
+    if db is None:
+        raise RuntimeError("Firestore client not initialized")
+    report = collect_dashboard_versions(db)
+    print(f"Expired {report['versions_expired']} dashboard versions, "
+          f"removed {report['legacy_docs_removed']} legacy dashboard docs")
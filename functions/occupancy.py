@@ -0,0 +1,381 @@
+"""
+Occupancy report processing: CSV -> DateAxis + OccupancyMatrix -> dashboard aggregations.
+
+Kept to the standard library plus NumPy so the occupancy function cold-starts without
+pandas; main.py re-exports what the HTTP function and the job runner use, and the
+local process_occupancy_report.py CLI imports its parser and aggregations from here.
+"""
+
+import csv
+import io
+import itertools
+import re
+from datetime import datetime
+
+import numpy as np
+
+# Cold `import occupancy` (NumPy included) must stay well under a pandas import;
+# enforced by tests/test_occupancy_import.py
+OCCUPANCY_IMPORT_BUDGET_S = 0.3
+
+# Month/year header cells, e.g. "Jan 2025"
+_OCCUPANCY_MONTH_PATTERN = re.compile(r'([A-Za-z]+)\s+(\d{4})')
+
+# A row with more month/year cells than this is the occupancy date header,
+# looked for within the report's first OCCUPANCY_HEADER_SCAN_ROWS rows
+_OCCUPANCY_HEADER_MIN_MONTHS = 10
+OCCUPANCY_HEADER_SCAN_ROWS = 50
+
+def parse_occupancy_date_from_header(header_row):
+    """Parse dates from the header row (a list of cell strings)"""
+    dates = []
+    month_counts = {}
+    
+    # Skip first two columns (empty or property/accommodation headers)
+    for i in range(2, len(header_row)):
+        cell = header_row[i]
+        if not cell or str(cell).strip() == '':
+            continue
+            
+        cell_str = str(cell).strip()
+            
+        # Try to parse month/year format like "Jan 2025"
+        month_year_match = _OCCUPANCY_MONTH_PATTERN.match(cell_str)
+        if month_year_match:
+            month_name = month_year_match.group(1)
+            year = int(month_year_match.group(2))
+            
+            # Convert month name to number
+            month_map = {
+                'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+                'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12
+            }
+            month_num = month_map.get(month_name[:3], 1)
+            
+            month_year_key = f"{year}-{month_num:02d}"
+            
+            # Count occurrences of this month/year
+            if month_year_key not in month_counts:
+                month_counts[month_year_key] = 0
+            month_counts[month_year_key] += 1
+            
+            # The day is the count (1st occurrence = day 1, 2nd = day 2, etc.)
+            day = month_counts[month_year_key]
+            
+            try:
+                date_obj = datetime(year, month_num, day)
+                dates.append(date_obj.strftime('%Y-%m-%d'))
+            except ValueError:
+                # Invalid date (e.g., Feb 30), skip
+                continue
+    
+    return dates
+
+# Preamble rows that can appear where a property name is expected
+OCCUPANCY_METADATA_LABELS = [
+    'Occupancy Report', 'Date Range', 'Property filter:',
+    'Accommodation types:', 'Agents:', 'Include provisionals:',
+    'Add agent allocations:', 'Show unit totals:', 'Available rooms limit:'
+]
+
+# Months to exclude: December (12), January (1), February (2)
+OCCUPANCY_EXCLUDED_MONTHS = [1, 2, 12]
+
+# Filter out unwanted properties and accommodation types
+OCCUPANCY_EXCLUDED_PROPERTIES = ['MV - Matusadona']
+OCCUPANCY_EXCLUDED_ACCOMMODATION_TYPES = [
+    'Internal Account',
+    'Internal Account ',
+    'Exclusive Use',
+    'Pilot/Guide Room',
+    'Boardroom',
+    'POS Outlet Sales'
+]
+
+class DateAxis:
+    """The report's date columns, parsed once: ISO strings plus ordinal, year and month arrays.
+
+    ``excluded`` marks the columns in OCCUPANCY_EXCLUDED_MONTHS, ``month_starts`` holds the
+    column offset where each run of same-month columns begins (labelled by ``month_keys``, with
+    ``month_lengths`` columns each) and ``order`` is the chronological column order.
+    """
+
+    def __init__(self, dates, ordinals, years, months):
+        self.dates = dates
+        self.ordinals = ordinals
+        self.years = years
+        self.months = months
+        self.excluded = np.isin(months, OCCUPANCY_EXCLUDED_MONTHS)
+        month_index = years * 12 + months
+        self.month_starts = np.flatnonzero(np.diff(month_index, prepend=-1)) if len(dates) else np.zeros(0, dtype=np.int64)
+        self.month_keys = [f"{years[i]}-{months[i]:02d}" for i in self.month_starts.tolist()]
+        self.month_lengths = np.diff(self.month_starts, append=len(dates))
+        self.order = np.argsort(ordinals, kind='stable')
+
+    @classmethod
+    def from_dates(cls, dates):
+        """Axis for the 'YYYY-MM-DD' strings returned by parse_occupancy_date_from_header"""
+        parsed = [datetime.strptime(date, '%Y-%m-%d') for date in dates]
+        return cls(
+            list(dates),
+            np.array([date.toordinal() for date in parsed], dtype=np.int64),
+            np.array([date.year for date in parsed], dtype=np.int64),
+            np.array([date.month for date in parsed], dtype=np.int64)
+        )
+
+    def __len__(self):
+        return len(self.dates)
+
+    def take(self, columns):
+        """Sub-axis of the given column positions (or boolean mask), without re-parsing"""
+        columns = np.flatnonzero(columns) if np.asarray(columns).dtype == bool else np.asarray(columns, dtype=np.int64)
+        return DateAxis([self.dates[i] for i in columns.tolist()], self.ordinals[columns], self.years[columns], self.months[columns])
+
+class OccupancyMatrix:
+    """Occupancy report cells as arrays: one row per property/accommodation row, one column per reported date.
+
+    ``occupancy`` holds the counts, ``provisional`` marks the asterisked cells,
+    ``rows`` is the row index table of (property, accommodation_type) pairs and
+    ``axis`` is the DateAxis of the columns.
+    """
+
+    def __init__(self, axis, rows, occupancy, provisional):
+        self.axis = axis
+        self.rows = rows
+        self.occupancy = occupancy
+        self.provisional = provisional
+
+    @property
+    def dates(self):
+        return self.axis.dates
+
+    @property
+    def properties(self):
+        return [property_name for property_name, _ in self.rows]
+
+    @property
+    def accommodation_types(self):
+        return [accommodation_type for _, accommodation_type in self.rows]
+
+def _parse_occupancy_cells(cells):
+    """Counts and provisional flags for an array of cell texts, converting each distinct text once"""
+    uniques, inverse = np.unique(cells, return_inverse=True)
+    counts = np.zeros(len(uniques), dtype=np.int64)
+    flags = np.zeros(len(uniques), dtype=bool)
+    for i, text in enumerate(uniques):
+        value = text.strip() or '0'
+        
+        # Check if it's provisional (has asterisk)
+        flags[i] = '*' in value
+        value = value.replace('*', '').strip()
+        
+        # Try to convert to number
+        try:
+            counts[i] = int(value) if value else 0
+        except ValueError:
+            counts[i] = 0
+    return counts[inverse].reshape(cells.shape), flags[inverse].reshape(cells.shape)
+
+def parse_occupancy_rows(rows, axis):
+    """Parse the report's data rows into an OccupancyMatrix.
+
+    Blank, metadata and excluded property/accommodation rows are skipped; date columns
+    marked ``axis.excluded`` are left out. Column 2 + i holds axis.dates[i].
+    """
+    columns = np.flatnonzero(~axis.excluded).tolist()
+    row_index = []
+    cells = []
+    for row in rows:
+        property_name = str(row[0]).strip() if len(row) > 0 and row[0] else ''
+        accommodation_type = str(row[1]).strip() if len(row) > 1 and row[1] else ''
+        
+        # Skip if both are empty or if it's a header/metadata row
+        if not property_name and not accommodation_type:
+            continue
+        if property_name in OCCUPANCY_METADATA_LABELS:
+            continue
+        if property_name in OCCUPANCY_EXCLUDED_PROPERTIES or accommodation_type in OCCUPANCY_EXCLUDED_ACCOMMODATION_TYPES:
+            continue
+        
+        row_index.append((property_name, accommodation_type))
+        # Start from column 2 (index 2) since 0 and 1 are property/accommodation
+        cells.append([(row[i + 2] or '') if i + 2 < len(row) else '' for i in columns])
+    
+    cell_array = np.array(cells, dtype=str).reshape(len(cells), len(columns))
+    occupancy, provisional = _parse_occupancy_cells(cell_array)
+    return OccupancyMatrix(axis.take(columns), row_index, occupancy, provisional)
+
+def _monthly_occupancy(month_keys, totals, provisional_totals, days):
+    """Per-month {'total', 'provisional', 'confirmed', 'average_daily'} from per-month-run sums"""
+    months = {}
+    for month_key, total, provisional, day_count in zip(month_keys, totals, provisional_totals, days):
+        data = months.setdefault(month_key, {'total': 0, 'provisional': 0, 'days': 0})
+        data['total'] += total
+        data['provisional'] += provisional
+        data['days'] += day_count
+    return {
+        month: {
+            'total': data['total'],
+            'provisional': data['provisional'],
+            'confirmed': data['total'] - data['provisional'],
+            'average_daily': data['total'] / data['days'] if data['days'] > 0 else 0
+        }
+        for month, data in sorted(months.items())
+    }
+
+def _group_occupancy_rows(labels, occupancy, provisional_occupancy):
+    """Labels in first-seen order with their per-date count and provisional sums and row counts"""
+    groups = {}
+    codes = np.array([groups.setdefault(label, len(groups)) for label in labels], dtype=np.intp)
+    totals = np.zeros((len(groups), occupancy.shape[1]), dtype=np.int64)
+    provisional = np.zeros_like(totals)
+    np.add.at(totals, codes, occupancy)
+    np.add.at(provisional, codes, provisional_occupancy)
+    return list(groups), totals, provisional, np.bincount(codes, minlength=len(groups))
+
+def aggregate_occupancy_data_cloud(matrix, axis):
+    """Aggregate occupancy data by various dimensions; ``axis`` is the report's full DateAxis"""
+    occupancy = matrix.occupancy
+    provisional_occupancy = np.where(matrix.provisional, occupancy, 0)
+    dates = axis.dates
+    # Column positions in date order
+    order = matrix.axis.order
+    sorted_dates = [matrix.dates[i] for i in order.tolist()]
+    
+    # Daily totals by property / accommodation type: grouped row sums
+    def daily_lists(labels, totals):
+        return {
+            label: [{'date': date, 'occupancy': occ} for date, occ in zip(sorted_dates, row)]
+            for label, row in zip(labels, totals[:, order].tolist())
+        }
+    
+    # Monthly totals by property / accommodation type: grouped sums reduced across month boundaries
+    def monthly_maps(labels, totals, provisional, row_counts):
+        if len(matrix.dates):
+            month_totals = np.add.reduceat(totals, matrix.axis.month_starts, axis=1).tolist()
+            month_provisional = np.add.reduceat(provisional, matrix.axis.month_starts, axis=1).tolist()
+        else:
+            month_totals = month_provisional = [[] for _ in labels]
+        month_days = np.outer(row_counts, matrix.axis.month_lengths).tolist()
+        return {
+            label: _monthly_occupancy(matrix.axis.month_keys, month_totals[i], month_provisional[i], month_days[i])
+            for i, label in enumerate(labels)
+        }
+    
+    by_property = _group_occupancy_rows(matrix.properties, occupancy, provisional_occupancy)
+    by_accommodation = _group_occupancy_rows(matrix.accommodation_types, occupancy, provisional_occupancy)
+    
+    # Overall daily totals: column sums (only dates that some row reported)
+    reported = order if matrix.rows else order[:0]
+    daily_total = occupancy.sum(axis=0)
+    daily_provisional = provisional_occupancy.sum(axis=0)
+    daily_totals_list = [
+        {
+            'date': matrix.dates[i],
+            'total': total,
+            'confirmed': total - provisional,
+            'provisional': provisional
+        }
+        for i, total, provisional in zip(reported.tolist(), daily_total[reported].tolist(), daily_provisional[reported].tolist())
+    ]
+    
+    # Calculate summary statistics
+    total_occupancy = int(daily_total.sum())
+    total_provisional = int(daily_provisional.sum())
+    total_confirmed = total_occupancy - total_provisional
+    
+    # Find peak occupancy dates (ties keep report column order)
+    peak_columns = np.argsort(-daily_total, kind='stable')[:10] if matrix.rows else order[:0]
+    
+    # Calculate average daily occupancy
+    avg_daily = total_occupancy / len(reported) if len(reported) else 0
+    
+    summary = {
+        'total_occupancy': total_occupancy,
+        'total_confirmed': total_confirmed,
+        'total_provisional': total_provisional,
+        'average_daily_occupancy': round(avg_daily, 2),
+        'date_range': {
+            'start': dates[0] if dates else None,
+            'end': dates[-1] if dates else None,
+            'total_days': len(dates)
+        },
+        'peak_dates': [
+            {
+                'date': matrix.dates[i],
+                'occupancy': int(daily_total[i]),
+                'confirmed': int(daily_total[i] - daily_provisional[i]),
+                'provisional': int(daily_provisional[i])
+            }
+            for i in peak_columns.tolist()
+        ],
+        'properties': list(set(matrix.properties)),
+        'accommodation_types': list(set(matrix.accommodation_types))
+    }
+    
+    # Per-cell records, built from the arrays only for the output
+    raw_records = []
+    for (property_name, accommodation_type), counts, flags in zip(matrix.rows, occupancy.tolist(), matrix.provisional.tolist()):
+        raw_records.append({
+            'property': property_name,
+            'accommodation_type': accommodation_type,
+            'occupancy_data': [
+                {'date': date, 'occupancy': occ, 'is_provisional': is_provisional}
+                for date, occ, is_provisional in zip(matrix.dates, counts, flags)
+            ]
+        })
+    
+    return {
+        'summary': summary,
+        'daily_totals': daily_totals_list,
+        'daily_by_property': daily_lists(*by_property[:2]),
+        'daily_by_accommodation': daily_lists(*by_accommodation[:2]),
+        'monthly_by_property': monthly_maps(*by_property),
+        'monthly_by_accommodation': monthly_maps(*by_accommodation),
+        'raw_records': raw_records
+    }
+
+def _occupancy_csv_rows(csv_content):
+    """Stream the report's non-blank CSV rows"""
+    for row in csv.reader(io.StringIO(csv_content)):
+        if len(row) > 1 or (row and row[0].strip()):
+            yield row
+
+def _find_occupancy_header(rows):
+    """Index of the row with the most month/year cells (more than _OCCUPANCY_HEADER_MIN_MONTHS), or None"""
+    header_row_idx = None
+    max_month_count = _OCCUPANCY_HEADER_MIN_MONTHS
+    for idx, row in enumerate(rows):
+        month_count = sum(1 for cell in row if _OCCUPANCY_MONTH_PATTERN.match(cell.strip()))
+        if month_count > max_month_count:
+            max_month_count = month_count
+            header_row_idx = idx
+    return header_row_idx
+
+def process_occupancy_report_cloud(csv_content: str):
+    """Process the occupancy report CSV content in one streaming pass (no pandas)"""
+    rows = _occupancy_csv_rows(csv_content)
+    
+    # Find the header row (row with month/year labels) near the top of the report
+    preamble = list(itertools.islice(rows, OCCUPANCY_HEADER_SCAN_ROWS))
+    header_row_idx = _find_occupancy_header(preamble)
+    if header_row_idx is None:
+        header_row_idx = 11
+    
+    # Parse dates from header, once, into the axis the parser and aggregations slice
+    axis = DateAxis.from_dates(parse_occupancy_date_from_header(preamble[header_row_idx]))
+    
+    # Process data rows (starting after the day number row) straight into the occupancy arrays
+    data_start_idx = header_row_idx + 3
+    matrix = parse_occupancy_rows(itertools.chain(preamble[data_start_idx:], rows), axis)
+    
+    # Aggregate data by different dimensions
+    results = aggregate_occupancy_data_cloud(matrix, axis)
+    
+    return results
+
+def validate_occupancy_header(csv_content):
+    """Check that the report's first rows include the month/year date header; raises ValueError otherwise"""
+    preamble = itertools.islice(_occupancy_csv_rows(csv_content), OCCUPANCY_HEADER_SCAN_ROWS)
+    if _find_occupancy_header(preamble) is None:
+        raise ValueError("Occupancy report has no month/year date header row")
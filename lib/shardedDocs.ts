@@ -0,0 +1,42 @@
+import { Firestore } from 'firebase-admin/firestore'
+
+/**
+ * Reassembly of documents written by the function's write_sharded_document.
+ * A sharded document keeps its small fields in the head doc plus a `_shards`
+ * descriptor; the large map/list fields are split across `{path}/shards/{id}`.
+ */
+
+export async function mergeShards(db: Firestore, docPath: string, data: any): Promise<any> {
+  const descriptor = data?._shards
+  if (!descriptor) return data
+
+  const ids: string[] = descriptor.ids || []
+  const fields: Record<string, 'map' | 'list'> = descriptor.fields || {}
+  const merged: any = { ...data }
+  delete merged._shards
+  Object.entries(fields).forEach(([field, kind]) => {
+    merged[field] = kind === 'list' ? [] : {}
+  })
+
+  if (ids.length > 0) {
+    const snaps = await db.getAll(...ids.map(id => db.doc(`${docPath}/shards/${id}`)))
+    snaps.forEach((snap, i) => {
+      if (!snap.exists) {
+        throw new Error(`Missing shard ${ids[i]} of ${docPath}`)
+      }
+      const shard: any = snap.data() || {}
+      if (fields[shard.field] === 'list') {
+        merged[shard.field].push(...(shard.items || []))
+      } else if (fields[shard.field] === 'map') {
+        Object.assign(merged[shard.field], shard.items || {})
+      }
+    })
+  }
+  return merged
+}
+
+export async function readShardedDoc(db: Firestore, docPath: string): Promise<any | null> {
+  const snap = await db.doc(docPath).get()
+  if (!snap.exists) return null
+  return mergeShards(db, docPath, snap.data() || {})
+}
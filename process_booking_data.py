@@ -127,28 +127,35 @@ def calculate_income_and_disbursements(df):
     
     return df
 
+def _running_total(values):
+    """Sum values in row order (cumsum keeps float totals identical to a running sum)"""
+    if np.issubdtype(values.dtype, np.integer):
+        return int(values.sum())
+    return float(np.cumsum(values)[-1])
+
 def process_revenue_and_booking_metrics(df):
     """Process revenue trends and booking metrics"""
     print("Processing revenue and booking metrics...")
     
-    # Revenue trends by month
+    # Revenue trends by month, keyed in order of first appearance
+    valid = df['Arrival date'].notna().to_numpy()
+    month_keys = df['Year'].to_numpy()[valid].astype('int64') * 100 + df['Month'].to_numpy()[valid].astype('int64')
+    codes, uniques = pd.factorize(month_keys)
+    order = np.argsort(codes, kind='stable')
+    counts = np.bincount(codes, minlength=len(uniques))
+    bounds = np.concatenate(([0], np.cumsum(counts)))
+    
+    revenue = df['Revenue Total'].to_numpy()[valid][order]
+    bed_nights = df['Bed nights'].to_numpy()[valid][order]
+    
     revenue_trends = {}
-    for _, row in df.iterrows():
-        if pd.notna(row['Arrival date']):
-            year = int(row['Year'])
-            month = int(row['Month'])
-            key = f"{year}-{month:02d}"
-            
-            if key not in revenue_trends:
-                revenue_trends[key] = {
-                    'revenue': 0,
-                    'bookings': 0,
-                    'bed_nights': 0
-                }
-            
-            revenue_trends[key]['revenue'] += row['Revenue Total']
-            revenue_trends[key]['bookings'] += 1
-            revenue_trends[key]['bed_nights'] += row['Bed nights']
+    for i, month_key in enumerate(uniques):
+        start, stop = bounds[i], bounds[i + 1]
+        revenue_trends[f"{month_key // 100}-{month_key % 100:02d}"] = {
+            'revenue': _running_total(revenue[start:stop]),
+            'bookings': int(counts[i]),
+            'bed_nights': _running_total(bed_nights[start:stop])
+        }
     
     return revenue_trends
 
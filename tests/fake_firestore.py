@@ -0,0 +1,139 @@
+"""
+In-memory stand-in for the parts of the Firestore client the functions use: document and
+collection references, simple queries, batched writes, get_all and transactions. Patch
+google.cloud.firestore.transactional with ``transactional`` below to run transactions on it.
+"""
+
+import copy
+import threading
+
+class FakeSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return copy.deepcopy(self._data)
+
+class FakeDocument:
+    def __init__(self, db, path):
+        self.db = db
+        self.path = path
+        self.id = path.rsplit('/', 1)[-1]
+
+    def get(self, transaction=None):
+        return FakeSnapshot(self, self.db.docs.get(self.path))
+
+    def set(self, data, merge=False):
+        with self.db.lock:
+            if merge and self.path in self.db.docs:
+                self.db.docs[self.path].update(copy.deepcopy(data))
+            else:
+                self.db.docs[self.path] = copy.deepcopy(data)
+
+    def update(self, data):
+        with self.db.lock:
+            if self.path not in self.db.docs:
+                raise KeyError(f'No document to update: {self.path}')
+            self.db.docs[self.path].update(copy.deepcopy(data))
+
+    def delete(self):
+        with self.db.lock:
+            self.db.docs.pop(self.path, None)
+
+    def collection(self, name):
+        return FakeCollection(self.db, f'{self.path}/{name}')
+
+    def collections(self):
+        names = {path[len(self.path) + 1:].split('/')[0] for path in self.db.docs if path.startswith(self.path + '/')}
+        return [self.collection(name) for name in sorted(names)]
+
+class FakeCollection:
+    def __init__(self, db, path):
+        self.db = db
+        self.path = path
+
+    def document(self, doc_id):
+        return FakeDocument(self.db, f'{self.path}/{doc_id}')
+
+    def list_documents(self):
+        ids = {path[len(self.path) + 1:].split('/')[0] for path in self.db.docs if path.startswith(self.path + '/')}
+        return [self.document(doc_id) for doc_id in sorted(ids)]
+
+    def stream(self):
+        return [reference.get() for reference in self.list_documents() if reference.path in self.db.docs]
+
+    def order_by(self, field, direction='ASCENDING'):
+        return FakeQuery(self).order_by(field, direction)
+
+class FakeQuery:
+    def __init__(self, collection, orders=(), count=None):
+        self.collection = collection
+        self.orders = list(orders)
+        self.count = count
+
+    def order_by(self, field, direction='ASCENDING'):
+        return FakeQuery(self.collection, self.orders + [(field, direction)], self.count)
+
+    def limit(self, count):
+        return FakeQuery(self.collection, self.orders, count)
+
+    def stream(self):
+        snapshots = self.collection.stream()
+        for field, direction in reversed(self.orders):
+            snapshots = [snapshot for snapshot in snapshots if field in snapshot.to_dict()]
+            snapshots.sort(key=lambda snapshot: snapshot.to_dict()[field], reverse=direction == 'DESCENDING')
+        return snapshots[:self.count] if self.count is not None else snapshots
+
+class FakeBatch:
+    def __init__(self, db):
+        self.db = db
+        self.ops = []
+
+    def set(self, reference, data, merge=False):
+        self.ops.append(lambda: reference.set(data, merge=merge))
+
+    def update(self, reference, data):
+        self.ops.append(lambda: reference.update(data))
+
+    def delete(self, reference):
+        self.ops.append(reference.delete)
+
+    def commit(self):
+        assert len(self.ops) <= 500, 'Firestore batches are capped at 500 writes'
+        for op in self.ops:
+            op()
+
+class FakeTransaction(FakeBatch):
+    """Writes are buffered until ``transactional`` commits them"""
+
+class FakeFirestore:
+    def __init__(self):
+        self.docs = {}
+        self.lock = threading.RLock()
+
+    def document(self, path):
+        return FakeDocument(self, path)
+
+    def collection(self, path):
+        return FakeCollection(self, path)
+
+    def batch(self):
+        return FakeBatch(self)
+
+    def transaction(self):
+        return FakeTransaction(self)
+
+    def get_all(self, references):
+        return [reference.get() for reference in references]
+
+def transactional(fn):
+    """Stand-in for google.cloud.firestore.transactional: run ``fn`` and commit its writes under the db lock"""
+    def run(transaction, *args, **kwargs):
+        with transaction.db.lock:
+            result = fn(transaction, *args, **kwargs)
+            transaction.commit()
+        return result
+    return run
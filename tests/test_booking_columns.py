@@ -0,0 +1,62 @@
+"""
+Tests for the default booking_columns projection ('dashboard'): it must leave every aggregate
+unchanged, keep each field the dashboard's booking views and the weekly sales report read,
+and drop the export columns nothing reads.
+"""
+
+import contextlib
+import io
+import os
+import sys
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(TESTS_DIR, 'fixtures')
+sys.path.insert(0, os.path.join(os.path.dirname(TESTS_DIR), 'functions'))
+
+import main  # noqa: E402
+from fake_firestore import FakeFirestore  # noqa: E402
+
+# Booking record fields read by components/, lib/dataFilters.ts and the weekly report
+DASHBOARD_READ_FIELDS = [
+    'Reservation #', 'Reservation name', 'Status', 'Booking Class', 'Agent', 'Source',
+    'Arrival date', 'Departure date', 'Bed nights', 'Revenue Total', 'Total amount outstanding'
+]
+
+def _fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), encoding='utf-8') as f:
+        return f.read()
+
+@pytest.fixture
+def run(monkeypatch):
+    monkeypatch.setattr(main, 'get_firestore_client', FakeFirestore)
+
+    def run(booking_columns):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return main.run_booking_pipeline(_fixture('booking_export.csv'), booking_columns)['dashboard_data']
+    return run
+
+def _records(dashboard_data):
+    return [record for months in dashboard_data['monthly_bookings'].values() for records in months.values() for record in records]
+
+def test_default_option_is_the_dashboard_projection():
+    assert main._parse_booking_columns(None) == main.BOOKING_COLUMNS_DASHBOARD
+    assert main._parse_booking_columns('all') is None
+
+def test_dashboard_projection_keeps_aggregates_and_read_fields(run):
+    projected = run(main.BOOKING_COLUMNS_DASHBOARD)
+    full = run(None)
+
+    for key in full:
+        if key not in ('monthly_bookings', 'summary'):
+            assert projected[key] == full[key], key
+    drop_generated = lambda summary: {k: v for k, v in summary.items() if k != 'report_generated'}
+    assert drop_generated(projected['summary']) == drop_generated(full['summary'])
+
+    projected_records, full_records = _records(projected), _records(full)
+    assert len(projected_records) == len(full_records)
+    for record, full_record in zip(projected_records, full_records):
+        assert set(DASHBOARD_READ_FIELDS) <= set(record)
+        assert record == {field: full_record[field] for field in record}
+    assert 'Email' in full_records[0] and 'Email' not in projected_records[0]
@@ -0,0 +1,103 @@
+"""
+Tests for the work done around publishing a booking upload, which the synchronous request and
+the async job share: the booking-count check against the live dataset, raw upload storage and
+the weekly sales report. The upload route then only needs the ?response=summary body.
+"""
+
+import contextlib
+import io
+import json
+import os
+import sys
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(TESTS_DIR, 'fixtures')
+sys.path.insert(0, os.path.join(os.path.dirname(TESTS_DIR), 'functions'))
+
+import main  # noqa: E402
+import fake_firestore  # noqa: E402
+from fake_firestore import FakeFirestore  # noqa: E402
+from google.cloud import firestore  # noqa: E402
+
+def _fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), encoding='utf-8') as f:
+        return f.read()
+
+@pytest.fixture
+def db(monkeypatch):
+    db = FakeFirestore()
+    monkeypatch.setattr(main, 'get_firestore_client', lambda: db)
+    monkeypatch.setattr(firestore, 'transactional', fake_firestore.transactional)
+    return db
+
+class SummaryRequest:
+    """The parts of a request _json_response reads, for the upload route's ?response=summary"""
+    args = {'response': 'summary'}
+    headers = {}
+
+def _docs(db, collection):
+    return {path: data for path, data in db.docs.items() if path.startswith(collection + '/')}
+
+def test_incomplete_upload_is_rejected_before_publishing(db):
+    db.document(main.DASHBOARD_POINTER_DOC).set({'run_id': 'previous', 'summary': {'total_bookings': 1000}})
+
+    with contextlib.redirect_stdout(io.StringIO()), pytest.raises(main.UploadRejected) as rejected:
+        main.run_booking_pipeline(_fixture('booking_export.csv'))
+
+    assert rejected.value.args[0] == 'Upload rejected: dataset appears incomplete'
+    assert db.docs[main.DASHBOARD_POINTER_DOC]['run_id'] == 'previous'
+    assert not _docs(db, main.DASHBOARD_VERSIONS) and not _docs(db, main.RAW_UPLOADS)
+
+def test_async_job_stores_the_upload_and_builds_the_weekly_report(db):
+    csv_content = _fixture('booking_export.csv')
+    db.document(f'{main.WEEKLY_SALES_SNAPSHOTS}/2000-W01').set({'snapshot_at': '2000-01-03T00:00:00', 'is_final': True})
+    for ref, status in (('WB194', 'Provisional'), ('WB244', 'Provisional'), ('GONE-1', 'Provisional')):
+        db.document(f'{main.WEEKLY_SALES_SNAPSHOTS}/2000-W01/bookings/{ref}').set({'ref': ref, 'status': status})
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        job = main.enqueue_job(db, 'bookings', csv_content, {'booking_columns': 'dashboard', 'filename': 'export.csv'})
+        main.run_job(db, job['job_id'], db.docs[job['status_doc']])
+
+    job_doc = db.docs[job['status_doc']]
+    assert job_doc['status'] == 'done'
+    assert db.docs[main.DASHBOARD_POINTER_DOC]['run_id'] == job['job_id']
+
+    raw_id = job_doc['result']['raw_upload_id']
+    raw = db.docs[f'{main.RAW_UPLOADS}/{raw_id}']
+    assert raw['filename'] == 'export.csv'
+    parts = [db.docs[f'{main.RAW_UPLOADS}/{raw_id}/parts/{i:03d}']['content'] for i in range(raw['parts'])]
+    assert ''.join(parts) == csv_content
+
+    week_key = job_doc['result']['weekly_report']['week_key']
+    report = db.docs[f'{main.WEEKLY_SALES_REPORTS}/{week_key}']
+    assert report['baseline_snapshot_week'] == '2000-W01'
+    categories = {row['ref']: row['category'] for row in report['updates']}
+    assert categories['WB194'] == 'Moved Provisional to Confirmed'
+    assert 'WB244' not in categories
+    assert [row['ref'] for row in report['drop_off']] == ['GONE-1']
+    snapshot_bookings = _docs(db, f'{main.WEEKLY_SALES_SNAPSHOTS}/{week_key}/bookings')
+    assert len(snapshot_bookings) == report['total_current_bookings']
+
+def test_rejected_job_records_why(db):
+    db.document(main.DASHBOARD_POINTER_DOC).set({'run_id': 'previous', 'summary': {'total_bookings': 1000}})
+    with contextlib.redirect_stdout(io.StringIO()):
+        job = main.enqueue_job(db, 'bookings', _fixture('booking_export.csv'), {'booking_columns': 'dashboard'})
+        main.run_job(db, job['job_id'], db.docs[job['status_doc']])
+
+    job_doc = db.docs[job['status_doc']]
+    assert job_doc['status'] == 'rejected'
+    assert job_doc['error'] == 'Upload rejected: dataset appears incomplete'
+    assert '1000 bookings' in job_doc['details']
+
+def test_summary_response_carries_what_the_upload_route_reads(db):
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = main.run_booking_pipeline(_fixture('booking_export.csv'), filename='export.csv')
+    body = json.loads(main._json_response(SummaryRequest(), result).get_data())
+
+    assert 'dashboard_data' not in body
+    assert body['summary'] == json.loads(json.dumps(result['summary'], default=str))
+    assert body['storage']['run_id'] == db.docs[main.DASHBOARD_POINTER_DOC]['run_id']
+    assert body['raw_upload_id'] == result['raw_upload_id']
+    assert body['weekly_report']['week_key'] == result['weekly_report']['week_key']
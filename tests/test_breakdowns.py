@@ -0,0 +1,42 @@
+"""
+Regression test for the cube roll-ups in create_breakdowns: like the nested per-level groupbys
+they replaced, a year or month whose rows all lack a Status (or Booking Class) must still get
+an empty {} entry rather than disappear from the status/class breakdowns.
+"""
+
+import contextlib
+import io
+import os
+import sys
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(TESTS_DIR, 'fixtures')
+sys.path.insert(0, os.path.join(os.path.dirname(TESTS_DIR), 'functions'))
+
+import main  # noqa: E402
+
+def _fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), encoding='utf-8') as f:
+        return f.read()
+
+def _breakdowns(blank_status_in, blank_class_in):
+    """create_breakdowns on the fixture export, with Status / Booking Class blanked in one (year, month) each"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        df, schema = main.load_and_clean_data(_fixture('booking_export.csv'))
+        rules = main.BusinessRules.from_config(main.load_business_rules_config())
+        df, _ = main.apply_business_rules(df, schema, rules)
+        df, _ = main.calculate_income_and_disbursements(df, schema)
+        year_col, month_col = schema.column('Year'), schema.column('Month')
+        for (year, month), name in ((blank_status_in, 'Status'), (blank_class_in, 'Booking Class')):
+            df.loc[(df[year_col] == year) & (df[month_col] == month), schema.column(name)] = None
+        return main.create_breakdowns(df, schema)
+
+def test_periods_without_status_keep_empty_entries():
+    breakdowns = _breakdowns(blank_status_in=(2025, 4), blank_class_in=(2024, 6))
+
+    assert breakdowns['monthly_breakdown']['2025'][4.0] == {}
+    assert breakdowns['monthly_breakdown_by_class']['2024'][6.0] == {}
+    assert breakdowns['monthly_breakdown_combined']['2024'][6.0] == {}
+    for booking_class in breakdowns['monthly_breakdown_combined']['2025'][4.0].values():
+        assert booking_class == {}
+    assert list(breakdowns['monthly_breakdown']['2025']) == sorted(breakdowns['monthly_breakdown']['2025'])
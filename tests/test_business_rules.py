@@ -0,0 +1,32 @@
+"""
+Business rules config validation: list fields must be lists of strings, so a mistyped value
+fails the upload instead of silently matching nothing.
+"""
+
+import os
+import sys
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(TESTS_DIR), 'functions'))
+
+import main  # noqa: E402
+
+def test_bundled_rules_are_valid(monkeypatch):
+    monkeypatch.setattr(main, 'get_firestore_client', lambda: None)
+    config = main.load_business_rules_config()
+    assert config['excluded_properties'] == ['MV - Matusadona']
+
+@pytest.mark.parametrize('config, field', [
+    ({'excluded_properties': 'Camp X'}, 'excluded_properties'),
+    ({'zero_accommodation_exceptions': ['WB1', 2]}, 'zero_accommodation_exceptions'),
+    ({'staff_filter': {'keywords': 'Staff'}}, 'staff_filter.keywords'),
+    ({'staff_filter': ['Staff']}, 'staff_filter'),
+])
+def test_mistyped_list_fields_are_rejected(config, field):
+    with pytest.raises(ValueError, match=field.replace('.', r'\.')):
+        main.validate_business_rules_config(config, 'test')
+
+def test_missing_fields_are_allowed():
+    assert main.validate_business_rules_config({'staff_filter': {}}, 'test') == {'staff_filter': {}}
@@ -0,0 +1,68 @@
+"""
+Tests for expiring dashboard versions: publishing leaves old versions to the pointer-write
+trigger, which keeps the newest DASHBOARD_VERSIONS_KEPT (and everything they still reference)
+and deletes the legacy per-year and per-month collections.
+"""
+
+import contextlib
+import io
+import itertools
+import os
+import sys
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(TESTS_DIR), 'functions'))
+
+import main  # noqa: E402
+from fake_firestore import FakeFirestore  # noqa: E402
+
+def _dashboard_data(run):
+    """2024 is identical in every run (carried forward); 2025 changes each time"""
+    return {
+        'summary': {'total_bookings': 2, 'run': run},
+        'yearly_breakdown': {
+            '2024': {'Confirmed': {'bed_nights': 3, 'revenue_total': 150.0}},
+            '2025': {'Confirmed': {'bed_nights': run, 'revenue_total': 10.0 * run}}
+        },
+        'monthly_bookings': {'2025': {'4': [{'Status': 'Confirmed', 'Revenue Total': 10.0 * run}]}},
+        'revenue_trends': {'2025-04': {'revenue': 10.0 * run}}
+    }
+
+@pytest.fixture
+def db(monkeypatch):
+    db = FakeFirestore()
+    run_ids = (f'run-{i:02d}' for i in itertools.count())
+    monkeypatch.setattr(main, 'get_firestore_client', lambda: db)
+    monkeypatch.setattr(main, '_new_run_id', lambda: next(run_ids))
+    return db
+
+def _versions(db):
+    """Runs whose manifest doc exists"""
+    return [reference.id for reference in db.collection(main.DASHBOARD_VERSIONS).list_documents() if reference.path in db.docs]
+
+def test_publishing_leaves_old_versions_to_the_trigger(db):
+    with contextlib.redirect_stdout(io.StringIO()):
+        for run in range(5):
+            main.persist_dashboard_data(_dashboard_data(run))
+
+    assert _versions(db) == [f'run-{i:02d}' for i in range(5)]
+
+def test_trigger_keeps_the_newest_versions_and_removes_legacy_collections(db):
+    db.document('dashboard_data_by_year/2024').set({'year': '2024'})
+    db.document('dashboard_monthly_bookings/2024-4').set({'year': '2024', 'month': '4', 'bookings': []})
+    with contextlib.redirect_stdout(io.StringIO()):
+        for run in range(5):
+            main.persist_dashboard_data(_dashboard_data(run))
+        main.collect_dashboard_versions_on_publish(None)
+
+    assert _versions(db) == ['run-02', 'run-03', 'run-04']
+    assert not any(path.split('/')[0] in main.LEGACY_DASHBOARD_COLLECTIONS for path in db.docs)
+    # The unchanged 2024 doc was first written by run-00 and must outlive it
+    manifest = main.read_sharded_document(db, f'{main.DASHBOARD_VERSIONS}/run-04')
+    paths = [entry['path'] for entries in manifest['documents'].values() for entry in entries.values()]
+    assert f'{main.DASHBOARD_VERSIONS}/run-00/by_year/2024' in paths
+    assert all(path in db.docs for path in paths + manifest['bundle']['parts'])
+    assert [path for path in db.docs if path.startswith(f'{main.DASHBOARD_VERSIONS}/run-00')] == \
+        [f'{main.DASHBOARD_VERSIONS}/run-00/by_year/2024']
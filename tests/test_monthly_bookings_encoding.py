@@ -0,0 +1,61 @@
+"""
+Round-trip test for the columnar monthly bookings docs: decode_monthly_bookings must give back,
+byte for byte once serialised, the records create_breakdowns produced for every month of the
+fixture booking export, and the hand-made edge cases (signed zeros, blanks, ragged records).
+"""
+
+import contextlib
+import io
+import json
+import os
+import sys
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(TESTS_DIR, 'fixtures')
+sys.path.insert(0, os.path.join(os.path.dirname(TESTS_DIR), 'functions'))
+
+import main  # noqa: E402
+
+def _fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), encoding='utf-8') as f:
+        return f.read()
+
+def _monthly_bookings():
+    with contextlib.redirect_stdout(io.StringIO()):
+        df, schema = main.load_and_clean_data(_fixture('booking_export.csv'))
+        rules = main.BusinessRules.from_config(main.load_business_rules_config())
+        df, _ = main.apply_business_rules(df, schema, rules)
+        df, _ = main.calculate_income_and_disbursements(df, schema)
+        return main.create_breakdowns(df, schema)['monthly_bookings']
+
+def test_fixture_months_round_trip():
+    monthly_bookings = _monthly_bookings()
+    assert monthly_bookings
+    encodings = set()
+    for year, months in monthly_bookings.items():
+        for month, records in months.items():
+            doc = main._monthly_bookings_doc(year, month, records)
+            assert doc['encoding'] == 'columnar'
+            encodings.update(tuple(sorted(column)) for column in doc['columns'])
+            # Stored docs go through JSON-like serialisation; decode what would come back
+            stored = json.loads(json.dumps(doc))
+            assert json.dumps(main.decode_monthly_bookings(stored)) == json.dumps(records)
+    # The fixture exercises the dense, dictionary and sparse column encodings
+    assert encodings == {('values',), ('codes', 'dictionary'), ('default', 'index', 'values')}
+
+def test_edge_cases_round_trip():
+    records = [
+        {'Status': 'Confirmed', 'Amount': 0.0, 'Note': None},
+        {'Status': 'Confirmed', 'Amount': -0.0, 'Note': 'late'},
+        {'Status': None, 'Amount': 0.0, 'Note': None},
+        {'Status': 'Confirmed', 'Amount': 12.5, 'Note': None},
+    ]
+    doc = main.encode_monthly_bookings(records)
+    assert json.dumps(main.decode_monthly_bookings(doc)) == json.dumps(records)
+
+    assert main.decode_monthly_bookings(main.encode_monthly_bookings([])) == []
+    assert main.decode_monthly_bookings(main.encode_monthly_bookings([{}, {}])) == [{}, {}]
+
+    ragged = [{'a': 1.0, 'b': 2.0}, {'b': 2.0, 'a': 1.0}]
+    assert main.encode_monthly_bookings(ragged) is None
+    assert main.decode_monthly_bookings(main._monthly_bookings_doc('2025', '1', ragged)) == ragged
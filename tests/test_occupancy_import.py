@@ -0,0 +1,27 @@
+"""
+Cold-start budget for the occupancy function: importing functions/occupancy.py in a fresh
+interpreter must not load pandas and must stay within OCCUPANCY_IMPORT_BUDGET_S.
+"""
+
+import os
+import subprocess
+import sys
+
+FUNCTIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'functions')
+sys.path.insert(0, FUNCTIONS_DIR)
+
+import occupancy  # noqa: E402
+
+def _cold_import():
+    """(seconds, pandas loaded) for `import occupancy` in a new interpreter"""
+    code = ("import sys, time; start = time.perf_counter(); import occupancy; "
+            "print(time.perf_counter() - start, 'pandas' in sys.modules)")
+    result = subprocess.run([sys.executable, '-c', code], cwd=FUNCTIONS_DIR, capture_output=True, text=True, check=True)
+    seconds, pandas_loaded = result.stdout.split()
+    return float(seconds), pandas_loaded == 'True'
+
+def test_occupancy_import_skips_pandas_and_fits_budget():
+    # Best of three, so one slow run on a busy machine does not fail the budget
+    runs = [_cold_import() for _ in range(3)]
+    assert not any(pandas_loaded for _, pandas_loaded in runs)
+    assert min(seconds for seconds, _ in runs) <= occupancy.OCCUPANCY_IMPORT_BUDGET_S
@@ -0,0 +1,35 @@
+"""
+Regression test for the matrix-based occupancy pipeline: process_occupancy_report_cloud must
+reproduce the output of the original record-by-record parser on the fixture report.
+
+fixtures/occupancy_report_expected.json was produced by that parser (with the summary's
+property and accommodation type lists sorted, as it built them from sets). The fixture report
+spans an excluded month and two included ones, and includes padded property names, ragged
+short rows, malformed cells ('x', '**5', '1.5', ...), a row with no property and a metadata
+row after the data.
+"""
+
+import contextlib
+import io
+import json
+import os
+import sys
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(TESTS_DIR, 'fixtures')
+sys.path.insert(0, os.path.join(os.path.dirname(TESTS_DIR), 'functions'))
+
+import occupancy  # noqa: E402
+
+def _fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), encoding='utf-8') as f:
+        return f.read()
+
+def test_occupancy_report_matches_record_implementation():
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = occupancy.process_occupancy_report_cloud(_fixture('occupancy_report.csv'))
+
+    result = json.loads(json.dumps(result))
+    result['summary']['properties'] = sorted(result['summary']['properties'])
+    result['summary']['accommodation_types'] = sorted(result['summary']['accommodation_types'])
+    assert result == json.loads(_fixture('occupancy_report_expected.json'))
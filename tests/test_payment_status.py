@@ -0,0 +1,95 @@
+"""
+Regression test for the vectorised payment-status classification: payment_status and
+payment_status_by_month must match the original row-by-row (iterrows) classification,
+grouped by arrival month, on the fixture booking export.
+
+The fixture's outstanding/revenue amounts are rewritten so every bucket occurs, along with
+blank amounts, zero revenue and bookings that fall in no bucket.
+"""
+
+import contextlib
+import io
+import os
+import sys
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(TESTS_DIR, 'fixtures')
+sys.path.insert(0, os.path.join(os.path.dirname(TESTS_DIR), 'functions'))
+
+import main  # noqa: E402
+
+# Outstanding amount as a fraction of revenue, cycled over the fixture rows (None = blank)
+OUTSTANDING_FRACTIONS = [0.0, 0.5, 1.0, 1.5, -0.25, None]
+
+def _fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), encoding='utf-8') as f:
+        return f.read()
+
+def _iterrows_payment_status(df, schema):
+    """The original per-row classification, with each booking also counted under its arrival month"""
+    import pandas as pd
+    outstanding_col = schema.column('Total amount outstanding')
+    revenue_col = schema.column('Revenue Total')
+    payment_status = {bucket: 0 for bucket in main.PAYMENT_STATUS_BUCKETS}
+    by_month = {}
+    for _, row in df.iterrows():
+        outstanding = float(row[outstanding_col]) if pd.notna(row[outstanding_col]) else 0
+        revenue = float(row[revenue_col]) if pd.notna(row[revenue_col]) else 0
+
+        if outstanding <= 0 and revenue > 0:
+            bucket = 'fully_paid'
+        elif outstanding > 0 and outstanding < revenue:
+            bucket = 'partially_paid'
+        elif outstanding > 0 and outstanding >= revenue:
+            bucket = 'unpaid'
+        elif outstanding < 0:
+            bucket = 'overpaid'
+        else:
+            continue
+        payment_status[bucket] += 1
+
+        year, month = row[schema.column('Year')], row[schema.column('Month')]
+        if pd.isna(year) or pd.isna(month):
+            continue
+        month_totals = by_month.setdefault(str(int(year)), {}).setdefault(
+            str(int(month)),
+            {name: {'count': 0, 'outstanding': 0.0} for name in main.PAYMENT_STATUS_BUCKETS}
+        )
+        month_totals[bucket]['count'] += 1
+        month_totals[bucket]['outstanding'] += outstanding
+    return payment_status, by_month
+
+def _flatten(by_month):
+    """{(year, month, bucket, measure): value}, so pytest.approx can compare the nested map"""
+    return {
+        (year, month, bucket, measure): value
+        for year, months in by_month.items()
+        for month, buckets in months.items()
+        for bucket, totals in buckets.items()
+        for measure, value in totals.items()
+    }
+
+def test_payment_status_matches_iterrows_classification():
+    with contextlib.redirect_stdout(io.StringIO()):
+        df, schema = main.load_and_clean_data(_fixture('booking_export.csv'))
+        rules = main.BusinessRules.from_config(main.load_business_rules_config())
+        df, _ = main.apply_business_rules(df, schema, rules)
+        df, _ = main.calculate_income_and_disbursements(df, schema)
+
+        revenue_col = schema.column('Revenue Total')
+        outstanding = [
+            None if fraction is None else revenue * fraction
+            for revenue, fraction in zip(df[revenue_col], OUTSTANDING_FRACTIONS * len(df))
+        ]
+        df[schema.column('Total amount outstanding')] = outstanding
+        df.loc[df.index[::7], revenue_col] = 0.0
+        df.loc[df.index[3::11], revenue_col] = None
+
+        breakdowns = main.create_breakdowns(df, schema)
+
+    expected_status, expected_by_month = _iterrows_payment_status(df, schema)
+    assert all(expected_status.values())
+    assert breakdowns['payment_status'] == expected_status
+    assert _flatten(breakdowns['payment_status_by_month']) == pytest.approx(_flatten(expected_by_month))
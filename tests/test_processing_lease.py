@@ -0,0 +1,77 @@
+"""
+Tests for persisting under a ProcessingLease: a run superseded before its pointer flip stops
+with Superseded, but once dashboard/current names the run it is live and reports success even
+if a newer upload registers while it writes dashboard/data.
+"""
+
+import contextlib
+import io
+import os
+import sys
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(TESTS_DIR), 'functions'))
+
+import main  # noqa: E402
+import fake_firestore  # noqa: E402
+from fake_firestore import FakeFirestore  # noqa: E402
+from google.cloud import firestore  # noqa: E402
+
+DASHBOARD_DATA = {
+    'summary': {'total_bookings': 2, 'total_revenue': 150.0},
+    'yearly_breakdown': {'2025': {'Confirmed': {'bed_nights': 3, 'revenue_total': 150.0}}},
+    'monthly_bookings': {'2025': {'4': [{'Status': 'Confirmed', 'Revenue Total': 100.0},
+                                        {'Status': 'Confirmed', 'Revenue Total': 50.0}]}},
+    'revenue_trends': {'2025-04': {'revenue': 150.0}}
+}
+
+class LeaseSupersededAt(main.ProcessingLease):
+    """A lease that lets a newer upload register right after the first write to ``path``"""
+
+    def __init__(self, db, dataset, path):
+        super().__init__(db, dataset)
+        self.path = path
+        self.newer = None
+
+    def publish(self, path, data):
+        super().publish(path, data)
+        if path.startswith(self.path) and self.newer is None:
+            self.newer = main.ProcessingLease(self.db, self.dataset).register()
+
+@pytest.fixture
+def db(monkeypatch):
+    db = FakeFirestore()
+    monkeypatch.setattr(main, 'get_firestore_client', lambda: db)
+    monkeypatch.setattr(firestore, 'transactional', fake_firestore.transactional)
+    return db
+
+def test_superseded_after_publish_reports_success(db):
+    lease = LeaseSupersededAt(db, 'bookings', main.DASHBOARD_POINTER_DOC).register()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = main.persist_dashboard_data(DASHBOARD_DATA, lease=lease)
+
+    assert result['run_id'] == lease.token
+    assert result['superseded_after_publish_by'] == lease.newer.token
+    assert db.docs[main.DASHBOARD_POINTER_DOC]['run_id'] == lease.token
+    # dashboard/data is left for the newer run to write after its own flip
+    assert 'dashboard/data' not in db.docs
+
+def test_superseded_before_publish_raises(db):
+    lease = LeaseSupersededAt(db, 'bookings', main.DASHBOARD_VERSIONS).register()
+    with contextlib.redirect_stdout(io.StringIO()), pytest.raises(main.Superseded) as raised:
+        main.persist_dashboard_data(DASHBOARD_DATA, lease=lease)
+
+    assert raised.value.args[0] == lease.newer.token
+    assert main.DASHBOARD_POINTER_DOC not in db.docs
+
+def test_unopposed_run_publishes_everything(db):
+    lease = main.ProcessingLease(db, 'bookings').register()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = main.persist_dashboard_data(DASHBOARD_DATA, lease=lease)
+
+    assert result['superseded_after_publish_by'] is None
+    assert db.docs[main.DASHBOARD_POINTER_DOC]['run_id'] == lease.token
+    assert main.read_sharded_document(db, 'dashboard/data')['summary'] == DASHBOARD_DATA['summary']
+    assert db.docs[f'{main.PROCESSING_LEASES}/bookings']['holder'] is None
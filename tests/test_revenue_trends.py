@@ -0,0 +1,34 @@
+"""
+Regression test for the columnar revenue_trends computation: its JSON must match, byte for
+byte, the output of the original row-by-row (iterrows) loop on the fixture booking export.
+
+fixtures/revenue_trends_expected.json was produced by that loop; the fixture export includes
+rows with a blank revenue, a blank bed-nights count, a blank arrival date and a
+sub-cent revenue amount.
+"""
+
+import contextlib
+import io
+import json
+import os
+import sys
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(TESTS_DIR, 'fixtures')
+sys.path.insert(0, os.path.join(os.path.dirname(TESTS_DIR), 'functions'))
+
+import main  # noqa: E402
+
+def _fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), encoding='utf-8') as f:
+        return f.read()
+
+def test_revenue_trends_json_matches_iterrows_implementation():
+    with contextlib.redirect_stdout(io.StringIO()):
+        df, schema = main.load_and_clean_data(_fixture('booking_export.csv'))
+        rules = main.BusinessRules.from_config(main.load_business_rules_config())
+        df, _ = main.apply_business_rules(df, schema, rules)
+        df, _ = main.calculate_income_and_disbursements(df, schema)
+        revenue_trends = main.process_revenue_and_booking_metrics(df, schema)
+
+    assert json.dumps(revenue_trends) == _fixture('revenue_trends_expected.json')
@@ -0,0 +1,74 @@
+"""
+Tests for sharded documents: shard_document must size shards the way Firestore counts
+document size (numbers are 8 bytes however short their JSON), and read_sharded_document must
+reassemble exactly what write_sharded_document wrote.
+"""
+
+import contextlib
+import io
+import os
+import random
+import sys
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(TESTS_DIR), 'functions'))
+
+import main  # noqa: E402
+from fake_firestore import FakeFirestore  # noqa: E402
+
+FIRESTORE_DOC_LIMIT = 1024 * 1024
+
+def _firestore_doc_size(path, data):
+    """Document size per Firestore's storage size rules, including its name and fixed overhead"""
+    def size(value):
+        if value is None or isinstance(value, bool):
+            return 1
+        if isinstance(value, (int, float)):
+            return 8
+        if isinstance(value, str):
+            return len(value.encode('utf-8')) + 1
+        if isinstance(value, dict):
+            return sum(len(key.encode('utf-8')) + 1 + size(item) for key, item in value.items())
+        return sum(size(item) for item in value)
+    name = sum(len(segment.encode('utf-8')) + 1 for segment in path.split('/')) + 16
+    return name + size(data) + 32
+
+def _number_heavy_payload():
+    """~300 KB as compact JSON but ~2 MB as a Firestore document: mostly one-digit numbers"""
+    rnd = random.Random(15)
+    return {
+        'summary': {'total': 12.5, 'label': 'occupancy'},
+        'daily': {f'2025-{month:02d}': [rnd.randint(0, 9) for _ in range(12_000)] for month in range(1, 13)},
+        'flags': [rnd.random() < 0.5 for _ in range(20_000)],
+        'counts': [rnd.randint(0, 3) for _ in range(100_000)]
+    }
+
+def test_number_heavy_payload_shards_under_the_limit():
+    db = FakeFirestore()
+    payload = _number_heavy_payload()
+    with contextlib.redirect_stdout(io.StringIO()):
+        report = main.write_sharded_document(db, 'dashboard/data', payload)
+
+    assert report['shards'] > 1
+    for path, data in db.docs.items():
+        assert _firestore_doc_size(path, data) < FIRESTORE_DOC_LIMIT, path
+    assert main.read_sharded_document(db, 'dashboard/data') == payload
+
+def test_small_payload_is_not_sharded():
+    db = FakeFirestore()
+    payload = {'summary': {'total': 1}, 'counts': list(range(100))}
+    with contextlib.redirect_stdout(io.StringIO()):
+        report = main.write_sharded_document(db, 'dashboard/data', payload)
+
+    assert report['shards'] == 0
+    assert list(db.docs) == ['dashboard/data']
+    assert main.read_sharded_document(db, 'dashboard/data') == payload
+
+def test_rewrite_removes_the_previous_shards():
+    db = FakeFirestore()
+    with contextlib.redirect_stdout(io.StringIO()):
+        main.write_sharded_document(db, 'dashboard/data', _number_heavy_payload())
+        main.write_sharded_document(db, 'dashboard/data', {'summary': {'total': 0}})
+
+    assert list(db.docs) == ['dashboard/data']
+    assert main.read_sharded_document(db, 'dashboard/data') == {'summary': {'total': 0}}